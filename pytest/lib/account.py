@@ -1,11 +1,12 @@
 import base64
-import json
-import requests
 import random
 import time
 
+import rpc_client
+
 from transaction import (
-    sign_payment_tx, sign_deploy_contract_tx, sign_function_call_tx,
+    create_payment_action, get_signer, sign_deploy_contract_tx,
+    sign_function_call_tx,
     sign_create_account_with_full_access_key_and_balance_tx, sign_staking_tx)
 from key import Key
 from utils import load_binary_file
@@ -39,6 +40,8 @@ class Account:
         self.rpc_infos = rpc_infos
         assert key.account_id
         self.tx_timestamps = []
+        # Transfer transaction templates keyed by amount.
+        self._transfer_templates = {}
         logger.info(
             f'Creating Account {key.account_id} {init_nonce} {self.rpc_infos[0]} {key.pk} {key.sk}'
         )
@@ -49,14 +52,22 @@ class Account:
         return f'http://{rpc_addr}:{rpc_port}'
 
     def json_rpc(self, method, params):
-        j = {
-            'method': method,
-            'params': params,
-            'id': 'dontcare',
-            'jsonrpc': '2.0'
-        }
-        r = requests.post(self.get_rpc_node_address(), json=j, timeout=30)
-        return json.loads(r.content)
+        return rpc_client.shared().json_rpc(random.choice(self.rpc_infos),
+                                            method,
+                                            params,
+                                            timeout=30,
+                                            check_status=False)
+
+    def json_rpc_batch(self, calls):
+        """Issues (method, params) calls to a single random RPC node.
+
+        Returns list of responses in the order of the calls.
+        """
+        addr = random.choice(self.rpc_infos)
+        return rpc_client.shared().json_rpc_batch(addr,
+                                                  calls,
+                                                  timeout=30,
+                                                  check_status=False)
 
     def send_tx(self, signed_tx):
         return self.json_rpc('broadcast_tx_async',
@@ -71,9 +82,13 @@ class Account:
                          transfer_amount=100,
                          base_block_hash=None):
         self.prep_tx()
-        tx = sign_payment_tx(self.key, dest_account_id, transfer_amount,
-                             self.nonce, base_block_hash or
-                             self.base_block_hash)
+        template = self._transfer_templates.get(transfer_amount)
+        if template is None:
+            template = get_signer(self.key).template(
+                [create_payment_action(transfer_amount)], dest_account_id)
+            self._transfer_templates[transfer_amount] = template
+        tx = template.sign(self.nonce, base_block_hash or self.base_block_hash,
+                           dest_account_id)
         return self.send_tx(tx)
 
     def send_deploy_contract_tx(self, wasm_filename, base_block_hash=None):
@@ -0,0 +1,188 @@
+"""Local cache of blocks and chunks fetched from nodes.
+
+Blocks and chunks never change once produced so, looked up by hash, they can
+be served from a local copy instead of the node.  `BlockCache` keeps recently
+used ones in an in-memory LRU and, if given a file, all of them in an sqlite
+database indexed by hash, with block heights and previous block hashes in
+separate columns.  They are kept JSON-encoded and every lookup decodes a new
+copy so callers are free to modify what they get.
+
+`BaseNode.walk_blocks`, `get_block_by_hash` and `get_chunks`, and thus
+`utils.chain_query`, `BaseNode.get_all_heights` and
+`mocknet.chain_measure_bps_and_tps`, use the process-wide cache returned by
+`shared()`.  By default it keeps only the LRU, so that tests following the
+chain for a long time don't accumulate all of its blocks.  Setting the
+NEAR_PYTEST_BLOCK_CACHE environment variable to a file name makes it
+persistent so re-analysing an archival node's history fetches only blocks
+produced since the previous run.
+"""
+
+import collections
+import json
+import os
+import sqlite3
+import threading
+import typing
+
+# Environment variable naming the sqlite file the shared cache is kept in.
+CACHE_ENV_VAR = 'NEAR_PYTEST_BLOCK_CACHE'
+# Number of blocks and chunks kept in memory.
+DEFAULT_MEMORY_ITEMS = 10000
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS blocks (
+    hash TEXT PRIMARY KEY,
+    height INTEGER NOT NULL,
+    prev_hash TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blocks_height ON blocks (height);
+CREATE TABLE IF NOT EXISTS chunks (
+    hash TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+'''
+
+
+class BlockCache:
+    """Blocks and chunks by hash, in an LRU optionally backed by sqlite.
+
+    Args:
+        path: sqlite database file; if None only the LRU is kept.
+        memory_items: Number of blocks and chunks kept in the LRU.
+    """
+
+    def __init__(self,
+                 path: typing.Optional[str] = None,
+                 *,
+                 memory_items: int = DEFAULT_MEMORY_ITEMS) -> None:
+        self.path = path
+        self.memory_items = memory_items
+        self.hits = 0
+        self.misses = 0
+        # (table, hash) -> (block height or None for chunks, JSON data)
+        self._lru = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path,
+                                       check_same_thread=False,
+                                       isolation_level=None)
+            # Let processes sharing the file read while one of them writes.
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.executescript(_SCHEMA)
+
+    def _remember(self, key, value):
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.memory_items:
+            self._lru.popitem(last=False)
+
+    def _get(self, table, hash_):
+        key = (table, hash_)
+        with self._lock:
+            value = self._lru.get(key)
+            if value is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return json.loads(value[1])
+            row = None
+            if self._db is not None:
+                row = self._db.execute(
+                    f'SELECT data FROM {table} WHERE hash = ?',
+                    (hash_,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            result = json.loads(row[0])
+            height = result['header']['height'] if table == 'blocks' else None
+            self._remember(key, (height, row[0]))
+            return result
+
+    def get_block(self, block_hash: str) -> typing.Optional[typing.Dict]:
+        """Returns block, as returned by `block` RPC, or None if not cached."""
+        return self._get('blocks', block_hash)
+
+    def get_chunk(self, chunk_hash: str) -> typing.Optional[typing.Dict]:
+        """Returns chunk, as returned by `chunk` RPC, or None if not cached."""
+        return self._get('chunks', chunk_hash)
+
+    def has_block(self, block_hash: str) -> bool:
+        with self._lock:
+            if ('blocks', block_hash) in self._lru:
+                return True
+            return self._db is not None and self._db.execute(
+                'SELECT 1 FROM blocks WHERE hash = ?',
+                (block_hash,)).fetchone() is not None
+
+    def block_hashes_at(self, height: int) -> typing.List[str]:
+        """Returns hashes of cached blocks at given height.
+
+        There may be more than one if the chain forked.  Without a database
+        file only blocks in the LRU are considered.
+        """
+        with self._lock:
+            if self._db is None:
+                return [
+                    key[1]
+                    for key, value in self._lru.items()
+                    if key[0] == 'blocks' and value[0] == height
+                ]
+            return [
+                row[0] for row in self._db.execute(
+                    'SELECT hash FROM blocks WHERE height = ?', (height,))
+            ]
+
+    def put_blocks(self, blocks: typing.Iterable[typing.Dict]) -> None:
+        rows = []
+        with self._lock:
+            for block in blocks:
+                header = block['header']
+                data = json.dumps(block)
+                self._remember(('blocks', header['hash']),
+                               (header['height'], data))
+                rows.append((header['hash'], header['height'],
+                             header.get('prev_hash'), data))
+            if self._db is not None:
+                self._db.executemany(
+                    'INSERT OR IGNORE INTO blocks VALUES (?, ?, ?, ?)', rows)
+
+    def put_block(self, block: typing.Dict) -> None:
+        self.put_blocks((block,))
+
+    def put_chunks(self, chunks: typing.Iterable[typing.Dict]) -> None:
+        rows = []
+        with self._lock:
+            for chunk in chunks:
+                chunk_hash = chunk['header']['chunk_hash']
+                data = json.dumps(chunk)
+                self._remember(('chunks', chunk_hash), (None, data))
+                rows.append((chunk_hash, data))
+            if self._db is not None:
+                self._db.executemany(
+                    'INSERT OR IGNORE INTO chunks VALUES (?, ?)', rows)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+            self._lru.clear()
+
+
+_shared = None
+_shared_pid = None
+
+
+def shared() -> BlockCache:
+    """Returns the process-wide cache.
+
+    Forked children get a cache of their own, opened on first use, since
+    sqlite connections must not be shared across processes.
+    """
+    global _shared, _shared_pid
+    if _shared is None or _shared_pid != os.getpid():
+        _shared = BlockCache(os.environ.get(CACHE_ENV_VAR) or None)
+        _shared_pid = os.getpid()
+    return _shared
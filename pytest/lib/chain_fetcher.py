@@ -0,0 +1,274 @@
+"""Concurrent fetching of block and chunk summaries by height range.
+
+Walking the chain backwards one `prev_hash` at a time needs a round trip per
+block.  `fetch_heights` instead splits a height range into batches requested
+concurrently, with at most `concurrency` batches in flight, and reduces every
+block and its new chunks to a summary row: timestamp and per-shard gas used
+and transaction count.  Heights without a block are skipped.  Chunks are
+fetched through `BaseNode.get_chunks` so they are served from the block cache
+when possible.
+
+The summaries are collected into `ChainSummary`, which holds NumPy arrays and
+computes blocks, transactions and gas per second over the whole range or over
+sliding time windows.
+"""
+
+import concurrent.futures
+import typing
+
+import numpy as np
+
+import cluster
+import data
+from configured_logger import logger
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_CONCURRENCY = 8
+
+
+class ChainSummary:
+    """Summaries of consecutive blocks, ordered by height.
+
+    Attributes:
+        heights: int64 array of block heights.
+        timestamps: float64 array of block timestamps in seconds.
+        gas_used: float64 array of gas used per block and shard.
+        tx_count: int64 array of transactions per block and shard.
+        skipped: Number of heights in the fetched range without a block.
+    """
+
+    def __init__(self, num_shards: int) -> None:
+        self.num_shards = num_shards
+        self.skipped = 0
+        self._size = 0
+        self._heights = np.empty(0, dtype=np.int64)
+        self._timestamps = np.empty(0, dtype=np.float64)
+        self._gas_used = np.empty((0, num_shards), dtype=np.float64)
+        self._tx_count = np.empty((0, num_shards), dtype=np.int64)
+
+    def _reserve(self, size):
+        capacity = len(self._heights)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 64)
+
+        def grow(array):
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            return grown
+
+        self._heights = grow(self._heights)
+        self._timestamps = grow(self._timestamps)
+        self._gas_used = grow(self._gas_used)
+        self._tx_count = grow(self._tx_count)
+
+    def add(self, height: int, timestamp: float,
+            gas_used: typing.Sequence[float],
+            tx_count: typing.Sequence[int]) -> None:
+        """Appends summary of a block."""
+        self._reserve(self._size + 1)
+        i = self._size
+        self._heights[i] = height
+        self._timestamps[i] = timestamp
+        self._gas_used[i] = gas_used
+        self._tx_count[i] = tx_count
+        self._size += 1
+
+    def _sort(self):
+        order = np.argsort(self._heights[:self._size], kind='stable')
+        for name in ('_heights', '_timestamps', '_gas_used', '_tx_count'):
+            setattr(self, name, getattr(self, name)[:self._size][order])
+
+    @property
+    def heights(self) -> np.ndarray:
+        return self._heights[:self._size]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps[:self._size]
+
+    @property
+    def gas_used(self) -> np.ndarray:
+        return self._gas_used[:self._size]
+
+    @property
+    def tx_count(self) -> np.ndarray:
+        return self._tx_count[:self._size]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def time_range(self, start_time: float, end_time: float) -> 'ChainSummary':
+        """Returns summary of blocks with start_time < timestamp < end_time."""
+        mask = (self.timestamps > start_time) & (self.timestamps < end_time)
+        result = ChainSummary(self.num_shards)
+        result._size = int(mask.sum())
+        result._heights = self.heights[mask]
+        result._timestamps = self.timestamps[mask]
+        result._gas_used = self.gas_used[mask]
+        result._tx_count = self.tx_count[mask]
+        return result
+
+    def rates(self) -> typing.Dict[str, float]:
+        """Returns blocks, transactions and gas per second over all blocks.
+
+        Rates are slopes of linear fits of cumulative counts over time, as
+        computed by `data.compute_rate`.
+        """
+        assert len(self) >= 2, 'need at least two blocks'
+        timestamps = self.timestamps
+        return {
+            'bps':
+                data.compute_rate(timestamps),
+            'tps':
+                data.linear_regression(timestamps,
+                                       np.cumsum(self.tx_count.sum(axis=1)))
+                ['slope'],
+            'gas_per_second':
+                data.linear_regression(timestamps,
+                                       np.cumsum(self.gas_used.sum(axis=1)))
+                ['slope'],
+        }
+
+    def sliding_rates(self, window: float) -> np.ndarray:
+        """Returns rates over a window of `window` seconds ending at each block.
+
+        The window of a block starts at the earliest block produced at most
+        `window` seconds before it.  Returns a structured array with fields
+        `height`, `timestamp`, `bps`, `tps` and `gas_per_second`; rates are
+        NaN for blocks whose window holds no other block.
+        """
+        timestamps = self.timestamps
+        start = np.searchsorted(timestamps, timestamps - window, side='left')
+        elapsed = timestamps - timestamps[start]
+        txs = np.cumsum(self.tx_count.sum(axis=1))
+        gas = np.cumsum(self.gas_used.sum(axis=1))
+        result = np.zeros(len(self),
+                          dtype=[('height', np.int64),
+                                 ('timestamp', np.float64), ('bps', np.float64),
+                                 ('tps', np.float64),
+                                 ('gas_per_second', np.float64)])
+        result['height'] = self.heights
+        result['timestamp'] = timestamps
+        # Counts of blocks, transactions and gas after the window's first
+        # block, whose own contents were produced before the window started.
+        counts = {
+            'bps': np.arange(len(self)) - start,
+            'tps': txs - txs[start],
+            'gas_per_second': gas - gas[start],
+        }
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for field, count in counts.items():
+                result[field] = np.where(elapsed > 0, count / elapsed, np.nan)
+        return result
+
+
+def summarise_block(block, chunks) -> typing.Tuple[list, list]:
+    """Returns per-shard gas used and transaction counts of a block.
+
+    Only chunks produced at the block's height are counted; `chunks` maps
+    their hashes to `chunk` RPC results.
+    """
+    height = block['header']['height']
+    gas_used = [0] * len(block['chunks'])
+    tx_count = [0] * len(block['chunks'])
+    for shard, chunk in enumerate(block['chunks']):
+        if chunk['height_included'] != height:
+            continue
+        gas_used[shard] = chunk['gas_used']
+        tx_count[shard] = len(chunks[chunk['chunk_hash']]['transactions'])
+    return gas_used, tx_count
+
+
+def _fetch_batch(node, heights):
+    blocks = node.get_blocks(heights)
+    chunk_hashes = [
+        chunk['chunk_hash']
+        for block in blocks
+        for chunk in block['chunks']
+        if chunk['height_included'] == block['header']['height']
+    ]
+    chunks = {}
+    for chunk_hash, response in zip(chunk_hashes,
+                                    node.get_chunks(chunk_hashes)):
+        assert 'result' in response, response
+        chunks[chunk_hash] = response['result']
+    return blocks, chunks
+
+
+def fetch_heights(
+        node: cluster.BaseNode,
+        start_height: int,
+        end_height: int,
+        *,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        summary: typing.Optional[ChainSummary] = None) -> ChainSummary:
+    """Fetches summaries of blocks at heights start_height to end_height.
+
+    Batches of `batch_size` heights are requested with at most `concurrency`
+    in flight.  Blocks are summarised as batches arrive.  If `summary` is
+    given, blocks are added to it.  Returns the summary sorted by height.
+    """
+    batches = [
+        range(h, min(h + batch_size, end_height + 1))
+        for h in range(start_height, end_height + 1, batch_size)
+    ]
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        futures = [
+            executor.submit(_fetch_batch, node, heights) for heights in batches
+        ]
+        for heights, future in zip(batches, futures):
+            blocks, chunks = future.result()
+            if summary is None and blocks:
+                summary = ChainSummary(len(blocks[0]['chunks']))
+            for block in blocks:
+                gas_used, tx_count = summarise_block(block, chunks)
+                summary.add(block['header']['height'],
+                            block['header']['timestamp'] / 1e9, gas_used,
+                            tx_count)
+            if summary is not None:
+                summary.skipped += len(heights) - len(blocks)
+    assert summary is not None, 'no blocks in the range'
+    summary._sort()
+    return summary
+
+
+def fetch_time_range(node: cluster.BaseNode,
+                     start_time: typing.Optional[float],
+                     end_time: typing.Optional[float],
+                     *,
+                     duration: typing.Optional[float] = None,
+                     concurrency: int = DEFAULT_CONCURRENCY,
+                     batch_size: int = DEFAULT_BATCH_SIZE) -> ChainSummary:
+    """Fetches summaries of blocks produced between start and end time.
+
+    `end_time` defaults to the latest block's timestamp and `start_time` to
+    `duration` seconds before it.  Height ranges of `concurrency` batches are
+    fetched backwards from the latest block until one reaches a block older
+    than `start_time`.  Returns summary of blocks with
+    start_time < timestamp < end_time.
+    """
+    latest = node.get_latest_block()
+    if end_time is None:
+        end_time = node.get_block(
+            latest.hash)['result']['header']['timestamp'] / 1e9
+    if start_time is None:
+        start_time = end_time - duration
+    step = concurrency * batch_size
+    summary = None
+    end_height = latest.height
+    while end_height >= 0:
+        start_height = max(0, end_height - step + 1)
+        summary = fetch_heights(node,
+                                start_height,
+                                end_height,
+                                concurrency=concurrency,
+                                batch_size=batch_size,
+                                summary=summary)
+        logger.info(f'Fetched blocks at heights {start_height} to '
+                    f'{end_height}')
+        if summary.timestamps[0] <= start_time:
+            break
+        end_height = start_height - 1
+    return summary.time_range(start_time, end_time)
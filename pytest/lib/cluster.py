@@ -6,7 +6,6 @@ import multiprocessing
 import os
 import pathlib
 import rc
-import requests
 import shutil
 import signal
 import subprocess
@@ -20,8 +19,12 @@ from rc import gcloud
 from retrying import retry
 
 import base58
+import requests
 
+import block_cache
+import cluster_template
 import network
+import rpc_client
 from configured_logger import logger
 from key import Key
 from proxy import NodesProxy
@@ -140,6 +143,9 @@ class BlockId(typing.NamedTuple):
 
 
 class BaseNode(object):
+    # BlockCache used by this node's chain walking methods; the process-wide
+    # `block_cache.shared()` one if None.
+    block_cache = None
 
     def __init__(self):
         self._start_proxy = None
@@ -205,17 +211,20 @@ class BaseNode(object):
         nretry(lambda: self.get_status(), timeout=timeout)
 
     def json_rpc(self, method, params, timeout=2):
-        j = {
-            'method': method,
-            'params': params,
-            'id': 'dontcare',
-            'jsonrpc': '2.0'
-        }
-        r = requests.post("http://%s:%s" % self.rpc_addr(),
-                          json=j,
-                          timeout=timeout)
-        r.raise_for_status()
-        return json.loads(r.content)
+        return rpc_client.shared().json_rpc(self.rpc_addr(),
+                                            method,
+                                            params,
+                                            timeout=timeout)
+
+    def json_rpc_batch(self, calls, timeout=2):
+        """Issues (method, params) calls in as few round trips as possible.
+
+        Returns list of responses in the order of the calls.  See
+        `rpc_client.AsyncRpcClient.json_rpc_batch`.
+        """
+        return rpc_client.shared().json_rpc_batch(self.rpc_addr(),
+                                                  calls,
+                                                  timeout=timeout)
 
     def send_tx(self, signed_tx):
         return self.json_rpc('broadcast_tx_async',
@@ -230,10 +239,8 @@ class BaseNode(object):
                    check_storage: bool = True,
                    timeout: float = 4,
                    verbose: bool = False):
-        r = requests.get("http://%s:%s/status" % self.rpc_addr(),
-                         timeout=timeout)
-        r.raise_for_status()
-        status = json.loads(r.content)
+        status = rpc_client.shared().get_status(self.rpc_addr(),
+                                                timeout=timeout)
         if verbose:
             logger.info(f'Status: {status}')
         if check_storage and status['sync_info']['syncing'] == False:
@@ -248,25 +255,57 @@ class BaseNode(object):
         return BlockId(height=sync_info['latest_block_height'],
                        hash=sync_info['latest_block_hash'])
 
-    def get_all_heights(self):
-        hash_ = self.get_latest_block().hash
-        heights = []
+    def _block_cache(self):
+        return self.block_cache or block_cache.shared()
+
+    def walk_blocks(self, block_hash=None, *, batch_size=50):
+        """Yields blocks from given one back to genesis following prev_hash.
 
+        Blocks are served from the block cache if they are there.  Blocks
+        below the last yielded one are otherwise fetched by height in batches
+        of `batch_size`, so walking n blocks takes about n / batch_size round
+        trips.  If the previous block isn't among them, e.g. because the walk
+        is on a fork, it's fetched by hash.  The walk ends after the genesis
+        block or when a block is not found, e.g. because it has been garbage
+        collected.
+
+        Args:
+            block_hash: Hash of the first block to yield; latest block if
+                None.
+            batch_size: Number of blocks requested in a single round trip.
+        """
+        cache = self._block_cache()
+        block_hash = block_hash or self.get_latest_block().hash
+        prefetched = {}
         while True:
-            block = self.get_block(hash_)
-            if 'error' in block and 'data' in block[
-                    'error'] and 'DB Not Found Error: BLOCK:' in block['error'][
-                        'data']:
-                break
-            elif 'result' not in block:
-                logger.info(block)
-
-            height = block['result']['header']['height']
+            block = prefetched.pop(block_hash, None)
+            if block is None:
+                response = self.get_block_by_hash(block_hash)
+                if 'error' in response and 'DB Not Found Error: BLOCK' in str(
+                        response['error'].get('data')):
+                    return
+                elif 'result' not in response:
+                    logger.info(response)
+                block = response['result']
+            yield block
+
+            height = block['header']['height']
             if height == 0:
-                break
-            heights.append(height)
-            hash_ = block['result']['header']['prev_hash']
+                return
+            block_hash = block['header']['prev_hash']
+            if block_hash not in prefetched and not cache.has_block(block_hash):
+                heights = range(height - 1, max(height - batch_size, 0) - 1, -1)
+                blocks = self.get_blocks(heights)
+                prefetched = {
+                    block['header']['hash']: block for block in blocks
+                }
 
+    def get_all_heights(self):
+        heights = [
+            block['header']['height']
+            for block in self.walk_blocks()
+            if block['header']['height'] != 0
+        ]
         return reversed(heights)
 
     def get_validators(self, epoch_id=None):
@@ -320,9 +359,59 @@ class BaseNode(object):
     def get_block(self, block_id):
         return self.json_rpc('block', [block_id])
 
+    def get_blocks(self, heights):
+        """Returns blocks at given heights, fetched in a single round trip.
+
+        Heights without a block, e.g. skipped or garbage collected ones, are
+        left out.  The blocks are stored in the block cache.
+        """
+        blocks = [
+            response['result'] for response in self.json_rpc_batch([(
+                'block', [h]) for h in heights]) if 'result' in response
+        ]
+        self._block_cache().put_blocks(blocks)
+        return blocks
+
+    def get_block_by_hash(self, block_hash):
+        """Same as get_block but serves the block from the block cache."""
+        cache = self._block_cache()
+        block = cache.get_block(block_hash)
+        if block is not None:
+            return {'result': block}
+        response = self.get_block(block_hash)
+        if 'result' in response:
+            cache.put_block(response['result'])
+        return response
+
     def get_chunk(self, chunk_id):
         return self.json_rpc('chunk', [chunk_id])
 
+    def get_chunks(self, chunk_hashes):
+        """Returns responses of `chunk` calls for chunks with given hashes.
+
+        Chunks in the block cache are served locally, the rest is fetched in
+        a single batch.
+        """
+        cache = self._block_cache()
+        responses = {}
+        for chunk_hash in chunk_hashes:
+            chunk = cache.get_chunk(chunk_hash)
+            if chunk is not None:
+                responses[chunk_hash] = {'result': chunk}
+        missing = [
+            chunk_hash for chunk_hash in dict.fromkeys(chunk_hashes)
+            if chunk_hash not in responses
+        ]
+        if missing:
+            fetched = self.json_rpc_batch([
+                ('chunk', [chunk_hash]) for chunk_hash in missing
+            ])
+            responses.update(zip(missing, fetched))
+            cache.put_chunks(response['result']
+                             for response in fetched
+                             if 'result' in response)
+        return [responses[chunk_hash] for chunk_hash in chunk_hashes]
+
     def get_tx(self, tx_hash, tx_recipient_id):
         return self.json_rpc('tx', [tx_hash, tx_recipient_id])
 
@@ -627,12 +716,13 @@ chmod +x neard
     def json_rpc(self, method, params, timeout=15):
         return super().json_rpc(method, params, timeout=timeout)
 
+    def json_rpc_batch(self, calls, timeout=15):
+        return super().json_rpc_batch(calls, timeout=timeout)
+
     def get_status(self):
-        r = nretry(lambda: requests.get("http://%s:%s/status" % self.rpc_addr(),
-                                        timeout=15),
-                   timeout=45)
-        r.raise_for_status()
-        return json.loads(r.content)
+        return nretry(
+            lambda: rpc_client.shared().get_status(self.rpc_addr(), timeout=15),
+            timeout=45)
 
     def stop_network(self):
         rc.run(
@@ -651,6 +741,10 @@ chmod +x neard
                             f'/home/{self.machine.username}/.near/')
 
 
+# How long spin_up_node waits for a started node to answer RPC queries.
+NODE_READY_TIMEOUT = 3
+
+
 def spin_up_node(config,
                  near_root,
                  node_dir,
@@ -694,9 +788,17 @@ def spin_up_node(config,
     if proxy is not None:
         proxy.proxify_node(node)
 
+    started = time.monotonic()
     node.start(boot_node=boot_node, skip_starting_proxy=skip_starting_proxy)
-    time.sleep(3)
-    logger.info(f"node {ordinal} started")
+    # Rather than sleeping for a fixed time, wait at most as long for the
+    # node to answer RPC queries; by then its network is listening too.
+    try:
+        node.wait_for_rpc(timeout=NODE_READY_TIMEOUT)
+    except requests.exceptions.RequestException:
+        logger.warning(f"node {ordinal} not ready after "
+                       f"{NODE_READY_TIMEOUT} seconds")
+    logger.info(f"node {ordinal} started in "
+                f"{time.monotonic() - started:.1f} seconds")
     return node
 
 
@@ -704,6 +806,9 @@ def init_cluster(num_nodes, num_observers, num_shards, config,
                  genesis_config_changes, client_config_changes):
     """
     Create cluster configuration
+
+    Unless `cluster_templates` is false in the config, node home directories
+    are cloned from a cached template; see cluster_template module.
     """
     if 'local' not in config and 'nodes' in config:
         logger.critical(
@@ -717,8 +822,30 @@ def init_cluster(num_nodes, num_observers, num_shards, config,
     logger.info("Creating %s cluster configuration with %s nodes" %
                 ("LOCAL" if is_local else "REMOTE", num_nodes + num_observers))
 
+    binary = os.path.join(near_root, binary_name)
+    if config.get('cluster_templates', True):
+        node_dirs = _clone_cluster_template(binary, num_nodes, num_observers,
+                                            num_shards, genesis_config_changes)
+    else:
+        node_dirs = _run_localnet(binary, num_nodes, num_observers, num_shards)
+        for node_dir in node_dirs:
+            apply_genesis_changes(node_dir, genesis_config_changes)
+
+    logger.info("Search for stdout and stderr in %s" % node_dirs)
+    # apply config changes
+    for i, node_dir in enumerate(node_dirs):
+        overrides = client_config_changes.get(i)
+        if overrides:
+            apply_config_changes(node_dir, overrides)
+
+    return near_root, node_dirs
+
+
+def _run_localnet(binary, num_nodes, num_observers, num_shards, home=None):
+    """Runs `neard localnet`; returns paths to created node directories."""
+    home_args = () if home is None else ("--home", str(home))
     process = subprocess.Popen([
-        os.path.join(near_root, binary_name), "localnet", "--v",
+        binary, *home_args, "localnet", "--v",
         str(num_nodes), "--shards",
         str(num_shards), "--n",
         str(num_observers), "--prefix", "test"
@@ -737,16 +864,35 @@ def init_cluster(num_nodes, num_observers, num_shards, config,
         node_dirs
     ) == num_nodes + num_observers, "node dirs: %s num_nodes: %s num_observers: %s" % (
         len(node_dirs), num_nodes, num_observers)
-
-    logger.info("Search for stdout and stderr in %s" % node_dirs)
-    # apply config changes
-    for i, node_dir in enumerate(node_dirs):
-        apply_genesis_changes(node_dir, genesis_config_changes)
-        overrides = client_config_changes.get(i)
-        if overrides:
-            apply_config_changes(node_dir, overrides)
-
-    return near_root, node_dirs
+    return node_dirs
+
+
+def _clone_cluster_template(binary, num_nodes, num_observers, num_shards,
+                            genesis_config_changes):
+    """Creates node directories in ~/.near from a cached cluster template."""
+
+    def generate(home):
+        _run_localnet(binary, num_nodes, num_observers, num_shards, home)
+        names = [f'test{i}' for i in range(num_nodes + num_observers)]
+        for name in names:
+            apply_genesis_changes(home / name, genesis_config_changes)
+        return names
+
+    key = cluster_template.template_key(binary, num_nodes, num_observers,
+                                        num_shards, genesis_config_changes)
+    started = time.monotonic()
+    template, generated = cluster_template.get_or_create(
+        key, generate, cluster_template.binary_fingerprint(binary))
+    node_dirs = cluster_template.clone(template, pathlib.Path.home() / '.near')
+    elapsed = time.monotonic() - started
+    if generated:
+        logger.info(f"Generated cluster template {key} in "
+                    f"{template.generation_seconds:.2f} seconds")
+    else:
+        logger.info(f"Cloned cluster template {key} in {elapsed:.2f} seconds, "
+                    f"saving {template.generation_seconds - elapsed:.2f} "
+                    f"seconds of generating it")
+    return node_dirs
 
 
 def apply_genesis_changes(node_dir, genesis_config_changes):
@@ -760,8 +906,11 @@ def apply_genesis_changes(node_dir, genesis_config_changes):
             cur = cur[s]
         assert change[-2] in cur
         cur[change[-2]] = change[-1]
-    with open(fname, 'w') as fd:
+    # Replace the file rather than write into it so that a half-written
+    # genesis.json is never left behind.
+    with open(fname + '.tmp', 'w') as fd:
         json.dump(genesis_config, fd, indent=2)
+    os.replace(fname + '.tmp', fname)
 
 
 def apply_config_changes(node_dir, client_config_change):
@@ -811,7 +960,10 @@ def start_cluster(num_nodes,
                                             genesis_config_changes,
                                             client_config_changes)
 
-    proxy = NodesProxy(message_handler) if message_handler is not None else None
+    if message_handler is None or isinstance(message_handler, NodesProxy):
+        proxy = message_handler
+    else:
+        proxy = NodesProxy(message_handler)
     ret = []
 
     def spin_up_node_and_push(i, boot_node: BootNode):
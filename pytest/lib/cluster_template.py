@@ -0,0 +1,225 @@
+"""Cache of generated localnet home directories used to start test clusters.
+
+Most tests start clusters of a handful of identical shapes, yet each of them
+used to run `neard localnet` and then rewrite genesis.json of every node.
+`get_or_create` does that once per cluster shape, genesis changes and binary
+and keeps the resulting home directories as a template; `clone` then creates
+node directories for a test from a template.
+
+genesis.json, which is the only file which can be large, is reflinked into
+clones where the file system supports that.  Tests write into files of node
+directories in place (e.g. `populate.copy_genesis`) so files are never hard
+linked: where reflinks aren't supported they are copied like all other files.
+
+Templates are stored in the directory named by NEAR_PYTEST_CLUSTER_TEMPLATES
+environment variable or in `near/cluster-templates` in the system temporary
+directory.  Removing the directory simply causes templates to be generated
+again.  Whenever a template is generated, templates of binaries which have
+since been rebuilt or removed are deleted and only `MAX_TEMPLATES` most
+recently used ones are kept.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+import time
+import typing
+
+from configured_logger import logger
+
+# Environment variable naming the directory templates are kept in.
+TEMPLATES_ENV_VAR = 'NEAR_PYTEST_CLUSTER_TEMPLATES'
+# Files reflinked into clones of a template, if possible, rather than copied.
+REFLINKED_FILES = ('genesis.json',)
+# Number of templates kept when a new one is generated.
+MAX_TEMPLATES = 16
+# ioctl cloning a file on Linux file systems with reflink support.
+_FICLONE = 0x40049409
+_METADATA = 'template.json'
+
+
+class Template(typing.NamedTuple):
+    path: pathlib.Path
+    # Names of node home directories within the template, in node order.
+    node_names: typing.List[str]
+    # How long generating the template took.
+    generation_seconds: float
+
+
+def templates_dir() -> pathlib.Path:
+    path = os.environ.get(TEMPLATES_ENV_VAR)
+    if path:
+        return pathlib.Path(path)
+    return pathlib.Path(tempfile.gettempdir()) / 'near' / 'cluster-templates'
+
+
+def binary_fingerprint(binary: str) -> typing.List[typing.Any]:
+    """Returns what identifies a build of a binary.
+
+    Hashing a debug neard would take longer than generating a template so
+    the binary is identified by its path, size and modification time.
+    """
+    stat = os.stat(binary)
+    return [os.path.realpath(binary), stat.st_size, stat.st_mtime_ns]
+
+
+def template_key(binary: str, num_nodes: int, num_observers: int,
+                 num_shards: int,
+                 genesis_config_changes: typing.Sequence[typing.Any]) -> str:
+    """Returns name of the template for given cluster and binary."""
+    params = [
+        binary_fingerprint(binary), num_nodes, num_observers, num_shards,
+        genesis_config_changes
+    ]
+    data = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:32]
+
+
+def get_or_create(
+    key: str,
+    generate: typing.Callable[[pathlib.Path], typing.List[str]],
+    fingerprint: typing.Optional[typing.List[typing.Any]] = None
+) -> typing.Tuple[Template, bool]:
+    """Returns template with given key, generating it if necessary.
+
+    `generate` is called with an empty directory to populate with node home
+    directories and returns their names in node order.  Concurrent processes
+    may generate the same template; the first to finish wins.  `fingerprint`
+    is the `binary_fingerprint` of the binary generating the template.
+
+    Returns the template and whether it has been generated by this call.
+    """
+    path = templates_dir() / key
+    template = _load(path)
+    if template is not None:
+        try:
+            # Modification time of the metadata is when it was last used.
+            os.utime(path / _METADATA)
+        except OSError:
+            pass
+        return template, False
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    staging = pathlib.Path(tempfile.mkdtemp(prefix=key + '.', dir=path.parent))
+    try:
+        started = time.monotonic()
+        node_names = generate(staging)
+        elapsed = time.monotonic() - started
+        (staging / _METADATA).write_text(
+            json.dumps({
+                'node_names': node_names,
+                'generation_seconds': elapsed,
+                'binary': fingerprint,
+            }))
+        try:
+            staging.rename(path)
+        except OSError:
+            # Another process has created the template in the meantime.
+            template = _load(path)
+            if template is None:
+                raise
+            return template, False
+    finally:
+        if staging.exists():
+            shutil.rmtree(staging)
+    evict(path, fingerprint)
+    return Template(path, node_names, elapsed), True
+
+
+def evict(current: pathlib.Path,
+          fingerprint: typing.Optional[typing.List[typing.Any]],
+          keep: typing.Optional[int] = None) -> None:
+    """Removes outdated and least recently used templates.
+
+    Templates of binaries which no longer exist or, judging by
+    `fingerprint`, have been rebuilt are removed, as are all but the `keep`,
+    `MAX_TEMPLATES` by default, most recently used ones.  The `current`
+    template is kept and counts towards `keep`.
+    """
+    keep = MAX_TEMPLATES if keep is None else keep
+    used = []
+    for path in current.parent.iterdir():
+        # Names of templates being generated or removed contain a dot.
+        if path == current or '.' in path.name:
+            continue
+        metadata_path = path / _METADATA
+        try:
+            binary = json.loads(metadata_path.read_text()).get('binary')
+            last_used = metadata_path.stat().st_mtime
+        except (OSError, ValueError):
+            continue
+        if (not binary or not os.path.exists(binary[0]) or
+            (fingerprint and binary[0] == fingerprint[0] and
+             binary != fingerprint)):
+            _remove(path)
+        else:
+            used.append((last_used, path))
+    used.sort(reverse=True)
+    for _, path in used[max(keep - 1, 0):]:
+        _remove(path)
+
+
+def _remove(path: pathlib.Path) -> None:
+    # Rename the template first so that no process loads it half-removed.
+    removed = path.with_name(f'{path.name}.removed.{os.getpid()}')
+    try:
+        path.rename(removed)
+    except OSError:
+        # Another process is removing it.
+        return
+    shutil.rmtree(removed, ignore_errors=True)
+    logger.debug(f'Removed cluster template {path}')
+
+
+def _load(path: pathlib.Path) -> typing.Optional[Template]:
+    try:
+        metadata = json.loads((path / _METADATA).read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    return Template(path, metadata['node_names'],
+                    metadata['generation_seconds'])
+
+
+def clone(template: Template, target: pathlib.Path) -> typing.List[str]:
+    """Creates node home directories from a template in target directory.
+
+    Existing node directories of the same names, including their data, are
+    removed first.  Returns paths to node home directories in node order.
+    """
+    node_dirs = []
+    for name in template.node_names:
+        src = template.path / name
+        dst = target / name
+        if dst.exists():
+            shutil.rmtree(dst)
+        dst.mkdir(parents=True)
+        for entry in src.iterdir():
+            if entry.is_dir():
+                shutil.copytree(entry, dst / entry.name)
+            elif entry.name in REFLINKED_FILES:
+                _reflink_file(entry, dst / entry.name)
+            else:
+                shutil.copy2(entry, dst / entry.name)
+        node_dirs.append(str(dst))
+    logger.debug(f'Cloned cluster template {template.path} into {target}')
+    return node_dirs
+
+
+def _reflink_file(src: pathlib.Path, dst: pathlib.Path) -> None:
+    """Reflinks src to dst falling back to a copy.
+
+    A reflinked file shares data with its source only until either is
+    written so, unlike with a hard link, writes to dst never change src.
+    """
+    try:
+        import fcntl
+        with open(src, 'rb') as rd, open(dst, 'wb') as wr:
+            fcntl.ioctl(wr.fileno(), _FICLONE, rd.fileno())
+        shutil.copymode(src, dst)
+        return
+    except (ImportError, OSError):
+        dst.unlink(missing_ok=True)
+    shutil.copy2(src, dst)
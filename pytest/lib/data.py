@@ -1,5 +1,6 @@
+import collections
+
 import numpy as np
-from sklearn.linear_model import LinearRegression
 
 
 def flatten(ll):
@@ -16,26 +17,185 @@ def compute_cumulative(xs):
     E.g. given [1, 2, 3, 4] the return value will be
     [1, 3, 6, 10].
     '''
-    total = xs[0]
-    result = [total]
-    for x in xs[1:]:
-        total += x
-        result.append(total)
-    return result
+    return np.cumsum(xs).tolist()
+
+
+class LinearFit:
+    '''
+    Least-squares fit of a line `y = mx + b` updated as
+    points arrive.
+
+    Keeps the number of points, their means and centred
+    second moments, updated with Welford's algorithm for
+    single points and Chan's parallel algorithm for
+    batches, so the fit is numerically stable and takes
+    constant memory however many points are added.
+    '''
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.n = 0
+        self._mean_x = 0.0
+        self._mean_y = 0.0
+        self._m2_x = 0.0
+        self._m2_y = 0.0
+        self._c_xy = 0.0
+
+    def _merge(self, n, mean_x, mean_y, m2_x, m2_y, c_xy):
+        total = self.n + n
+        dx = mean_x - self._mean_x
+        dy = mean_y - self._mean_y
+        weight = self.n * n / total
+        self._mean_x += dx * n / total
+        self._mean_y += dy * n / total
+        self._m2_x += m2_x + dx * dx * weight
+        self._m2_y += m2_y + dy * dy * weight
+        self._c_xy += c_xy + dx * dy * weight
+        self.n = total
+
+    def add(self, x, y):
+        '''
+        Adds a single point.
+        '''
+        self._merge(1, float(x), float(y), 0.0, 0.0, 0.0)
+
+    def add_many(self, xs, ys):
+        '''
+        Adds a batch of points given as two sequences
+        or NumPy arrays.
+        '''
+        x = np.asarray(xs, dtype=np.float64)
+        y = np.asarray(ys, dtype=np.float64)
+        assert x.shape == y.shape, (x.shape, y.shape)
+        if not len(x):
+            return
+        mean_x = x.mean()
+        mean_y = y.mean()
+        dx = x - mean_x
+        dy = y - mean_y
+        self._merge(len(x), mean_x, mean_y, float(dx @ dx), float(dy @ dy),
+                    float(dx @ dy))
+
+    def remove(self, x, y):
+        '''
+        Removes a previously added point.
+        '''
+        assert self.n > 0
+        if self.n == 1:
+            self._reset()
+            return
+        x, y = float(x), float(y)
+        rest = self.n - 1
+        mean_x = self._mean_x - (x - self._mean_x) / rest
+        mean_y = self._mean_y - (y - self._mean_y) / rest
+        dx = x - mean_x
+        dy = y - mean_y
+        weight = rest / self.n
+        self._m2_x = max(0.0, self._m2_x - dx * dx * weight)
+        self._m2_y = max(0.0, self._m2_y - dy * dy * weight)
+        self._c_xy -= dx * dy * weight
+        self._mean_x = mean_x
+        self._mean_y = mean_y
+        self.n = rest
+
+    def result(self):
+        '''
+        Returns the `slope`, `intercept` and coefficient of
+        determination `R^2` of the fit.
+
+        Like scikit-learn's LinearRegression, the slope is
+        zero if all points have the same x and `R^2` is one
+        if the line fits the points exactly.
+        '''
+        slope = self._c_xy / self._m2_x if self._m2_x > 0 else 0.0
+        residual = self._m2_y - slope * self._c_xy
+        if self._m2_y > 0:
+            r2 = 1.0 - residual / self._m2_y
+        else:
+            r2 = 1.0
+        return {
+            'slope': slope,
+            'intercept': self._mean_y - slope * self._mean_x,
+            'R^2': r2,
+        }
+
+
+class WindowedLinearFit:
+    '''
+    Least-squares fit of a line to points whose x lies
+    within `window` of the largest x added so far.
+
+    Points must be added in non-decreasing order of x,
+    e.g. block timestamps.  Points falling out of the
+    window are removed from a `LinearFit` of the
+    retained points.  To bound rounding errors
+    accumulated by removals, the fit is recomputed from
+    the retained points once more points have been
+    removed than are retained.
+    '''
+
+    def __init__(self, window):
+        self.window = window
+        self._fit = LinearFit()
+        self._points = collections.deque()
+        self._removed = 0
+
+    @property
+    def n(self):
+        return self._fit.n
+
+    def _evict(self):
+        start = self._points[-1][0] - self.window
+        while self._points[0][0] < start:
+            self._fit.remove(*self._points.popleft())
+            self._removed += 1
+        if self._removed > len(self._points):
+            self._fit = LinearFit()
+            xs, ys = zip(*self._points)
+            self._fit.add_many(xs, ys)
+            self._removed = 0
+
+    def add(self, x, y):
+        '''
+        Adds a single point.
+        '''
+        assert not self._points or x >= self._points[-1][0], x
+        self._points.append((x, y))
+        self._fit.add(x, y)
+        self._evict()
+
+    def add_many(self, xs, ys):
+        '''
+        Adds a batch of points in non-decreasing order of x.
+        '''
+        points = list(zip(xs, ys))
+        if not points:
+            return
+        order = [x for x, _ in points]
+        if self._points:
+            order.insert(0, self._points[-1][0])
+        assert all(a <= b for a, b in zip(order, order[1:])), order
+        self._points.extend(points)
+        self._fit.add_many(xs, ys)
+        self._evict()
+
+    def result(self):
+        '''
+        Returns the fit of the points within the window,
+        like `LinearFit.result`.
+        '''
+        return self._fit.result()
 
 
 def linear_regression(xs, ys):
     '''
     Fits a line `y = mx + b` to the given data points
     '''
-    x = np.array(xs).reshape((-1, 1))
-    y = np.array(ys)
-    model = LinearRegression().fit(x, y)
-    return {
-        'slope': model.coef_[0],
-        'intercept': model.intercept_,
-        'R^2': model.score(x, y),
-    }
+    fit = LinearFit()
+    fit.add_many(xs, ys)
+    return fit.result()
 
 
 def compute_rate(timestamps):
@@ -46,6 +206,6 @@ def compute_rate(timestamps):
     timestamps are seconds, then the output units will
     be `events/s`.
     '''
-    cumulative_events = [i for i in range(1, len(timestamps) + 1)]
+    cumulative_events = np.arange(1, len(timestamps) + 1)
     fit = linear_regression(timestamps, cumulative_events)
     return fit['slope']
@@ -0,0 +1,69 @@
+"""Fake nodes which send every message back, for tests of the proxy.
+
+Nodes listen on ports picked by the OS rather than on ports of real test
+nodes, so tests using them can run alongside clusters and each other.  Since
+`NodesProxy` derives node ordinals from ports and listens on the port 100
+larger than the node's, a port is only used if its ordinal is distinct from
+those of the other nodes and the port 100 larger is free.
+"""
+
+import asyncio
+import socket
+import struct
+import threading
+import typing
+
+import proxy
+
+
+class EchoNode:
+    """Stands in for a node as far as `NodesProxy.proxify_node` goes."""
+
+    def __init__(self, port: int) -> None:
+        self.port = port
+        self.ordinal = proxy.port_holder_to_node_ord([port])
+
+
+async def _echo(reader, writer):
+    try:
+        while True:
+            header = await reader.readexactly(4)
+            length = struct.unpack('I', header)[0]
+            writer.write(header + await reader.readexactly(length))
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        writer.close()
+
+
+def _is_free(port: int) -> bool:
+    if port > 65535:
+        return False
+    with socket.socket() as sock:
+        try:
+            sock.bind(('127.0.0.1', port))
+        except OSError:
+            return False
+    return True
+
+
+async def _start_servers(count):
+    nodes = []
+    ordinals = set()
+    while len(nodes) < count:
+        server = await asyncio.start_server(_echo, '127.0.0.1', 0)
+        node = EchoNode(server.sockets[0].getsockname()[1])
+        if node.ordinal in ordinals or not _is_free(node.port + 100):
+            server.close()
+            await server.wait_closed()
+            continue
+        ordinals.add(node.ordinal)
+        nodes.append(node)
+    return nodes
+
+
+def start(count: int) -> typing.List[EchoNode]:
+    """Starts `count` nodes served by a background event loop thread."""
+    assert count <= 100, 'ordinals of more nodes would not be distinct'
+    loop = asyncio.new_event_loop()
+    nodes = loop.run_until_complete(_start_servers(count))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return nodes
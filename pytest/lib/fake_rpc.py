@@ -0,0 +1,131 @@
+"""Fake JSON-RPC servers for tests which don't start real nodes.
+
+`start` runs an HTTP server on a free localhost port in a background thread.
+Its handler derives from `Handler`, which answers POSTed JSON-RPC requests,
+batched or not, with what its `call` method returns, or from `ChainHandler`,
+which additionally serves blocks, chunks and /status of a chain.  Handlers
+keep their state, e.g. the chain, as attributes of `self.server`.
+"""
+
+import http.server
+import json
+import threading
+import typing
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Answers JSON-RPC requests with the response returned by `call`.
+
+    Subclasses define `call(method, params)` returning the response without
+    its id, and `do_GET` if they serve GET requests.  POST requests are
+    counted in `server.requests` and JSON-RPC calls in `server.calls`.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send(self,
+             body: bytes,
+             status: int = 200,
+             content_type: str = 'application/json') -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def respond(self, body: typing.Any, status: int = 200) -> None:
+        self.send(json.dumps(body).encode(), status)
+
+    def read_request(self) -> typing.Any:
+        return json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+
+    def answer(self, request: dict) -> dict:
+        response = self.call(request['method'], request['params'])
+        response['id'] = request['id']
+        return response
+
+    def do_POST(self):
+        request = self.read_request()
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.calls += len(request) if isinstance(request,
+                                                            list) else 1
+        if isinstance(request, list):
+            self.respond([self.answer(r) for r in request])
+        else:
+            self.respond(self.answer(request))
+
+
+class ChainHandler(Handler):
+    """Serves `block` and `chunk` calls and /status of a chain.
+
+    Blocks are looked up in `server.chain` by height and by hash and chunks
+    in `server.chunks` by hash; subclasses may override `block` and `chunk`
+    instead.  /status reports the block at height `server.latest` as the
+    latest one.
+    """
+
+    def block(self, block_id: typing.Union[int, str]) -> typing.Optional[dict]:
+        return self.server.chain.get(block_id)
+
+    def chunk(self, chunk_hash: str) -> typing.Optional[dict]:
+        return self.server.chunks.get(chunk_hash)
+
+    def do_GET(self):
+        block = self.block(self.server.latest)
+        self.respond({
+            'sync_info': {
+                'latest_block_height': self.server.latest,
+                'latest_block_hash': block['header']['hash'],
+                'syncing': False
+            }
+        })
+
+    def call(self, method: str, params: typing.Any) -> dict:
+        if method == 'block':
+            block_id = params['block_id'] if isinstance(params,
+                                                        dict) else params[0]
+            block = self.block(block_id)
+            if block is None:
+                return {
+                    'error': {
+                        'data': f'DB Not Found Error: BLOCK: {block_id}'
+                    }
+                }
+            return {'result': block}
+        if method == 'chunk':
+            chunk_hash = params['chunk_id'] if isinstance(params,
+                                                          dict) else params[0]
+            chunk = self.chunk(chunk_hash)
+            if chunk is None:
+                return {
+                    'error': {
+                        'data': f'DB Not Found Error: CHUNK: {chunk_hash}'
+                    }
+                }
+            return {'result': chunk}
+        raise ValueError(method)
+
+
+def start(handler: typing.Type[Handler],
+          **state) -> http.server.ThreadingHTTPServer:
+    """Starts a server with given handler in a daemon thread.
+
+    Keyword arguments are set as attributes of the server.
+    """
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.calls = 0
+    for name, value in state.items():
+        setattr(server, name, value)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stop(server: http.server.ThreadingHTTPServer) -> None:
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,223 @@
+"""Incrementally maintained tree of blocks observed on a chain.
+
+Chain consistency tests sample the heads of nodes and want to know how far
+apart the chains they saw diverged.  `ForkTree` links each added block to its
+previous block, if already known, and keeps binary lifting tables (the
+ancestor 2^k levels up for each k) so that the lowest common ancestor of two
+blocks, and thus their divergence, is found in O(log n).
+
+Blocks whose previous block hasn't been added are orphans and root their own
+component; once the previous block arrives the component is attached to it.
+For blocks in different components the divergence is estimated from what is
+known, including the hashes of the missing previous blocks of the components'
+roots: how far below the lower block both chains are known to be distinct.
+Every estimate is a lower bound of the actual divergence, so `max_divergence`
+is kept without recomparing blocks which weren't (re)attached.
+"""
+
+import collections
+import typing
+
+
+class ForkTree:
+    """Blocks by hash linked to their previous blocks.
+
+    Args:
+        window: Blocks whose heights differ by less than this are compared
+            when a block is added to track the largest divergence.
+    """
+
+    def __init__(self, window: int = 8) -> None:
+        self.window = window
+        self.max_divergence = 0
+        self.fork_count = 0
+        self.orphan_count = 0
+        self._index: typing.Dict[str, int] = {}
+        self._hashes: typing.List[str] = []
+        self._prev_hashes: typing.List[str] = []
+        self._heights: typing.List[int] = []
+        self._children: typing.List[typing.List[int]] = []
+        self._depths: typing.List[int] = []
+        # _up[i][k] is the ancestor 2^k levels above block i.  Only
+        # ancestors which are known are listed.
+        self._up: typing.List[typing.List[int]] = []
+        self._by_height: typing.Dict[int, typing.List[int]] = \
+            collections.defaultdict(list)
+        # Orphans by the hash of their missing previous block.
+        self._waiting: typing.Dict[str, typing.List[int]] = \
+            collections.defaultdict(list)
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __contains__(self, block_hash: str) -> bool:
+        return block_hash in self._index
+
+    def add(self, block_hash: str, prev_hash: str, height: int) -> bool:
+        """Adds a block; returns False if it was already known.
+
+        Updates `max_divergence`, `fork_count` and `orphan_count`.
+        """
+        if block_hash in self._index:
+            return False
+        i = len(self._hashes)
+        self._index[block_hash] = i
+        self._hashes.append(block_hash)
+        self._prev_hashes.append(prev_hash)
+        self._heights.append(height)
+        self._children.append([])
+        self._depths.append(0)
+        self._up.append([])
+        self._by_height[height].append(i)
+
+        parent = self._index.get(prev_hash)
+        if parent is None:
+            self._waiting[prev_hash].append(i)
+            self.orphan_count += 1
+        else:
+            self._add_child(parent, i)
+        # Attach components which were waiting for this block.
+        orphans = self._waiting.pop(block_hash, ())
+        self.orphan_count -= len(orphans)
+        for orphan in orphans:
+            self._add_child(i, orphan)
+
+        # Lifting tables of the new block and of all attached blocks need to
+        # be (re)built, parents before children, before any are compared.
+        linked = [i]
+        for node in linked:
+            self._link(node)
+            linked.extend(self._children[node])
+        for node in linked:
+            self._update_divergence(node)
+        return True
+
+    def _add_child(self, parent: int, child: int) -> None:
+        children = self._children[parent]
+        children.append(child)
+        if len(children) == 2:
+            self.fork_count += 1
+
+    def _link(self, i: int) -> None:
+        parent = self._index.get(self._prev_hashes[i])
+        if parent is None:
+            self._depths[i] = 0
+            self._up[i] = []
+            return
+        depth = self._depths[parent] + 1
+        up = [parent]
+        while (1 << len(up)) <= depth:
+            up.append(self._up[up[-1]][len(up) - 1])
+        self._depths[i] = depth
+        self._up[i] = up
+
+    def _update_divergence(self, i: int) -> None:
+        height = self._heights[i]
+        for other_height in range(height - self.window + 1,
+                                  height + self.window):
+            for other in self._by_height.get(other_height, ()):
+                divergence = self._divergence(i, other)
+                if divergence > self.max_divergence:
+                    self.max_divergence = divergence
+
+    def _lift(self, i: int, levels: int) -> int:
+        k = 0
+        while levels:
+            if levels & 1:
+                i = self._up[i][k]
+            levels >>= 1
+            k += 1
+        return i
+
+    def _root(self, i: int) -> int:
+        return self._lift(i, self._depths[i])
+
+    def _ancestor_at_most(self, i: int, height: int) -> typing.Optional[int]:
+        """Returns the highest known ancestor of i not above given height."""
+        if self._heights[i] <= height:
+            return i
+        for k in range(len(self._up[i]) - 1, -1, -1):
+            if k < len(self._up[i]) and self._heights[self._up[i][k]] > height:
+                i = self._up[i][k]
+        return self._up[i][0] if self._up[i] else None
+
+    def _lca_bound(self, a: int, root_a: int, root_b: int) -> int:
+        """Returns height the unknown common ancestor of a and b is not above.
+
+        `root_a` and `root_b` are the roots of the blocks' components.  In
+        a's chain the common ancestor is either at or below the missing
+        parent of root_a, or a known block which is an ancestor of the
+        missing parent of root_b and thus at least two heights below root_b.
+        """
+        bound = self._heights[root_a] - 1
+        ancestor = self._ancestor_at_most(a, self._heights[root_b] - 2)
+        if ancestor is not None:
+            bound = max(bound, self._heights[ancestor])
+        return bound
+
+    def _lca(self, a: int, b: int) -> typing.Optional[int]:
+        if self._depths[a] > self._depths[b]:
+            a, b = b, a
+        b = self._lift(b, self._depths[b] - self._depths[a])
+        if a == b:
+            return a
+        # a and b stay at the same depth so have tables of the same length.
+        for k in range(len(self._up[a]) - 1, -1, -1):
+            if k < len(self._up[a]) and self._up[a][k] != self._up[b][k]:
+                a, b = self._up[a][k], self._up[b][k]
+        if not self._up[a] or self._up[a][0] != self._up[b][0]:
+            return None
+        return self._up[a][0]
+
+    def _divergence(self, a: int, b: int) -> int:
+        lowest = min(self._heights[a], self._heights[b])
+        lca = self._lca(a, b)
+        if lca is not None:
+            return lowest - self._heights[lca]
+        root_a, root_b = self._root(a), self._root(b)
+        bound = min(self._lca_bound(a, root_a, root_b),
+                    self._lca_bound(b, root_b, root_a))
+        if self._prev_hashes[root_a] == self._prev_hashes[root_b]:
+            # Both chains continue with the same missing block.
+            bound = min(bound, self._heights[root_a] - 1,
+                        self._heights[root_b] - 1)
+        return max(0, lowest - bound)
+
+    def height(self, block_hash: str) -> int:
+        return self._heights[self._index[block_hash]]
+
+    def hashes_at(self, height: int) -> typing.List[str]:
+        """Returns hashes of known blocks at given height."""
+        return [self._hashes[i] for i in self._by_height.get(height, ())]
+
+    def root(self, block_hash: str) -> str:
+        """Returns the lowest known ancestor of a block."""
+        return self._hashes[self._root(self._index[block_hash])]
+
+    def ancestor(self, block_hash: str, height: int) -> typing.Optional[str]:
+        """Returns the known ancestor of a block at given height, if any.
+
+        A block is its own ancestor at its own height.
+        """
+        i = self._ancestor_at_most(self._index[block_hash], height)
+        if i is None or self._heights[i] != height:
+            return None
+        return self._hashes[i]
+
+    def lca(self, a: str, b: str) -> typing.Optional[str]:
+        """Returns the lowest common ancestor of two blocks.
+
+        Returns None if the blocks have no known common ancestor.
+        """
+        lca = self._lca(self._index[a], self._index[b])
+        return None if lca is None else self._hashes[lca]
+
+    def divergence(self, a: str, b: str) -> int:
+        """Returns how many heights below the lower of the blocks chains split.
+
+        That's the height of the lower block minus the height of the lowest
+        common ancestor.  Without a known common ancestor this is a lower
+        bound, at least as large as walking both chains down by previous
+        block hashes until either is missing would give.
+        """
+        return self._divergence(self._index[a], self._index[b])
@@ -0,0 +1,157 @@
+"""Length-prefixed framing of messages exchanged with nodes.
+
+Network messages are sent as a 4-byte length followed by the Borsh-serialized
+message.  `FramedStream` implements that on top of asyncio streams and is
+shared by `peer.Connection` and the proxy.
+
+Small frames written within a single event loop iteration are coalesced into
+one `writelines` call and writers wait for the transport to drain only once more
+than `high_water` bytes are buffered rather than after every message.  Both
+directions are counted in `TransportStats` which may be shared by many
+streams.
+"""
+
+import asyncio
+import struct
+import time
+
+_HEADER = struct.Struct('I')
+
+# Number of buffered outgoing bytes above which writers wait for the transport
+# to drain.
+HIGH_WATER = 1 << 20
+
+# Frames at least that large are passed to the transport on their own rather
+# than copied into a batch, and queued data is flushed once it reaches that
+# size without waiting for the end of the event loop iteration.
+_BATCH_SIZE = 1 << 16
+
+
+class TransportStats:
+    """Counters of frames and bytes passing through framed streams."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.frames_received = 0
+        self.bytes_received = 0
+        # Number of writes to the transport; each sends one or more frames.
+        self.writes = 0
+        # Number of times a writer waited for the transport to drain.
+        self.drains = 0
+
+    def as_dict(self):
+        """Returns the counters together with per-second rates."""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        ret = {
+            name: getattr(self, name)
+            for name in ('frames_sent', 'bytes_sent', 'frames_received',
+                         'bytes_received', 'writes', 'drains')
+        }
+        for name in ('frames_sent', 'bytes_sent', 'frames_received',
+                     'bytes_received'):
+            ret[name + '_per_sec'] = ret[name] / elapsed
+        ret['elapsed'] = elapsed
+        return ret
+
+    def __repr__(self):
+        return f'TransportStats({self.as_dict()})'
+
+
+class FramedStream:
+    """Reads and writes length-prefixed frames on an asyncio stream pair."""
+
+    def __init__(self,
+                 reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter,
+                 *,
+                 stats: TransportStats = None,
+                 high_water: int = HIGH_WATER):
+        self.reader = reader
+        self.writer = writer
+        self.stats = TransportStats() if stats is None else stats
+        self.high_water = high_water
+        self._pending = []
+        self._pending_size = 0
+        self._flush_handle = None
+
+    async def read_frame(self):
+        """Returns the next frame or None if the other side closed the stream.
+
+        Raises asyncio.IncompleteReadError if the stream ends in the middle of
+        a frame.
+        """
+        try:
+            header = await self.reader.readexactly(_HEADER.size)
+        except asyncio.IncompleteReadError as ex:
+            if ex.partial:
+                raise
+            return None
+        frame = await self.reader.readexactly(_HEADER.unpack(header)[0])
+        self.stats.frames_received += 1
+        self.stats.bytes_received += len(frame)
+        return frame
+
+    def write_frame(self, frame):
+        """Queues frame for sending without waiting.
+
+        Queued frames are passed to the transport at the end of the current
+        event loop iteration, on `flush` or once enough data is queued.
+        Callers which may produce a lot of data should use `send_frame` which
+        applies back pressure.
+        """
+        self._pending.append(_HEADER.pack(len(frame)))
+        self._pending.append(frame)
+        self._pending_size += _HEADER.size + len(frame)
+        self.stats.frames_sent += 1
+        self.stats.bytes_sent += len(frame)
+        if self._pending_size >= _BATCH_SIZE:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_soon(
+                self.flush)
+
+    async def send_frame(self, frame):
+        """Queues frame for sending and waits if too much data is buffered."""
+        self.write_frame(frame)
+        buffered = self._pending_size
+        buffered += self.writer.transport.get_write_buffer_size()
+        if buffered >= self.high_water:
+            self.flush()
+            self.stats.drains += 1
+            await self.writer.drain()
+
+    def flush(self):
+        """Passes all queued frames to the transport."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        pending = self._pending
+        self._pending = []
+        self._pending_size = 0
+        # Writing to a closed transport only logs warnings; the error surfaces
+        # when reading from the stream.
+        if self.writer.is_closing():
+            return
+        batch = []
+        for chunk in pending:
+            if len(chunk) < _BATCH_SIZE:
+                batch.append(chunk)
+                continue
+            if batch:
+                self.writer.writelines(batch)
+                self.stats.writes += 1
+                batch = []
+            self.writer.write(chunk)
+            self.stats.writes += 1
+        if batch:
+            self.writer.writelines(batch)
+            self.stats.writes += 1
+
+    async def close(self):
+        self.flush()
+        self.writer.close()
+        await self.writer.wait_closed()
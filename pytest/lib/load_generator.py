@@ -0,0 +1,481 @@
+"""Open-loop transaction load generator.
+
+`mocknet_helpers.throttle_txns` sends transactions in a closed loop: the next
+transaction goes out only after the previous one was answered, so the
+achieved rate collapses when a node slows down and the slowdown never shows
+up in the measurements.  `LoadGenerator` instead fixes the send schedule up
+front, with constant or Poisson-distributed inter-arrival times, and sends
+every transaction at its scheduled time no matter how many earlier ones are
+still waiting for a response.  Thousands of requests can be in flight over a
+pool of keep-alive connections of `rpc_client.AsyncRpcClient`.
+
+Latency of a transaction is measured from its scheduled send time to the
+moment the node accepted it with `broadcast_tx_async`.  Measuring from the
+scheduled time rather than from when the request was actually written
+avoids coordinated omission: time requests spend queued behind a stalled
+node is counted.  The time from the actual send is reported separately as
+service latency.  Both are recorded in `LatencyHistogram`s, per workload.
+
+A workload mix is a list of `Workload`s with weights; `transfer`,
+`set_delete_state` and `ft_transfer_call` reproduce the transactions sent by
+`load_test_spoon_helper`.
+
+    generator = LoadGenerator(accounts, [
+        load_generator.transfer(receivers, weight=2),
+        load_generator.ft_transfer_call(receivers),
+    ], rpc_addrs, rate=500)
+    report = generator.run_sync(duration=60)
+    report.log()
+"""
+
+import asyncio
+import base64
+import collections
+import json
+import random
+import time
+import typing
+
+import base58
+import requests
+
+import rpc_client
+import transaction
+from configured_logger import logger
+
+# Gas attached to function calls; same as `Account.send_call_contract_raw_tx`.
+FUNCTION_CALL_GAS = 3 * 10**14
+
+
+class LatencyHistogram:
+    """HDR-style histogram of latencies with bounded relative error.
+
+    Values are recorded in microseconds into log-linear buckets: each power of
+    two range is split into 2**SUB_BUCKET_BITS equal buckets so a recorded
+    value is known with relative precision better than 1% regardless of its
+    magnitude.  Memory use grows with the logarithm of the largest value.
+    """
+
+    __slots__ = ('counts', 'count', 'sum', 'min', 'max')
+
+    SUB_BUCKET_BITS = 7
+    _SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def _index(cls, value):
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS - 1
+        if shift <= 0:
+            return value
+        return shift * cls._SUB_BUCKETS + (value >> shift)
+
+    @classmethod
+    def _highest_value(cls, index):
+        """Returns the largest value falling into bucket with given index."""
+        if index < 2 * cls._SUB_BUCKETS:
+            return index
+        shift = index // cls._SUB_BUCKETS - 1
+        return ((index - shift * cls._SUB_BUCKETS + 1) << shift) - 1
+
+    def record(self, seconds: float) -> None:
+        index = self._index(max(0, int(seconds * 1e6)))
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.sum += other.sum
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p: float) -> typing.Optional[float]:
+        """Returns p-th percentile, 0 <= p <= 100, in seconds.
+
+        Like HdrHistogram, reports the highest value equivalent to those in
+        the bucket holding the percentile, capped by the recorded maximum.
+        """
+        if not self.count:
+            return None
+        rank = max(1, round(p / 100 * self.count))
+        total = 0
+        for index, count in enumerate(self.counts):
+            total += count
+            if total >= rank:
+                break
+        return min(self._highest_value(index) / 1e6, self.max)
+
+    def summary(self, percentiles=(50, 90, 99, 99.9)) -> typing.Dict:
+        result = {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else None,
+            'min': self.min,
+        }
+        for p in percentiles:
+            result[f'p{p}'] = self.percentile(p)
+        result['max'] = self.max
+        return result
+
+
+def arrival_times(rate: float,
+                  *,
+                  poisson: bool = True,
+                  rng: random.Random = random) -> typing.Iterator[float]:
+    """Yields send times, in seconds from start, of an open-loop schedule.
+
+    With `poisson` inter-arrival times are exponentially distributed, i.e.
+    arrivals form a Poisson process with given mean rate, otherwise they are
+    spaced evenly.
+    """
+    assert rate > 0, rate
+    t = 0.0
+    index = 0
+    while True:
+        if poisson:
+            t += rng.expovariate(rate)
+        else:
+            # Multiply rather than accumulate to avoid drift.
+            index += 1
+            t = index / rate
+        yield t
+
+
+class Workload(typing.NamedTuple):
+    """A kind of transaction sent by LoadGenerator.
+
+    `make_tx(account, nonce, block_hash, rng)` returns serialized signed
+    transaction from `account` with given nonce.
+    """
+    name: str
+    weight: float
+    make_tx: typing.Callable[..., bytes]
+
+
+def transfer(receivers: typing.Sequence[str],
+             amount: int = 100,
+             *,
+             weight: float = 1) -> Workload:
+    """Returns workload transferring tokens to random receivers."""
+    templates = {}
+
+    def make_tx(account, nonce, block_hash, rng):
+        template = templates.get(account.key.account_id)
+        if template is None:
+            template = transaction.get_signer(account.key).template(
+                [transaction.create_payment_action(amount)])
+            templates[account.key.account_id] = template
+        return template.sign(nonce, block_hash, rng.choice(receivers))
+
+    return Workload('transfer', weight, make_tx)
+
+
+def _function_call(account, receiver_id, method, args, deposit, nonce,
+                   block_hash):
+    return transaction.get_signer(account.key).sign(receiver_id, nonce, [
+        transaction.create_function_call_action(
+            method,
+            json.dumps(args).encode('utf-8'), FUNCTION_CALL_GAS, deposit)
+    ], block_hash)
+
+
+def set_delete_state(receivers: typing.Sequence[str],
+                     *,
+                     max_items: int = 100,
+                     weight: float = 1) -> Workload:
+    """Returns workload calling `set_state` and `delete_state` of the
+    load testing contract deployed on the receivers.
+
+    Keeps track of the state each account has set so it deletes only existing
+    items and stores at most `max_items` of them.
+    """
+    state = collections.defaultdict(list)
+
+    def make_tx(account, nonce, block_hash, rng):
+        items = state[account.key.account_id]
+        if items and (len(items) >= max_items or rng.random() < 0.5):
+            receiver_id, value = items.pop(rng.randrange(len(items)))
+            return _function_call(account, receiver_id, 'delete_state',
+                                  {'account_id': f'account_{value}'}, 0, nonce,
+                                  block_hash)
+        receiver_id = rng.choice(receivers)
+        value = rng.randint(0, 1000)
+        items.append((receiver_id, value))
+        return _function_call(account, receiver_id, 'set_state', {
+            'account_id': f'account_{value}',
+            'message': str(value)
+        }, 0, nonce, block_hash)
+
+    return Workload('set_delete_state', weight, make_tx)
+
+
+def ft_transfer_call(receivers: typing.Sequence[str],
+                     *,
+                     contract_id: typing.Optional[str] = None,
+                     weight: float = 1) -> Workload:
+    """Returns workload calling `ft_transfer_call` of a fungible token.
+
+    The token contract is `contract_id` or, if not given, the receiver of
+    the tokens, as `load_test_spoon_helper` does.
+    """
+
+    def make_tx(account, nonce, block_hash, rng):
+        receiver_id = rng.choice(receivers)
+        return _function_call(account, contract_id or receiver_id,
+                              'ft_transfer_call', {
+                                  'receiver_id': receiver_id,
+                                  'amount': '3',
+                                  'msg': '"hi"'
+                              }, 1, nonce, block_hash)
+
+    return Workload('ft_transfer_call', weight, make_tx)
+
+
+class WorkloadStats:
+    """Results of transactions of a single workload."""
+
+    def __init__(self):
+        # Transactions whose send time came.
+        self.scheduled = 0
+        # Transactions not sent because too many were in flight.
+        self.dropped = 0
+        # Transactions accepted by the node.
+        self.accepted = 0
+        # Number of failed sends by error name.
+        self.errors = collections.Counter()
+        # From scheduled send time to the response.
+        self.latency = LatencyHistogram()
+        # From actual send time to the response.
+        self.service_latency = LatencyHistogram()
+
+    def merge(self, other: 'WorkloadStats') -> None:
+        self.scheduled += other.scheduled
+        self.dropped += other.dropped
+        self.accepted += other.accepted
+        self.errors.update(other.errors)
+        self.latency.merge(other.latency)
+        self.service_latency.merge(other.service_latency)
+
+
+class LoadReport:
+    """Per-workload statistics of LoadGenerator runs."""
+
+    def __init__(self):
+        self.workloads = collections.defaultdict(WorkloadStats)
+        self.duration = 0.0
+
+    def total(self) -> WorkloadStats:
+        total = WorkloadStats()
+        for stats in self.workloads.values():
+            total.merge(stats)
+        return total
+
+    def summary(self) -> typing.Dict:
+        result = {}
+        for name, stats in sorted(
+                self.workloads.items()) + [('total', self.total())]:
+            result[name] = {
+                'scheduled':
+                    stats.scheduled,
+                'dropped':
+                    stats.dropped,
+                'accepted':
+                    stats.accepted,
+                'errors':
+                    dict(stats.errors),
+                'tps':
+                    stats.accepted / self.duration if self.duration else None,
+                'latency':
+                    stats.latency.summary(),
+                'service_latency':
+                    stats.service_latency.summary(),
+            }
+        return result
+
+    def log(self) -> None:
+
+        def ms(value):
+            return '-' if value is None else f'{value * 1000:.1f}'
+
+        logger.info(f'Load generated for {self.duration:.1f}s')
+        for name, stats in self.summary().items():
+            latency = stats['latency']
+            logger.info(f'{name:>16}: {stats["accepted"]}/{stats["scheduled"]} '
+                        f'accepted ({stats["tps"] or 0:.1f} tps), '
+                        f'{stats["dropped"]} dropped, '
+                        f'errors {stats["errors"]}; latency ms '
+                        f'p50 {ms(latency["p50"])} p90 {ms(latency["p90"])} '
+                        f'p99 {ms(latency["p99"])} '
+                        f'p99.9 {ms(latency["p99.9"])} '
+                        f'max {ms(latency["max"])}')
+
+
+def _error_name(response):
+    error = response['error']
+    if not isinstance(error, dict):
+        return str(error)
+    cause = error.get('cause')
+    if isinstance(cause, dict) and cause.get('name'):
+        return cause['name']
+    return error.get('name') or str(error.get('data') or error)
+
+
+class LoadGenerator:
+    """Sends transactions from accounts at a given rate on an open loop.
+
+    `accounts` are `account.Account`s; their nonces are incremented locally
+    for every transaction and their `base_block_hash` is used as the
+    transaction's block hash unless `block_hash_refresh` is set, in which
+    case the latest block hash is fetched from the nodes every that many
+    seconds.  Send times are appended to the accounts' `tx_timestamps`.
+
+    Transactions are sent with `broadcast_tx_async` to nodes chosen at
+    random from `rpc_addrs`.  Failed sends are counted, not retried, as
+    retries would shift the schedule.  If `max_in_flight` transactions are
+    awaiting responses, further ones are dropped, and counted, rather than
+    delayed.
+
+    If `tracker`, a `tx_tracker.TxTracker`, is given, transactions accepted
+    by the nodes are tracked until they are final.
+    """
+
+    def __init__(self,
+                 accounts,
+                 workloads: typing.Sequence[Workload],
+                 rpc_addrs: typing.Sequence[rpc_client.Addr],
+                 *,
+                 rate: float,
+                 poisson: bool = True,
+                 max_in_flight: int = 10000,
+                 connections: int = 256,
+                 timeout: float = 10,
+                 block_hash_refresh: typing.Optional[float] = None,
+                 tracker=None,
+                 seed: typing.Optional[int] = None) -> None:
+        assert accounts and workloads and rpc_addrs
+        self.accounts = list(accounts)
+        self.workloads = list(workloads)
+        self.rpc_addrs = list(rpc_addrs)
+        self.rate = rate
+        self.poisson = poisson
+        self.max_in_flight = max_in_flight
+        self.connections = connections
+        self.timeout = timeout
+        self.block_hash_refresh = block_hash_refresh
+        self.tracker = tracker
+        self.rng = random.Random(seed)
+        self.report = LoadReport()
+        self._cum_weights = []
+        for workload in self.workloads:
+            self._cum_weights.append(
+                (self._cum_weights[-1] if self._cum_weights else 0) +
+                workload.weight)
+        self._block_hash = None
+
+    async def _send(self, client, connections, stats, tx, scheduled):
+        async with connections:
+            sent = asyncio.get_running_loop().time()
+            sent_at = time.time()
+            try:
+                response = await client.json_rpc(
+                    self.rng.choice(self.rpc_addrs),
+                    'broadcast_tx_async',
+                    [base64.b64encode(tx).decode('utf-8')],
+                    timeout=self.timeout,
+                    check_status=False)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                response = {'error': type(e).__name__}
+            done = asyncio.get_running_loop().time()
+        stats.latency.record(done - scheduled)
+        stats.service_latency.record(done - sent)
+        if 'error' in response:
+            stats.errors[_error_name(response)] += 1
+        else:
+            stats.accepted += 1
+            if self.tracker:
+                self.tracker.track(response['result'], sent_at)
+
+    async def _refresh_block_hash(self, client):
+        while True:
+            await asyncio.sleep(self.block_hash_refresh)
+            try:
+                status = await client.get_status(self.rng.choice(
+                    self.rpc_addrs),
+                                                 timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                logger.info(f'Failed to fetch latest block hash: {e}')
+                continue
+            self._block_hash = base58.b58decode(
+                status['sync_info']['latest_block_hash'].encode('utf-8'))
+
+    async def run(self, duration: float) -> LoadReport:
+        """Generates load for `duration` seconds.
+
+        Waits for responses to all sent transactions and returns the report
+        accumulated over all runs.
+        """
+        if self.tracker:
+            self.tracker.start()
+        loop = asyncio.get_running_loop()
+        client = rpc_client.AsyncRpcClient(concurrency=self.connections)
+        # Time spent waiting for a free connection is excluded from service
+        # latency.
+        connections = asyncio.Semaphore(self.connections)
+        refresher = None
+        if self.block_hash_refresh:
+            refresher = asyncio.create_task(self._refresh_block_hash(client))
+        in_flight = set()
+        start = loop.time()
+        try:
+            for offset in arrival_times(self.rate,
+                                        poisson=self.poisson,
+                                        rng=self.rng):
+                if offset >= duration:
+                    break
+                scheduled = start + offset
+                # Yield to the sending tasks even when behind schedule.
+                await asyncio.sleep(max(0, scheduled - loop.time()))
+                workload = self.rng.choices(self.workloads,
+                                            cum_weights=self._cum_weights)[0]
+                stats = self.report.workloads[workload.name]
+                stats.scheduled += 1
+                if len(in_flight) >= self.max_in_flight:
+                    stats.dropped += 1
+                    continue
+                account = self.rng.choice(self.accounts)
+                account.nonce += 1
+                account.tx_timestamps.append(time.time())
+                tx = workload.make_tx(
+                    account, account.nonce, self._block_hash or
+                    account.base_block_hash, self.rng)
+                task = asyncio.create_task(
+                    self._send(client, connections, stats, tx, scheduled))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            if in_flight:
+                await asyncio.wait(in_flight)
+        finally:
+            if refresher:
+                refresher.cancel()
+            await client.close()
+        self.report.duration += loop.time() - start
+        return self.report
+
+    def run_sync(self, duration: float) -> LoadReport:
+        """Runs `run` on a new event loop."""
+        return asyncio.run(self.run(duration))
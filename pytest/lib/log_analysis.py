@@ -0,0 +1,402 @@
+"""Reconstruction of block and chunk timing from neard logs.
+
+Debugging block production latency usually means grepping logs of many
+nodes, e.g. downloaded with `mocknet.get_logs` or left in `LocalNode`
+directories, and lining up timestamps by hand.  `analyze` instead scans the
+log files in parallel, one process per file, and extracts events such as a
+node producing a block, updating its head or receiving a chunk part into a
+NumPy structured array with one row per event:
+
+    node      index of the log file the event comes from
+    time      seconds since the epoch
+    level     index into LEVELS
+    event     index into the event names
+    height    block height or -1
+    shard_id  shard id or -1
+
+Files are read line by line so multi-GB logs don't need to fit in memory;
+only lines mentioning one of the events are parsed.  Events are defined by
+the log target and a regular expression matching the message, see EVENTS.
+Heights and shard ids come from named groups of the expression or from
+`height=` and `shard_id=` fields of the line.
+
+`LogAnalysis` answers queries over the events: when each block was produced
+and processed by every node, how far apart nodes received parts of each
+chunk and which heights are missing or took long to arrive.
+
+    analysis = log_analysis.analyze(['logs/node0.log', 'logs/node1.log'])
+    blocks = analysis.block_timing()
+    logger.info(f'p99 block delay: {np.nanpercentile(blocks["delay"], 99)}')
+"""
+
+import array
+import calendar
+import concurrent.futures
+import os
+import re
+import time
+import typing
+
+import numpy as np
+
+from configured_logger import logger
+
+LEVELS = ('TRACE', 'DEBUG', 'INFO', 'WARN', 'ERROR')
+
+# Event name to (log target, regular expression matching the message).
+EVENTS = {
+    'block_produced': ('client', r'Producing block at height (?P<height>\d+)'),
+    'head_updated': ('chain', r'Head updated to \S+ at (?P<height>\d+)'),
+    'chunk_produced': ('client', r'Produced chunk with'),
+    'chunk_part_received': ('chunks', r'Process partial encoded chunk'),
+    'chunk_requested': ('chunks', r'Requesting\.'),
+}
+
+EVENT_DTYPE = np.dtype([
+    ('node', np.int32),
+    ('time', np.float64),
+    ('level', np.int8),
+    ('event', np.int16),
+    ('height', np.int64),
+    ('shard_id', np.int32),
+])
+
+CHUNK_SKEW_DTYPE = np.dtype([
+    ('height', np.int64),
+    ('shard_id', np.int32),
+    ('produced', np.float64),
+    ('first', np.float64),
+    ('last', np.float64),
+    ('skew', np.float64),
+    ('nodes', np.int32),
+])
+
+# Timestamp, level, spans the event happened in (`name{fields}` separated by
+# colons), target and the rest of the line: message followed by fields.
+# Timestamps are either RFC 3339 in UTC, as printed by current versions of
+# tracing-subscriber, or syslog-like without the year, as printed by older
+# ones.
+_LINE_RE = re.compile(r'(?P<time>\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?Z|'
+                      r'[A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d(?:\.\d+)?)\s+'
+                      r'(?P<level>TRACE|DEBUG|INFO|WARN|ERROR)\s+'
+                      r'(?:(?P<spans>\w+(?:\{[^}]*\})?(?::\w+(?:\{[^}]*\})?)*)'
+                      r': )?'
+                      r'(?P<target>[A-Za-z_]\w*(?:::\w+)*): (?P<rest>.*)')
+_FIELD_RE = re.compile(r'(?:^|\s)(\w+)=("(?:[^"\\]|\\.)*"|\S+)')
+_CSI_RE = re.compile('\x1b\\[[^\x40-\x7E]*[\x40-\x7E]')
+_MONTHS = {
+    name: i + 1
+    for i, name in enumerate(('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul',
+                              'Aug', 'Sep', 'Oct', 'Nov', 'Dec'))
+}
+
+
+class LogLine(typing.NamedTuple):
+    time: float
+    level: str
+    target: str
+    spans: str
+    message: str
+    fields: typing.Dict[str, str]
+
+
+def _parse_time(text: str, year: int) -> float:
+    if text[4] == '-':
+        day = calendar.timegm(
+            (int(text[:4]), int(text[5:7]), int(text[8:10]), 0, 0, 0))
+        clock = text[11:-1]
+    else:
+        day = calendar.timegm(
+            (year, _MONTHS[text[:3]], int(text[4:6]), 0, 0, 0))
+        clock = text[7:]
+    hours, minutes, seconds = clock.split(':')
+    return day + int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def parse_line(line: str,
+               *,
+               year: typing.Optional[int] = None) -> typing.Optional[LogLine]:
+    """Parses a neard log line; returns None if it isn't a log event.
+
+    `year` is assumed for timestamps without one and defaults to the current
+    year.
+    """
+    if '\x1b' in line:
+        line = _CSI_RE.sub('', line)
+    match = _LINE_RE.match(line)
+    if match is None:
+        return None
+    rest = match.group('rest').rstrip('\n')
+    fields = {}
+    message_end = len(rest)
+    for field in _FIELD_RE.finditer(rest):
+        message_end = min(message_end, field.start())
+        value = field.group(2)
+        if value.startswith('"'):
+            value = value[1:-1]
+        fields[field.group(1)] = value
+    return LogLine(time=_parse_time(match.group('time'), year or
+                                    time.gmtime().tm_year),
+                   level=match.group('level'),
+                   target=match.group('target'),
+                   spans=match.group('spans') or '',
+                   message=rest[:message_end].strip(),
+                   fields=fields)
+
+
+def _int_or(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_file(path: str,
+               node: int,
+               events: typing.Dict[str, typing.Tuple[str, str]] = EVENTS,
+               *,
+               year: typing.Optional[int] = None) -> np.ndarray:
+    """Returns events in a log file as an array of EVENT_DTYPE.
+
+    The file is streamed line by line and lines which don't mention any of
+    the events are skipped without parsing.
+    """
+    names = list(events)
+    matchers = [
+        (target, re.compile(pattern)) for target, pattern in events.values()
+    ]
+    # Names of groups must be unique so drop them from the prefilter.
+    prefilter = re.compile('|'.join('(?:' +
+                                    re.sub(r'\(\?P<\w+>', '(?:', pattern) + ')'
+                                    for _, pattern in events.values()))
+    year = year or time.gmtime().tm_year
+    columns = {
+        'time': array.array('d'),
+        'level': array.array('b'),
+        'event': array.array('h'),
+        'height': array.array('q'),
+        'shard_id': array.array('i'),
+    }
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            if prefilter.search(line) is None:
+                continue
+            parsed = parse_line(line, year=year)
+            if parsed is None:
+                continue
+            for event, (target, matcher) in enumerate(matchers):
+                if not parsed.target.endswith(target):
+                    continue
+                match = matcher.search(parsed.message)
+                if match is None:
+                    continue
+                groups = match.groupdict()
+                fields = parsed.fields
+                columns['time'].append(parsed.time)
+                columns['level'].append(LEVELS.index(parsed.level))
+                columns['event'].append(event)
+                columns['height'].append(
+                    _int_or(groups.get('height', fields.get('height')), -1))
+                columns['shard_id'].append(
+                    _int_or(groups.get('shard_id', fields.get('shard_id')), -1))
+                break
+    result = np.zeros(len(columns['time']), dtype=EVENT_DTYPE)
+    result['node'] = node
+    for name, column in columns.items():
+        result[name] = np.frombuffer(column, dtype=column.typecode)
+    logger.debug(f'Found {len(result)} events of {names} in {path}')
+    return result
+
+
+class LogAnalysis:
+    """Events extracted from logs of many nodes, with timing queries.
+
+    Attributes:
+        nodes: Names of the nodes, indexed by the `node` column.
+        event_names: Names of the events, indexed by the `event` column.
+        events: Array of EVENT_DTYPE sorted by time.
+    """
+
+    def __init__(self, nodes: typing.Sequence[str],
+                 event_names: typing.Sequence[str], events: np.ndarray) -> None:
+        self.nodes = list(nodes)
+        self.event_names = list(event_names)
+        self.events = events[np.argsort(events['time'], kind='stable')]
+
+    def select(self,
+               event: str,
+               node: typing.Optional[int] = None) -> np.ndarray:
+        """Returns events of given name, optionally of a single node."""
+        mask = self.events['event'] == self.event_names.index(event)
+        if node is not None:
+            mask &= self.events['node'] == node
+        return self.events[mask]
+
+    def first_times(self, event: str) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """Returns when each node first logged the event for each height.
+
+        Returns (heights, times) where heights are sorted and times[i, n] is
+        the earliest time node n logged the event at heights[i], or NaN if it
+        never did.
+        """
+        rows = self.select(event)
+        rows = rows[rows['height'] >= 0]
+        heights, index = np.unique(rows['height'], return_inverse=True)
+        times = np.full((len(heights), len(self.nodes)), np.nan)
+        np.fmin.at(times, (index, rows['node']), rows['time'])
+        return heights, times
+
+    def block_timing(self) -> np.ndarray:
+        """Returns production and processing times of blocks by height.
+
+        Returns a structured array with a row per height some node updated
+        its head to, with fields:
+            height: block height,
+            producer: node which logged producing the block, or -1,
+            produced: when the block production started, or NaN,
+            processed: when each node updated its head to the height,
+            delay: processed minus produced, per node.
+        """
+        heights, processed = self.first_times('head_updated')
+        produced = np.full(len(heights), np.nan)
+        producer = np.full(len(heights), -1, dtype=np.int32)
+        lookup = {height: i for i, height in enumerate(heights.tolist())}
+        # Events are sorted by time so iterating backwards leaves the
+        # earliest.
+        for row in self.select('block_produced')[::-1]:
+            i = lookup.get(int(row['height']))
+            if i is not None:
+                produced[i] = row['time']
+                producer[i] = row['node']
+        result = np.zeros(len(heights),
+                          dtype=[('height', np.int64), ('producer', np.int32),
+                                 ('produced', np.float64),
+                                 ('processed', np.float64, len(self.nodes)),
+                                 ('delay', np.float64, len(self.nodes))])
+        result['height'] = heights
+        result['producer'] = producer
+        result['produced'] = produced
+        result['processed'] = processed
+        result['delay'] = processed - produced[:, None]
+        return result
+
+    def chunk_skew(self) -> np.ndarray:
+        """Returns how far apart nodes received the first part of each chunk.
+
+        Returns a structured array with a row per (height, shard) chunk parts
+        were received for, with fields `height`, `shard_id`, `produced` (when
+        a node logged producing the chunk, or NaN), `first` and `last` (the
+        earliest and the latest time a node received its first part),
+        `skew` (last minus first) and `nodes` (number of nodes which received
+        any part).
+        """
+        rows = self.select('chunk_part_received')
+        rows = rows[(rows['height'] >= 0) & (rows['shard_id'] >= 0)]
+        if not len(rows):
+            return np.zeros(0, dtype=CHUNK_SKEW_DTYPE)
+        keys = np.stack([rows['height'], rows['shard_id']], axis=1)
+        chunks, index = np.unique(keys, axis=0, return_inverse=True)
+        index = index.reshape(-1)
+        times = np.full((len(chunks), len(self.nodes)), np.nan)
+        np.fmin.at(times, (index, rows['node']), rows['time'])
+
+        produced = np.full(len(chunks), np.nan)
+        lookup = {(h, s): i for i, (h, s) in enumerate(chunks.tolist())}
+        for row in self.select('chunk_produced')[::-1]:
+            i = lookup.get((int(row['height']), int(row['shard_id'])))
+            if i is not None:
+                produced[i] = row['time']
+
+        result = np.zeros(len(chunks), dtype=CHUNK_SKEW_DTYPE)
+        result['height'] = chunks[:, 0]
+        result['shard_id'] = chunks[:, 1]
+        result['produced'] = produced
+        result['first'] = np.nanmin(times, axis=1)
+        result['last'] = np.nanmax(times, axis=1)
+        result['skew'] = result['last'] - result['first']
+        result['nodes'] = np.sum(~np.isnan(times), axis=1)
+        return result
+
+    def missing_heights(self) -> np.ndarray:
+        """Returns heights between the lowest and highest head with no block.
+
+        These are heights no node updated its head to, i.e. skipped by block
+        producers or missing from all the logs.
+        """
+        heights, _ = self.first_times('head_updated')
+        if not len(heights):
+            return heights
+        return np.setdiff1d(np.arange(heights[0], heights[-1] + 1), heights)
+
+    def head_gaps(self, threshold: float) -> np.ndarray:
+        """Returns head updates which came more than `threshold` seconds late.
+
+        Returns a structured array with a row for each time a node updated its
+        head more than `threshold` seconds after the previous update, with
+        fields `node`, `height`, `previous_height` and `gap` in seconds.
+        """
+        result = []
+        for node in range(len(self.nodes)):
+            rows = self.select('head_updated', node)
+            gaps = np.diff(rows['time'])
+            for i in np.nonzero(gaps > threshold)[0]:
+                result.append(
+                    (node, rows['height'][i + 1], rows['height'][i], gaps[i]))
+        return np.array(result,
+                        dtype=[('node', np.int32), ('height', np.int64),
+                               ('previous_height', np.int64),
+                               ('gap', np.float64)])
+
+    def log(self) -> None:
+        """Logs a summary of block and chunk timing."""
+        blocks = self.block_timing()
+        chunks = self.chunk_skew()
+        delays = blocks['delay'][~np.isnan(blocks['delay'])]
+        skews = chunks['skew'][~np.isnan(chunks['skew'])]
+        logger.info(f'{len(self.events)} events from {len(self.nodes)} nodes, '
+                    f'{len(blocks)} heights, '
+                    f'{len(self.missing_heights())} missing')
+        for name, values in (('block delay', delays), ('chunk skew', skews)):
+            if len(values):
+                p50, p90, p99 = np.percentile(values, [50, 90, 99])
+                logger.info(f'{name}: p50 {p50:.3f}s p90 {p90:.3f}s '
+                            f'p99 {p99:.3f}s max {values.max():.3f}s')
+
+
+def analyze(paths: typing.Sequence[str],
+            *,
+            nodes: typing.Optional[typing.Sequence[str]] = None,
+            events: typing.Dict[str, typing.Tuple[str, str]] = EVENTS,
+            processes: typing.Optional[int] = None,
+            year: typing.Optional[int] = None) -> LogAnalysis:
+    """Extracts events from log files of many nodes.
+
+    Args:
+        paths: Log files, one per node.
+        nodes: Names of the nodes; default to the file names.
+        events: Events to extract, see EVENTS.
+        processes: Number of files parsed in parallel; defaults to the number
+            of CPUs.
+        year: Year of timestamps which don't include one.
+    Returns:
+        Analysis of the events.
+    """
+    paths = [str(path) for path in paths]
+    if nodes is None:
+        nodes = [os.path.basename(path) for path in paths]
+    assert len(nodes) == len(paths), (nodes, paths)
+    processes = min(processes or os.cpu_count() or 1, len(paths))
+    if processes > 1:
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            futures = [
+                executor.submit(parse_file, path, node, events, year=year)
+                for node, path in enumerate(paths)
+            ]
+            parts = [future.result() for future in futures]
+    else:
+        parts = [
+            parse_file(path, node, events, year=year)
+            for node, path in enumerate(paths)
+        ]
+    merged = np.concatenate(parts) if parts else np.zeros(0, EVENT_DTYPE)
+    return LogAnalysis(nodes, list(events), merged)
@@ -1,5 +1,6 @@
 from messages.crypto import PublicKey, Signature, MerklePath, ShardProof
 from messages.tx import Receipt, SignedTransaction
+from serializer import generate_classes
 
 
 class Block:
@@ -635,3 +636,5 @@ block_schema = [
         }
     ],
 ]
+
+generate_classes(block_schema, globals())
@@ -1,3 +1,6 @@
+from serializer import generate_classes
+
+
 class Proof:
     pass
 
@@ -16,3 +19,5 @@ bridge_schema = [[
         ]
     }
 ]]
+
+generate_classes(bridge_schema, globals())
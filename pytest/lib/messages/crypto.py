@@ -2,6 +2,8 @@ import typing
 
 import base58
 
+from serializer import generate_classes
+
 
 class Signature:
     _KEY_TYPES = {
@@ -120,3 +122,5 @@ crypto_schema = [
         }
     ],
 ]
+
+generate_classes(crypto_schema, globals())
@@ -2,6 +2,7 @@ from messages.crypto import Signature, PublicKey, MerklePath, ShardProof
 from messages.tx import SignedTransaction, Receipt
 from messages.block import Block, Approval, PartialEncodedChunk, PartialEncodedChunkV1, PartialEncodedChunkRequestMsg, PartialEncodedChunkResponseMsg, PartialEncodedChunkForwardMsg, BlockHeader, ShardChunk, ShardChunkHeader, ShardChunkHeaderV1
 from messages.shard import StateRootNode
+from serializer import generate_classes
 
 
 class SocketAddr:
@@ -550,3 +551,5 @@ network_schema = [
         }
     ]
 ]
+
+generate_classes(network_schema, globals())
@@ -1,3 +1,6 @@
+from serializer import generate_classes
+
+
 class StateRootNode:
     pass
 
@@ -8,3 +11,5 @@ shard_schema = [[
         'fields': [['data', ['u8']], ['memory_usage', 'u64']]
     }
 ]]
+
+generate_classes(shard_schema, globals())
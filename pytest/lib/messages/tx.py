@@ -1,4 +1,5 @@
 from messages.crypto import Signature, PublicKey, AccessKey
+from serializer import generate_classes
 
 
 class SignedTransaction:
@@ -200,3 +201,5 @@ tx_schema = [
         }
     ],
 ]
+
+generate_classes(tx_schema, globals())
@@ -1,18 +1,18 @@
-from prometheus_client import parser
 import requests
 import time
 
+from metrics_parser import MetricsParser
+
 BLOCK_TIME_BINS = [
     '0.005', '0.01', '0.025', '0.05', '0.1', '0.25', '0.5', '1', '2.5', '5',
     '10', '+Inf'
 ]
 
-
-def fold(collection, key, f, default):
-    if key in collection:
-        return f(collection[key])
-    else:
-        return default
+_parser = MetricsParser([
+    'near_block_processed', 'near_memory_usage_bytes',
+    'near_transaction_processed', 'near_blocks_per_minute',
+    'near_block_processing_time'
+])
 
 
 class Metrics:
@@ -31,32 +31,23 @@ class Metrics:
         response = requests.get(metrics_url, timeout=10)
         timestamp = time.time()
         response.raise_for_status()
-        prometheus_string = response.content.decode('utf8')
-        prometheus_metrics = dict(
-            map(lambda m: (m.name, m),
-                parser.text_string_to_metric_families(prometheus_string)))
+        samples = _parser.parse(response.content)
+        values = {
+            sample.name: sample.value for sample in samples if not sample.labels
+        }
 
-        fold_sample = lambda key: fold(prometheus_metrics, key, lambda m: int(
-            m.samples[0].value), 0)
+        fold_sample = lambda key: int(values.get(key, 0))
 
         total_blocks = fold_sample('near_block_processed')
         memory_usage = fold_sample('near_memory_usage_bytes')
         total_transactions = fold_sample('near_transaction_processed')
         blocks_per_second = fold_sample('near_blocks_per_minute') / 60.0
 
-        def extract_block_processing_time(m):
-            block_processing_time_samples = m.samples
-            block_processing_time = {}
-            for sample in block_processing_time_samples:
-                if 'le' in sample.labels:
-                    bound = sample.labels['le']
-                    block_processing_time[f'le {bound}'] = int(sample.value)
-            return block_processing_time
-
-        block_processing_time = fold(
-            prometheus_metrics, 'near_block_processing_time',
-            extract_block_processing_time,
-            dict(map(lambda bin: ('le ' + bin, 0), BLOCK_TIME_BINS)))
+        block_processing_time = {
+            f'le {sample.labels["le"]}': int(sample.value)
+            for sample in samples
+            if sample.name == 'near_block_processing_time_bucket'
+        } or dict(map(lambda bin: ('le ' + bin, 0), BLOCK_TIME_BINS))
 
         return cls(total_blocks, memory_usage, total_transactions,
                    block_processing_time, timestamp, blocks_per_second)
@@ -0,0 +1,122 @@
+"""Extraction of selected samples from Prometheus text format pages.
+
+`prometheus_client.parser.text_string_to_metric_families` builds family and
+sample objects for every series on a page.  neard exposes thousands of
+labelled series while tests look at a handful so most of that work is thrown
+away.  `MetricsParser` is given the metrics of interest up front and
+compiles them into a single regular expression which finds their samples in
+one pass over the page's bytes, skipping comments and all other series
+without decoding them.  Only matched lines are split into labels and values.
+
+    parser = MetricsParser(['near_block_processed',
+                            'near_block_processing_time'])
+    for sample in parser.parse(response.content):
+        ...
+
+Metrics are selected by name: samples named exactly so, and the `_bucket`,
+`_sum`, `_count` and `_total` samples of histograms, summaries and counters
+of that name.  Like prometheus_client, which names counter families without
+the `_total` suffix, `_total` samples of a selected metric are reported under
+the metric's name, e.g. neard's `near_block_processed_total` as
+`near_block_processed`.  Other samples are reported with names as written on
+the page.  Label filters restrict a metric to samples with given label
+values.
+
+Pages can also be parsed incrementally, as they are read from a socket, with
+`feed` and `close`.
+"""
+
+import re
+import typing
+
+# Suffixes of samples belonging to a metric of histogram, summary or counter
+# type.
+SUFFIXES = ('_bucket', '_sum', '_count', '_total')
+
+_LABEL = re.compile(rb'([a-zA-Z_][a-zA-Z0-9_]*)\s*=\s*"((?:[^"\\]|\\.)*)"')
+_ESCAPES = {b'\\\\': b'\\', b'\\"': b'"', b'\\n': b'\n'}
+_ESCAPE = re.compile(rb'\\[\\"n]')
+
+# Map from metric name to labels its samples must have and their values.
+LabelFilters = typing.Dict[str, typing.Dict[str, str]]
+
+
+class Sample(typing.NamedTuple):
+    name: str
+    labels: typing.Dict[str, str]
+    value: float
+
+
+def _parse_labels(data: bytes) -> typing.Dict[str, str]:
+    labels = {}
+    for name, value in _LABEL.findall(data):
+        if b'\\' in value:
+            value = _ESCAPE.sub(lambda m: _ESCAPES[m.group()], value)
+        labels[name.decode()] = value.decode('utf8')
+    return labels
+
+
+class MetricsParser:
+    """Extracts samples of given metrics from Prometheus text format pages.
+
+    Args:
+        metrics: Names of metrics to extract.
+        label_filters: Map from metric name to labels a sample of that metric
+            must have, with their values, to be extracted.
+    """
+
+    def __init__(self,
+                 metrics: typing.Iterable[str],
+                 label_filters: typing.Optional[LabelFilters] = None) -> None:
+        self.metrics = frozenset(metrics)
+        assert self.metrics, 'no metrics to extract'
+        self.label_filters = dict(label_filters or {})
+        assert self.label_filters.keys() <= self.metrics, label_filters
+        names = b'|'.join(
+            re.escape(name.encode())
+            for name in sorted(self.metrics, key=len, reverse=True))
+        suffixes = b'|'.join(suffix.encode() for suffix in SUFFIXES)
+        # Sample lines of the metrics, anchored at line start so comments and
+        # other series are rejected after a character or two.  A label value
+        # may contain any character, including `}`, except an unescaped
+        # quote.
+        self._sample = re.compile(
+            rb'^(?P<metric>' + names + rb')(?P<suffix>' + suffixes + rb')?'
+            rb'(?:\{(?P<labels>(?:[^"}\n]|"(?:[^"\\\n]|\\.)*")*)\})?'
+            rb'[ \t]+(?P<value>[^ \t\n]+)', re.MULTILINE)
+        self._buffer = b''
+
+    def _samples(self, data):
+        filters = self.label_filters
+        for match in self._sample.finditer(data):
+            metric, suffix, labels, value = match.group('metric', 'suffix',
+                                                        'labels', 'value')
+            metric = metric.decode()
+            labels = _parse_labels(labels) if labels else {}
+            wanted = filters.get(metric)
+            if wanted and any(labels.get(k) != v for k, v in wanted.items()):
+                continue
+            if suffix and suffix != b'_total':
+                metric += suffix.decode()
+            yield Sample(metric, labels, float(value))
+
+    def parse(self, page: typing.Union[bytes, str]) -> typing.List[Sample]:
+        """Returns samples of the metrics on a whole page, in page order."""
+        if isinstance(page, str):
+            page = page.encode('utf8')
+        return list(self._samples(page))
+
+    def feed(self, chunk: bytes) -> typing.List[Sample]:
+        """Returns samples on complete lines read so far.
+
+        A trailing incomplete line is kept until the next call.
+        """
+        data = self._buffer + chunk
+        end = data.rfind(b'\n') + 1
+        self._buffer = data[end:]
+        return list(self._samples(data[:end]))
+
+    def close(self) -> typing.List[Sample]:
+        """Returns samples on the last line fed, if not terminated."""
+        data, self._buffer = self._buffer, b''
+        return list(self._samples(data))
@@ -0,0 +1,344 @@
+"""Background sampling of Prometheus metrics of many nodes.
+
+`metrics.Metrics` takes one-shot snapshots of a handful of metrics.
+`MetricsSampler` instead scrapes /metrics of every node at a fixed interval
+on a background thread, over the keep-alive connections of the shared
+`rpc_client`, and keeps selected series of each node in fixed-size NumPy ring
+buffers so a long test holds at most `capacity` samples per series.  Counters
+can be turned into rates and histograms into quantiles over any time window,
+and the whole timeline dumped to a JSON file at the end of the test.
+
+    with MetricsSampler(nodes, interval=1) as sampler:
+        run_test()
+    sampler.log()
+    sampler.dump('metrics.json')
+
+Series are identified by sample names with labels in Prometheus format, e.g.
+`near_block_processing_time_bucket{le="0.5"}`.  A metric is selected by its
+family name, which includes all its samples, e.g. the `_bucket`, `_sum` and
+`_count` samples of a histogram.  Counters are named by their family,
+without a `_total` suffix; see `metrics_parser`.
+"""
+
+import concurrent.futures
+import json
+import math
+import threading
+import time
+import typing
+
+import numpy as np
+import requests
+
+import cluster
+import metrics_parser
+import rpc_client
+from configured_logger import logger
+
+DEFAULT_CAPACITY = 3600
+DEFAULT_INTERVAL = 1.0
+DEFAULT_SERIES = (
+    'near_block_processed',
+    'near_transaction_processed',
+    'near_block_processing_time',
+    'near_memory_usage_bytes',
+    'near_blocks_per_minute',
+)
+
+
+def series_key(name: str, labels: typing.Dict[str, str]) -> str:
+    """Returns key of a sample with given name and labels."""
+    if not labels:
+        return name
+    labels = ','.join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return f'{name}{{{labels}}}'
+
+
+class RingBuffer:
+    """Last `capacity` samples of a set of series taken at the same times.
+
+    Series first seen after some samples were taken are NaN before that.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.count = 0
+        self._times = np.full(capacity, np.nan)
+        self._values = {}
+
+    def append(self, timestamp: float, values: typing.Dict[str, float]) -> None:
+        i = self.count % self.capacity
+        self._times[i] = timestamp
+        for key in values.keys() - self._values.keys():
+            self._values[key] = np.full(self.capacity, np.nan)
+        for key, array in self._values.items():
+            array[i] = values.get(key, np.nan)
+        self.count += 1
+
+    def _order(self):
+        if self.count <= self.capacity:
+            return np.arange(self.count)
+        return np.arange(self.count, self.count + self.capacity) % self.capacity
+
+    def keys(self) -> typing.List[str]:
+        return sorted(self._values)
+
+    def times(self) -> np.ndarray:
+        """Returns times of the samples, oldest first."""
+        return self._times[self._order()]
+
+    def values(self, key: str) -> np.ndarray:
+        """Returns values of a series, oldest first; NaN if never seen."""
+        array = self._values.get(key)
+        if array is None:
+            return np.full(min(self.count, self.capacity), np.nan)
+        return array[self._order()]
+
+
+def increase(values: np.ndarray) -> float:
+    """Returns increase of a counter, allowing for resets to zero."""
+    values = values[~np.isnan(values)]
+    if len(values) < 2:
+        return math.nan
+    deltas = np.diff(values)
+    # After a node restarts its counters start from zero again.
+    return float(np.where(deltas < 0, values[1:], deltas).sum())
+
+
+def bucket_quantile(q: float, bounds: typing.Sequence[float],
+                    counts: typing.Sequence[float]) -> float:
+    """Returns q-quantile of a histogram with cumulative bucket counts.
+
+    Like Prometheus's histogram_quantile, interpolates linearly within the
+    bucket holding the quantile and returns the largest finite bound if it
+    falls into the +Inf bucket.  Returns NaN for an empty histogram.
+    """
+    total = counts[-1] if len(counts) else 0
+    if not total > 0:
+        return math.nan
+    rank = q * total
+    index = int(np.searchsorted(counts, rank, side='left'))
+    index = min(index, len(counts) - 1)
+    if math.isinf(bounds[index]):
+        return bounds[index - 1] if index else math.nan
+    lower = bounds[index - 1] if index else 0.0
+    below = counts[index - 1] if index else 0.0
+    in_bucket = counts[index] - below
+    if in_bucket <= 0:
+        return bounds[index]
+    return lower + (bounds[index] - lower) * (rank - below) / in_bucket
+
+
+class MetricsSampler:
+    """Periodically scrapes metrics of nodes into ring buffers.
+
+    Args:
+        nodes: Nodes to scrape.  Other methods take the index of a node in
+            this list.
+        series: Names of metric families to keep.
+        interval: Seconds between scrapes.
+        capacity: Number of samples kept per node.
+        timeout: Timeout of a single scrape.
+    """
+
+    def __init__(self,
+                 nodes: typing.Sequence[cluster.BaseNode],
+                 series: typing.Iterable[str] = DEFAULT_SERIES,
+                 *,
+                 interval: float = DEFAULT_INTERVAL,
+                 capacity: int = DEFAULT_CAPACITY,
+                 timeout: float = 5) -> None:
+        self.nodes = list(nodes)
+        self.series = frozenset(series)
+        self._parser = metrics_parser.MetricsParser(self.series)
+        self.interval = interval
+        self.timeout = timeout
+        self.errors = [0] * len(self.nodes)
+        self._buffers = [RingBuffer(capacity) for _ in self.nodes]
+        self._labels = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def parse(self, page: typing.Union[bytes, str]) -> typing.Dict[str, float]:
+        """Returns values of selected samples in a /metrics page by key."""
+        values = {}
+        labels = {}
+        for sample in self._parser.parse(page):
+            key = series_key(sample.name, sample.labels)
+            labels[key] = (sample.name, sample.labels)
+            values[key] = sample.value
+        with self._lock:
+            self._labels.update(labels)
+        return values
+
+    def _scrape(self, i):
+        node = self.nodes[i]
+        try:
+            text = rpc_client.shared().get_metrics(node.rpc_addr(),
+                                                   timeout=self.timeout)
+        except requests.exceptions.RequestException as ex:
+            self.errors[i] += 1
+            logger.warning(
+                f'Scraping metrics of {node.rpc_addr()} failed: {ex}')
+            return
+        timestamp = time.time()
+        values = self.parse(text)
+        with self._lock:
+            self._buffers[i].append(timestamp, values)
+
+    def sample(self) -> None:
+        """Scrapes all nodes once, concurrently."""
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max(1, len(self.nodes)))
+        list(self._executor.map(self._scrape, range(len(self.nodes))))
+
+    def _run(self):
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            self.sample()
+            # Keep to the schedule even if a scrape took a while; skip
+            # samples missed entirely.
+            deadline += self.interval
+            now = time.monotonic()
+            if deadline < now:
+                deadline += (now - deadline) // self.interval * self.interval
+            self._stop.wait(deadline - now)
+
+    def start(self) -> None:
+        assert self._thread is None, 'already started'
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='metrics-sampler',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops sampling; the samples taken are kept."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self) -> 'MetricsSampler':
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def timeline(self,
+                 node: int,
+                 name: str,
+                 window: typing.Optional[float] = None,
+                 **labels) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """Returns (times, values) of a series of a node, oldest first.
+
+        If `window` is given, only samples from the last `window` seconds
+        before the latest one are returned.
+        """
+        with self._lock:
+            buffer = self._buffers[node]
+            times = buffer.times()
+            values = buffer.values(series_key(name, labels))
+        if window is not None and len(times):
+            mask = times >= times[-1] - window
+            times, values = times[mask], values[mask]
+        return times, values
+
+    def rate(self,
+             node: int,
+             name: str,
+             window: typing.Optional[float] = None,
+             **labels) -> float:
+        """Returns per-second increase of a counter over the window.
+
+        Returns NaN if there are fewer than two samples of the counter.
+        """
+        times, values = self.timeline(node, name, window, **labels)
+        seen = times[~np.isnan(values)]
+        if len(seen) < 2 or seen[-1] == seen[0]:
+            return math.nan
+        return increase(values) / (seen[-1] - seen[0])
+
+    def quantile(self,
+                 node: int,
+                 name: str,
+                 q: float,
+                 window: typing.Optional[float] = None,
+                 **labels) -> float:
+        """Returns q-quantile of observations of a histogram over the window.
+
+        Observations are counted from the increase of `<name>_bucket` series
+        with given labels, other than `le`, over the window.  If `window` is
+        None, all observations made since the first sample are counted.
+        """
+        bucket_name = f'{name}_bucket'
+        with self._lock:
+            keys = [
+                key for key, (sample_name,
+                              sample_labels) in self._labels.items()
+                if sample_name == bucket_name and 'le' in sample_labels and
+                {k: v for k, v in sample_labels.items() if k != 'le'} == labels
+            ]
+        buckets = []
+        for key in keys:
+            sample_labels = self._labels[key][1]
+            _, values = self.timeline(node, bucket_name, window,
+                                      **sample_labels)
+            buckets.append((float(sample_labels['le']), increase(values)))
+        buckets = [
+            (bound, count) for bound, count in buckets if not math.isnan(count)
+        ]
+        if not buckets:
+            return math.nan
+        buckets.sort()
+        bounds, counts = zip(*buckets)
+        return bucket_quantile(q, bounds, counts)
+
+    def to_dict(self) -> typing.Dict:
+        """Returns the whole timeline of all nodes in a JSON-friendly dict."""
+
+        def listify(array):
+            return [None if math.isnan(v) else v for v in array.tolist()]
+
+        with self._lock:
+            return {
+                'interval':
+                    self.interval,
+                'nodes': [{
+                    'addr': ':'.join(map(str, node.rpc_addr())),
+                    'errors': errors,
+                    'timestamps': listify(buffer.times()),
+                    'series': {
+                        key: listify(buffer.values(key))
+                        for key in buffer.keys()
+                    },
+                }
+                          for node, errors, buffer in zip(
+                              self.nodes, self.errors, self._buffers)],
+            }
+
+    def dump(self, path: str) -> None:
+        """Writes the whole timeline of all nodes to a JSON file."""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        logger.info(f'Dumped metrics of {len(self.nodes)} nodes to {path}')
+
+    def log(self, window: typing.Optional[float] = None) -> None:
+        """Logs block and transaction rates and block processing times."""
+        for i, node in enumerate(self.nodes):
+            logger.info(
+                f'Node {":".join(map(str, node.rpc_addr()))}: '
+                f'{self._buffers[i].count} samples, {self.errors[i]} errors, '
+                f'blocks/s {self.rate(i, "near_block_processed", window):.2f}, '
+                f'txs/s {self.rate(i, "near_transaction_processed", window):.2f}, '
+                f'block processing time '
+                f'p50 {self.quantile(i, "near_block_processing_time", 0.5, window):.3f}s '
+                f'p99 {self.quantile(i, "near_block_processing_time", 0.99, window):.3f}s'
+            )
@@ -10,6 +10,7 @@ import base58
 import requests
 from rc import run, pmap, gcloud
 
+import chain_fetcher
 import data
 from cluster import GCloudNode
 from configured_logger import logger
@@ -219,69 +220,33 @@ def get_metrics(node):
     return Metrics.from_url(metrics_url)
 
 
-def get_timestamp(block):
-    return block['header']['timestamp'] / 1e9
-
-
-def get_chunk_txn(index, chunks, archival_node, result):
-    chunk = chunks[index]
-    chunk_hash = chunk['chunk_hash']
-    result[index] = len(
-        archival_node.get_chunk(chunk_hash)['result']['transactions'])
-
-
-# Measure bps and tps by directly checking block timestamps and number of transactions
-# in each block.
 def chain_measure_bps_and_tps(archival_node,
                               start_time,
                               end_time,
-                              duration=None):
-    latest_block_hash = archival_node.get_latest_block().hash
-    curr_block = archival_node.get_block(latest_block_hash)['result']
-    curr_time = get_timestamp(curr_block)
-
-    if end_time is None:
-        end_time = curr_time
-    if start_time is None:
-        start_time = end_time - duration
-    logger.info(
-        f'Measuring BPS and TPS in the time range {start_time} to {end_time}')
-
-    # One entry per block, equal to the timestamp of that block.
-    block_times = []
-    # One entry per block, containing the count of transactions in all chunks of the block.
-    tx_count = []
-    block_counter = 0
-    while curr_time > start_time:
-        if curr_time < end_time:
-            block_times.append(curr_time)
-            gas_per_chunk = []
-            for chunk in curr_block['chunks']:
-                gas_per_chunk.append(chunk['gas_used'] * 1e-12)
-            gas_block = sum(gas_per_chunk)
-            tx_per_chunk = [None] * len(curr_block['chunks'])
-            pmap(
-                lambda i: get_chunk_txn(i, curr_block['chunks'], archival_node,
-                                        tx_per_chunk),
-                range(len(curr_block['chunks'])))
-            txs = sum(tx_per_chunk)
-            tx_count.append(txs)
-            logger.info(
-                f'Processed block at time {curr_time} height #{curr_block["header"]["height"]}, # txs in a block: {txs}, per chunk: {tx_per_chunk}, gas in block: {gas_block}, gas per chunk: {gas_per_chunk}'
-            )
-        prev_hash = curr_block['header']['prev_hash']
-        curr_block = archival_node.get_block(prev_hash)['result']
-        curr_time = get_timestamp(curr_block)
-    block_times.reverse()
-    tx_count.reverse()
-    assert block_times
-    tx_cumulative = data.compute_cumulative(tx_count)
-    bps = data.compute_rate(block_times)
-    tps_fit = data.linear_regression(block_times, tx_cumulative)
+                              duration=None,
+                              window=60):
+    """Measures BPS and TPS of blocks produced between start and end time.
+
+    Block and chunk summaries are fetched concurrently by height range, see
+    `chain_fetcher.fetch_time_range`.  Rates over sliding windows of `window`
+    seconds are logged.
+    """
+    summary = chain_fetcher.fetch_time_range(archival_node,
+                                             start_time,
+                                             end_time,
+                                             duration=duration)
+    assert len(summary)
+    rates = summary.rates()
+    for row in summary.sliding_rates(window)[::10]:
+        logger.info(
+            f'Block #{row["height"]} at time {row["timestamp"]}, over the '
+            f'last {window}s bps: {row["bps"]}, tps: {row["tps"]}, '
+            f'Tgas/s: {row["gas_per_second"] * 1e-12}')
     logger.info(
-        f'Num blocks: {len(block_times)}, num transactions: {len(tx_count)}, bps: {bps}, tps_fit: {tps_fit}'
-    )
-    return {'bps': bps, 'tps': tps_fit['slope']}
+        f'Num blocks: {len(summary)}, skipped heights: {summary.skipped}, '
+        f'num transactions: {summary.tx_count.sum()}, bps: {rates["bps"]}, '
+        f'tps: {rates["tps"]}, Tgas/s: {rates["gas_per_second"] * 1e-12}')
+    return {'bps': rates['bps'], 'tps': rates['tps']}
 
 
 def get_tx_events_single_node(node, tx_filename):
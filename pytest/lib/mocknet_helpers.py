@@ -2,7 +2,7 @@
 import json
 import time
 import base58
-import requests
+import rpc_client
 from configured_logger import logger
 from key import Key
 
@@ -11,15 +11,15 @@ RPC_PORT = '3030'
 
 
 def get_status(addr=LOCAL_ADDR, port=RPC_PORT):
-    r = requests.get(f'http://{addr}:{port}/status', timeout=10)
-    r.raise_for_status()
-    return r.json()
+    return rpc_client.shared().get_status((addr, port), timeout=10)
 
 
 def json_rpc(method, params, addr=LOCAL_ADDR, port=RPC_PORT):
-    j = {'method': method, 'params': params, 'id': 'dontcare', 'jsonrpc': '2.0'}
-    r = requests.post(f'http://{addr}:{port}', json=j, timeout=10)
-    return r.json()
+    return rpc_client.shared().json_rpc((addr, port),
+                                        method,
+                                        params,
+                                        timeout=10,
+                                        check_status=False)
 
 
 def get_nonce_for_key(key: Key, **kwargs) -> int:
@@ -0,0 +1,205 @@
+"""Nonces of many access keys of a single account.
+
+Every transaction from an access key needs a nonce larger than the previous
+one so a single key serialises all senders: `stress.py` guards each
+account's nonce with a `multiprocessing.Lock`.  `NonceManager` instead
+spreads transactions of one account over many full access keys, added with
+`provision`, and hands out nonces round-robin from per-key counters.
+Allocation takes no locks: `next()` of an `itertools.count` is atomic, so
+any number of threads can send concurrently.  For processes, `split` gives
+each its own subset of the keys.
+
+When a node reports `InvalidNonce`, e.g. because a transaction was lost or
+another sender used the key, the key's counter is reset from the access key
+nonce in the error or, if missing, from `get_nonce_for_pk`.
+
+    manager = NonceManager.provision(node.signer_key, node, num_keys=16)
+    key, nonce = manager.next()
+    tx = transaction.sign_payment_tx(key, 'test1', 100, nonce, block_hash)
+"""
+
+import itertools
+import typing
+
+import base58
+
+import cluster
+import transaction
+from configured_logger import logger
+from key import Key
+
+# Maximum number of AddKey actions in a single transaction.
+MAX_KEYS_PER_TX = 100
+
+
+def invalid_nonce(response) -> typing.Optional[typing.Dict]:
+    """Returns InvalidNonce error details from a JSON-RPC response.
+
+    Returns None if the response is not an InvalidNonce error.  Otherwise
+    returns a dict which, depending on the node version, may hold `ak_nonce`,
+    the current nonce of the access key.
+    """
+
+    def find(value):
+        if isinstance(value, dict):
+            for name, nested in value.items():
+                if name == 'InvalidNonce':
+                    return nested if isinstance(nested, dict) else {}
+                found = find(nested)
+                if found is not None:
+                    return found
+        elif isinstance(value, list):
+            for nested in value:
+                found = find(nested)
+                if found is not None:
+                    return found
+        elif isinstance(value, str) and 'InvalidNonce' in value:
+            return {}
+        return None
+
+    if not isinstance(response, dict) or 'error' not in response:
+        return None
+    return find(response['error'])
+
+
+class _KeyNonces:
+    """Access key and the counter of its nonces."""
+
+    __slots__ = ('key', 'nonces')
+
+    def __init__(self, key, nonce):
+        self.key = key
+        self.nonces = itertools.count(nonce + 1)
+
+
+class NonceManager:
+    """Allocates nonces of many access keys of an account without locks.
+
+    Args:
+        keys: (Key, current nonce) pairs of access keys of one account.
+        node: Node queried for nonces when resynchronising.
+    """
+
+    def __init__(self, keys: typing.Sequence[typing.Tuple[Key, int]],
+                 node: cluster.BaseNode) -> None:
+        assert keys
+        assert len({key.account_id for key, _ in keys}) == 1, keys
+        self.account_id = keys[0][0].account_id
+        self.node = node
+        self._keys = [_KeyNonces(key, nonce) for key, nonce in keys]
+        self._by_pk = {entry.key.pk: entry for entry in self._keys}
+        self._next_key = itertools.count()
+
+    @classmethod
+    def provision(cls,
+                  account_key: Key,
+                  node: cluster.BaseNode,
+                  num_keys: int,
+                  *,
+                  timeout: float = 60) -> 'NonceManager':
+        """Adds `num_keys` new full access keys to the account.
+
+        The keys are added by transactions signed with `account_key`, with
+        up to MAX_KEYS_PER_TX AddKey actions each.  Returns manager of the new
+        keys.
+        """
+        keys = []
+        for _ in range(num_keys):
+            key = Key.implicit_account()
+            keys.append(Key(account_key.account_id, key.pk, key.sk))
+        nonce = node.get_nonce_for_pk(account_key.account_id, account_key.pk)
+        assert nonce is not None, account_key.pk
+        block_hash = base58.b58decode(
+            node.get_latest_block(check_storage=False).hash.encode('utf8'))
+        for i in range(0, num_keys, MAX_KEYS_PER_TX):
+            nonce += 1
+            actions = [
+                transaction.create_full_access_key_action(key.decoded_pk())
+                for key in keys[i:i + MAX_KEYS_PER_TX]
+            ]
+            tx = transaction.get_signer(account_key).sign(
+                account_key.account_id, nonce, actions, block_hash)
+            response = node.send_tx_and_wait(tx, timeout)
+            assert 'error' not in response, response
+            assert 'Failure' not in response['result']['status'], response
+
+        # Nonces of new keys are derived from the height of the block they
+        # were added in; read them all at once.
+        nonces = {
+            access_key['public_key']: access_key['access_key']['nonce']
+            for access_key in node.get_access_key_list(account_key.account_id)
+            ['result']['keys']
+        }
+        logger.info(f'Added {num_keys} access keys to '
+                    f'{account_key.account_id}')
+        return cls([(key, nonces[key.pk]) for key in keys], node)
+
+    @property
+    def keys(self) -> typing.List[Key]:
+        return [entry.key for entry in self._keys]
+
+    def next(self) -> typing.Tuple[Key, int]:
+        """Returns the next key, round-robin, and its next nonce."""
+        entry = self._keys[next(self._next_key) % len(self._keys)]
+        return entry.key, next(entry.nonces)
+
+    def split(self, parts: int) -> typing.List['NonceManager']:
+        """Divides the keys among `parts` managers, e.g. one per process."""
+        assert 0 < parts <= len(self._keys), parts
+        return [
+            NonceManager([(entry.key, self._current(entry))
+                          for entry in self._keys[i::parts]], self.node)
+            for i in range(parts)
+        ]
+
+    @staticmethod
+    def _current(entry):
+        # Peek at the counter without consuming a nonce.
+        nonce = next(entry.nonces)
+        entry.nonces = itertools.count(nonce)
+        return nonce - 1
+
+    def resync(self, key: Key, nonce: typing.Optional[int] = None) -> int:
+        """Resets key's counter so the next nonce follows `nonce`.
+
+        If `nonce` is None, the key's current nonce is fetched from the node.
+        Returns the nonce.
+        """
+        entry = self._by_pk[key.pk]
+        if nonce is None:
+            nonce = self.node.get_nonce_for_pk(key.account_id, key.pk)
+            assert nonce is not None, key.pk
+        # Nonces allocated from the old counter concurrently may be reused
+        # and rejected; that triggers another resync.
+        entry.nonces = itertools.count(nonce + 1)
+        logger.info(f'Resynchronised nonce of {key.pk} to {nonce}')
+        return nonce
+
+    def check(self, key: Key, response) -> bool:
+        """Resyncs key's nonce if the response is an InvalidNonce error.
+
+        Returns whether it was.
+        """
+        error = invalid_nonce(response)
+        if error is None:
+            return False
+        self.resync(key, error.get('ak_nonce'))
+        return True
+
+    def send_tx_and_wait(self,
+                         make_tx: typing.Callable[[Key, int], bytes],
+                         timeout: float = 20,
+                         attempts: int = 3):
+        """Sends transaction with broadcast_tx_commit.
+
+        `make_tx(key, nonce)` returns the signed transaction.  If it's
+        rejected with InvalidNonce, the nonce is resynchronised and the
+        transaction re-signed and resent, up to `attempts` times in total.
+        Returns the last response.
+        """
+        for _ in range(attempts):
+            key, nonce = self.next()
+            response = self.node.send_tx_and_wait(make_tx(key, nonce), timeout)
+            if not self.check(key, response):
+                break
+        return response
@@ -6,6 +6,7 @@ import struct
 import base58
 
 from configured_logger import logger
+from framing import FramedStream
 from messages import schema
 from messages.crypto import PublicKey, Signature
 from messages.network import (EdgeInfo, GenesisId, Handshake, PeerChainInfoV2,
@@ -23,20 +24,27 @@ class Connection:
                  writer: asyncio.StreamWriter):
         self.reader = reader
         self.writer = writer
+        self.stream = FramedStream(reader, writer)
         self.is_closed = False
 
+    @property
+    def stats(self):
+        """Returns framing.TransportStats of the connection."""
+        return self.stream.stats
+
     async def send(self, message):
-        raw_message = BinarySerializer(schema).serialize(message)
+        raw_message = BinarySerializer(schema, compiled=True).serialize(message)
         await self.send_raw(raw_message)
 
     async def send_raw(self, raw_message):
-        length = struct.pack('I', len(raw_message))
-        self.writer.write(length)
-        self.writer.write(raw_message)
-        await self.writer.drain()
+        await self.stream.send_frame(raw_message)
 
     # returns None on timeout
-    async def recv(self, expected=None):
+    #
+    # If `zero_copy` is set, byte fields of the returned message are memoryview
+    # slices of the received frame rather than copies; see
+    # `serializer.SchemaCodec`.
+    async def recv(self, expected=None, *, zero_copy=False):
         while True:
             response_raw = await self.recv_raw()
 
@@ -46,8 +54,10 @@ class Connection:
             # TODO(CP-85): when removing borsh support, fix this to use protobufs,
             # (or preferably reimplement the test in rust).
             try:
-                response = BinarySerializer(schema).deserialize(
-                    response_raw, PeerMessage)
+                response = BinarySerializer(schema,
+                                            compiled=True,
+                                            zero_copy=zero_copy).deserialize(
+                                                response_raw, PeerMessage)
             except IndexError:
                 # unparsable message, ignore.
                 continue
@@ -57,25 +67,13 @@ class Connection:
                 return response
 
     async def recv_raw(self):
-        length = await self.reader.read(4)
-
-        if len(length) == 0:
+        response = await self.stream.read_frame()
+        if response is None:
             self.is_closed = True
-            return None
-        else:
-            length = struct.unpack('I', length)[0]
-            response = b''
-
-            while len(response) < length:
-                response += await self.reader.read(length - len(response))
-                if len(response) < length:
-                    logger.info(f"Downloading message {len(response)}/{length}")
-
-            return response
+        return response
 
     async def close(self):
-        self.writer.close()
-        await self.writer.wait_closed()
+        await self.stream.close()
 
     def do_send(self, message):
         loop = asyncio.get_event_loop()
@@ -20,40 +20,77 @@
 # The proxy will register an atexit function that will gracefully shut down all the
 # processes, and fail the test if any of the processes failed.
 #
-# `start_cluster` accepts a handler as its last argument, and automatically proxifies
-# all the nodes if the parameter is not None
+# By default every proxified node gets its own process with its own event loop.
+# With NodesProxy(handler, workers=N) the listeners of all the nodes are instead
+# hosted by N shared event loops: a single thread inside of the test process if
+# N is 0, or N worker processes (node with ordinal `i` handled by worker
+# `i % N`) otherwise.  In those modes handlers get `proxy.state` as their
+# `state` attribute: a plain dict with workers=0 (the handlers and the test can
+# share any Python objects), a multiprocessing.Manager dict otherwise.  Note
+# that a handler blocking the event loop blocks messages of all the nodes
+# hosted by it.
+#
+# With NodesProxy(handler, collect_stats=True) the handlers additionally record
+# per message kind traffic statistics; see `proxy_stats` module.  With
+# NodesProxy(handler, capture=path) all intercepted frames are written to
+# a capture file which can be replayed later; see `proxy_capture` module.
+#
+# `start_cluster` accepts a handler (or a NodesProxy) as its last argument, and
+# automatically proxifies all the nodes if the parameter is not None
 #
 # See `tests/sanity/nodes_proxy.py` for an example usage
 
+import abc
 import asyncio
 import atexit
 import functools
 import multiprocessing
+import os
+import queue
 import random
 import select
+import shutil
 import socket
-import struct
+import tempfile
+import threading
 import time
 import logging
 
+import proxy_capture
+import proxy_stats
 from configured_logger import logger
+from framing import FramedStream, TransportStats
 from messages import schema
 from messages.crypto import PublicKey, Signature
-from messages.network import PeerIdOrHash, PeerMessage
-from serializer import BinarySerializer
+from messages.network import (PeerIdOrHash, PeerMessage, RoutedMessage,
+                              RoutedMessageBody)
+from serializer import BinarySerializer, compile_schema
 
 MSG_TIMEOUT = 10
 _MY_PORT = [None]
 
 logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
 
+# Value `ProxyHandler.handle` can return for messages it takes care of
+# delivering later itself (see `NetworkEmulationHandler`).  The proxy doesn't
+# forward such messages and doesn't count them as dropped.
+DEFERRED = object()
+
 
 def proxy_cleanup(proxy):
     logging.debug(f'Cleaning process for {_MY_PORT}')
     proxy.global_stopped.value = 1
+    if proxy.stats_dir is not None:
+        # Give the listeners time to notice they should stop and save final
+        # statistics.
+        time.sleep(1.5)
     for p in proxy.ps:
         p.terminate()
     logging.debug(f'Finish cleanup for {_MY_PORT}')
+    if proxy.stats_dir is not None:
+        for item in proxy.message_stats().summary():
+            logger.info(f'Proxy stats: {item}')
+        shutil.rmtree(proxy.stats_dir, ignore_errors=True)
     if proxy.error.value != 0:
         assert False, "One of the proxy processes failed, search for the stacktraces above"
 
@@ -62,13 +99,248 @@ def port_holder_to_node_ord(holder):
     return None if holder[0] is None else (holder[0] - 24477) % 100
 
 
+class UnparsableMessage(Exception):
+    """Raised when a lazily decoded message turns out not to be parsable."""
+
+
+# Types which are decoded lazily by LazyMessage views.  Laziness is possible
+# only for values which span till the end of the message (that is the
+# PeerMessage itself, the last field of a lazily decoded struct and the
+# payload of a lazily decoded enum) since the length of a value is not known
+# until it is decoded.
+_LAZY_TYPES = (PeerMessage, RoutedMessage, RoutedMessageBody)
+
+_IMMUTABLE_TYPES = (str, int, bytes, type(None))
+
+
+class LazyMessage(abc.ABC):
+    """A view of a Borsh-encoded message which is decoded on attribute access.
+
+    Handlers often look at the kind of the message only (e.g. `msg.enum` or
+    `msg.Routed.body.enum`) and let the message through.  Decoding (and then
+    re-encoding) the entire message in such case is wasteful, especially for
+    large blocks and chunks.  A lazy view decodes only as much of the raw
+    message as the handler inspects: the enum tag, the `Routed` header and
+    the body are decoded when first accessed.  Other values are fully decoded
+    into regular message objects.
+
+    A view remembers whether any mutable part of the message was handed out
+    or an attribute was assigned.  If not, `serialize` returns the original
+    raw bytes; otherwise the message is materialised into regular message
+    objects and serialised again.
+    """
+
+    __slots__ = ('_type', '_raw', '_pos', '_values', '_dirty')
+
+    def __init__(self, type_, raw, pos=0):
+        object.__setattr__(self, '_type', type_)
+        object.__setattr__(self, '_raw', raw)
+        object.__setattr__(self, '_pos', pos)
+        object.__setattr__(self, '_values', {})
+        object.__setattr__(self, '_dirty', False)
+
+    @staticmethod
+    def decode(raw, type_=PeerMessage, pos=0):
+        """Returns a lazy view of a message of given type.
+
+        Args:
+            raw: Raw message.  The value being decoded must span from `pos`
+                till the end of the buffer.
+            type_: Type of the message; it must be a struct or enum type
+                described by the `messages.schema`.
+            pos: Position in the raw message the value starts at.
+        """
+        if schema[type_]['kind'] == 'enum':
+            return LazyEnum(type_, raw, pos)
+        return LazyStruct(type_, raw, pos)
+
+    def __setattr__(self, name, value):
+        self._values[name] = value
+        object.__setattr__(self, '_dirty', True)
+
+    def __getattr__(self, name):
+        try:
+            value = self._values[name]
+        except KeyError:
+            value = self._decode(name)
+        if not isinstance(value, _IMMUTABLE_TYPES + (LazyMessage,)):
+            # Handler may modify the value so we can no longer assume the raw
+            # message is up to date.
+            object.__setattr__(self, '_dirty', True)
+        return value
+
+    @abc.abstractmethod
+    def _decode(self, name):
+        """Decodes and returns the value of given attribute.
+
+        Raises AttributeError if the message has no such attribute.
+        """
+
+    def _decode_tail(self, field_type, pos):
+        """Decodes value which spans till the end of the message."""
+        if field_type in _LAZY_TYPES:
+            return LazyMessage.decode(self._raw, field_type, pos)
+        try:
+            value, end = _CODEC.field_decoder(field_type)(self._raw, pos)
+        except IndexError as ex:
+            raise UnparsableMessage(str(ex)) from ex
+        assert end == len(self._raw), "%s != %s" % (end, len(self._raw))
+        return value
+
+    def is_dirty(self):
+        """Returns whether the view may differ from the raw message."""
+        return self._dirty or any(value.is_dirty()
+                                  for value in self._values.values()
+                                  if isinstance(value, LazyMessage))
+
+    @abc.abstractmethod
+    def materialize(self):
+        """Decodes the entire message into regular message objects."""
+
+    def serialize(self):
+        """Returns serialised message, reusing raw bytes if possible."""
+        if not self.is_dirty():
+            return self._raw[self._pos:] if self._pos else self._raw
+        return BinarySerializer(schema,
+                                compiled=True).serialize(self.materialize())
+
+
+class LazyEnum(LazyMessage):
+    """Lazy view of an enum; see `LazyMessage`."""
+
+    __slots__ = ()
+
+    @property
+    def tag_field(self):
+        return schema[self._type]['field']
+
+    @property
+    def tag(self):
+        """Ordinal of the variant of the enum."""
+        return self._raw[self._pos]
+
+    def _variant(self):
+        try:
+            return schema[self._type]['values'][self._raw[self._pos]]
+        except IndexError as ex:
+            raise UnparsableMessage(str(ex)) from ex
+
+    def is_decodable(self):
+        """Returns whether the schema describes the variant of the message.
+
+        Schema has placeholders for some variants which are not ported yet.
+        """
+        return self._variant()[1] is not None
+
+    def _decode(self, name):
+        variant_name, variant_type = self._variant()
+        if name == self.tag_field:
+            value = variant_name
+        elif name == variant_name:
+            if variant_type is None:
+                raise UnparsableMessage(
+                    f'{self._type.__name__}::{variant_name} not supported')
+            value = self._decode_tail(variant_type, self._pos + 1)
+        else:
+            raise AttributeError(name)
+        self._values[name] = value
+        return value
+
+    def materialize(self):
+        ret = self._type()
+        tag = getattr(self, self.tag_field)
+        value = getattr(self, tag)
+        if isinstance(value, LazyMessage):
+            value = value.materialize()
+        setattr(ret, self.tag_field, tag)
+        setattr(ret, tag, value)
+        return ret
+
+
+class LazyStruct(LazyMessage):
+    """Lazy view of a struct; see `LazyMessage`.
+
+    Fields are decoded in order up to the one being accessed.
+    """
+
+    __slots__ = ('_next_field', '_next_pos')
+
+    def __init__(self, type_, raw, pos=0):
+        super().__init__(type_, raw, pos)
+        object.__setattr__(self, '_next_field', 0)
+        object.__setattr__(self, '_next_pos', None)
+
+    def _decode(self, name):
+        fields = schema[self._type]['fields']
+        if name not in (field_name for field_name, _ in fields):
+            raise AttributeError(name)
+        pos = self._pos if self._next_pos is None else self._next_pos
+        idx = self._next_field
+        while idx < len(fields):
+            field_name, field_type = fields[idx]
+            idx += 1
+            if idx == len(fields):
+                value = self._decode_tail(field_type, pos)
+            else:
+                try:
+                    value, pos = _CODEC.field_decoder(field_type)(self._raw,
+                                                                  pos)
+                except IndexError as ex:
+                    raise UnparsableMessage(str(ex)) from ex
+            self._values.setdefault(field_name, value)
+            if field_name == name:
+                break
+        object.__setattr__(self, '_next_field', idx)
+        object.__setattr__(self, '_next_pos', pos)
+        return self._values[name]
+
+    def materialize(self):
+        ret = self._type()
+        for field_name, _ in schema[self._type]['fields']:
+            value = getattr(self, field_name)
+            if isinstance(value, LazyMessage):
+                value = value.materialize()
+            setattr(ret, field_name, value)
+        return ret
+
+
+_CODEC = compile_schema(schema)
+
+
+def serialize_message(message):
+    """Serialises a message object or a LazyMessage view."""
+    if isinstance(message, LazyMessage):
+        return message.serialize()
+    return BinarySerializer(schema, compiled=True).serialize(message)
+
+
 class ProxyHandler:
 
+    # Whether `handle` receives LazyMessage views which decode messages on
+    # attribute access rather than fully decoded PeerMessage objects.  Messages
+    # the handler lets through without inspecting their content are forwarded
+    # as is, without being decoded and encoded again.  Handlers which need
+    # real PeerMessage objects can set it to False.
+    lazy_decoding = True
+
+    # State shared by handlers of all the nodes; set by NodesProxy when it runs
+    # with shared event loops (see `workers` argument).
+    state = None
+
+    # proxy_stats.MessageStats the handler records messages in; set by
+    # NodesProxy if it collects statistics.
+    message_stats = None
+
+    # proxy_capture.CaptureWriter the handler records frames in; set by
+    # NodesProxy if it captures traffic.
+    capture = None
+
     def __init__(self, ordinal):
         self.ordinal = ordinal
         self.recv_from_map = {}
         self.send_to_map = {}
         self.loop = asyncio.get_event_loop()
+        self.transport_stats = TransportStats()
 
     @property
     def me(self):
@@ -83,18 +355,19 @@ class ProxyHandler:
 
     async def _handle(self, raw_message, *, writer, sender_port_holder,
                       receiver_port_holder, ordinal_to_writer):
+        started = time.perf_counter()
         sender_ordinal = port_holder_to_node_ord(sender_port_holder)
         receiver_ordinal = port_holder_to_node_ord(receiver_port_holder)
+        if self.capture is not None:
+            self._capture(raw_message, sender_ordinal, receiver_ordinal)
         try:
             # TODO(CP-85): when removing borsh support, fix this to use protobufs,
             # (or preferably reimplement the test in rust).
             try:
-                message = BinarySerializer(schema).deserialize(
-                    raw_message, PeerMessage)
-            except IndexError:
+                message = self._decode(raw_message)
+            except (IndexError, UnparsableMessage):
                 # unparsable message, ignore.
                 return
-            assert BinarySerializer(schema).serialize(message) == raw_message
 
             if message.enum == 'Handshake':
                 message.Handshake.listen_port += 100
@@ -106,16 +379,31 @@ class ProxyHandler:
             if other_ordinal is not None and not other_ordinal in ordinal_to_writer:
                 ordinal_to_writer[other_ordinal] = writer
 
+            handle_started = time.perf_counter()
             decision = await self.handle(message, sender_ordinal,
                                          receiver_ordinal)
+            handler_latency = time.perf_counter() - handle_started
+            deferred = decision is DEFERRED
+            if deferred:
+                decision = False
 
             if decision is True and message.enum == 'Handshake':
                 decision = message
 
             if not isinstance(decision, bool):
-                decision = BinarySerializer(schema).serialize(decision)
-
+                decision = serialize_message(decision)
+
+            if self.message_stats is not None:
+                msg_type = message.enum
+                body = message.Routed.body.enum if msg_type == 'Routed' else None
+                self._record(raw_message, sender_port_holder,
+                             receiver_port_holder, msg_type, body,
+                             decision is False and not deferred, started,
+                             handler_latency)
             return decision
+        except UnparsableMessage:
+            # The handler hit unparsable part of a lazily decoded message.
+            return
         except:
             # TODO: Remove this
             if raw_message[0] == 13:
@@ -132,8 +420,14 @@ class ProxyHandler:
                 # Skip if it's the ordinal of a variant for which the schema is not ported yet
                 if raw_message[ser.offset] in [3, 4, 5, 7]:
                     # Allow the handler determine if the message should be passed even when it couldn't be deserialized
-                    return await self.handle(None, sender_ordinal,
-                                             receiver_ordinal) is not False
+                    decision = await self.handle(None, sender_ordinal,
+                                                 receiver_ordinal) is not False
+                    if self.message_stats is not None:
+                        self._record(raw_message, sender_port_holder,
+                                     receiver_port_holder, 'Routed',
+                                     f'#{raw_message[ser.offset]}',
+                                     not decision, started, None)
+                    return decision
                 logger.info(f"ERROR 13 {int(raw_message[ser.offset])}")
 
             else:
@@ -143,6 +437,42 @@ class ProxyHandler:
 
         return True
 
+    def _capture(self, raw_message, sender_ordinal, receiver_ordinal):
+        body_tag = None
+        try:
+            message = LazyMessage.decode(raw_message)
+            if message.enum == 'Routed':
+                body_tag = message.Routed.body.tag
+        except (IndexError, UnparsableMessage):
+            pass
+        direction = (proxy_capture.INBOUND if receiver_ordinal == self.ordinal
+                     else proxy_capture.OUTBOUND)
+        self.capture.write(raw_message, direction, sender_ordinal,
+                           receiver_ordinal, body_tag)
+
+    def _record(self, raw_message, sender_port_holder, receiver_port_holder,
+                msg_type, body, dropped, started, handler_latency):
+        key = (port_holder_to_node_ord(sender_port_holder),
+               port_holder_to_node_ord(receiver_port_holder), msg_type, body)
+        self.message_stats.record(key, len(raw_message), dropped,
+                                  handler_latency,
+                                  time.perf_counter() - started)
+
+    def _decode(self, raw_message):
+        if not self.lazy_decoding:
+            message = BinarySerializer(schema, compiled=True).deserialize(
+                raw_message, PeerMessage)
+            assert BinarySerializer(
+                schema, compiled=True).serialize(message) == raw_message
+            return message
+        message = LazyMessage.decode(raw_message)
+        # Fail on messages whose kind isn’t ported to the schema yet the same
+        # way full decoding would so that they are handled below.
+        assert message.is_decodable(), message.enum
+        if message.enum == 'Routed':
+            assert message.Routed.body.is_decodable(), message.Routed.body.enum
+        return message
+
     def get_writer(self, to, fr=None):
         if to == self.ordinal:
             if fr is None and len(self.recv_from_map) > 0:
@@ -158,12 +488,10 @@ class ProxyHandler:
                 f"Writer not known: to={to}, fr={fr}, send={self.send_to_map.keys()}, recv={self.recv_from_map.keys()}"
             )
         else:
-            writer.write(struct.pack('I', len(raw_message)))
-            writer.write(raw_message)
-            await writer.drain()
+            await writer.send_frame(raw_message)
 
     async def send_message(self, message, to, fr=None):
-        raw_message = BinarySerializer(schema).serialize(message)
+        raw_message = serialize_message(message)
         await self.send_binary(raw_message, to, fr)
 
     def do_send_binary(self, raw_message, to, fr=None):
@@ -178,17 +506,128 @@ class ProxyHandler:
 
 class NodesProxy:
 
-    def __init__(self, handler):
+    def __init__(self,
+                 handler,
+                 *,
+                 workers=None,
+                 collect_stats=False,
+                 capture=None):
         assert handler is not None
+        assert workers is None or workers >= 0
         self.handler = handler
+        self.workers = workers
         self.global_stopped = multiprocessing.Value('i', 0)
         self.error = multiprocessing.Value('i', 0)
         self.ps = []
+        self.state = None
+        self.stats_dir = None
+        if collect_stats:
+            self.stats_dir = tempfile.mkdtemp(prefix='proxy-stats-')
+        self.capture = capture
+        if capture is not None:
+            proxy_capture.create(capture)
+        if workers is not None:
+            self._start_workers(workers)
         atexit.register(proxy_cleanup, self)
 
+    def _handler_ctr(self):
+        return functools.partial(_make_handler, self.handler, self.state,
+                                 self.stats_dir, self.capture)
+
+    def message_stats(self):
+        """Returns proxy_stats.MessageStats merged from all the handlers.
+
+        Handlers save their statistics every second so the result may miss
+        the most recent messages.
+        """
+        assert self.stats_dir is not None, 'collect_stats is not enabled'
+        return proxy_stats.load_dir(self.stats_dir)
+
+    def _start_workers(self, workers):
+        # Element `i` holds `local_stopped` of the node with ordinal `i`.
+        self._listener_states = multiprocessing.Array('i', [2] * 100)
+        if workers == 0:
+            self.state = {}
+            self._commands = [queue.Queue()]
+        else:
+            self._manager = multiprocessing.Manager()
+            self.state = self._manager.dict()
+            self._commands = [multiprocessing.Queue() for _ in range(workers)]
+        handler_ctr = self._handler_ctr()
+        for commands in self._commands:
+            args = (commands, handler_ctr, self.global_stopped, self.error,
+                    self._listener_states)
+            if workers == 0:
+                threading.Thread(target=serve_nodes, args=args,
+                                 daemon=True).start()
+            else:
+                p = multiprocessing.Process(target=serve_nodes, args=args)
+                p.start()
+                self.ps.append(p)
+
     def proxify_node(self, node):
-        proxify_node(node, self.ps, self.handler, self.global_stopped,
-                     self.error, self)
+        if self.workers is None:
+            proxify_node(node, self.ps, self._handler_ctr(),
+                         self.global_stopped, self.error, self)
+            return
+
+        inner_port = node.port
+        outer_port = inner_port + 100
+        ordinal = port_holder_to_node_ord([outer_port])
+        commands = self._commands[ordinal % len(self._commands)]
+
+        def start_proxy():
+            local_stopped = _ArrayItem(self._listener_states, ordinal)
+            local_stopped.value = -1
+            commands.put((inner_port, outer_port))
+            wait_for_proxy_start(local_stopped, self.error)
+            return local_stopped
+
+        node.port = outer_port
+        node._start_proxy = start_proxy
+        node.proxy = self
+
+
+def _make_handler(handler_ctr, state, stats_dir, capture, ordinal):
+    handler = handler_ctr(ordinal)
+    handler.state = state
+    if capture is not None:
+        handler.capture = proxy_capture.CaptureWriter(capture, ordinal)
+    if stats_dir is not None:
+        handler.message_stats = proxy_stats.MessageStats()
+        fd, handler.stats_path = tempfile.mkstemp(suffix='.json',
+                                                  prefix=f'{ordinal}-',
+                                                  dir=stats_dir)
+        os.close(fd)
+        handler.message_stats.save(handler.stats_path)
+    return handler
+
+
+async def save_stats_periodically(handler):
+    saved_updates = 0
+    while True:
+        await asyncio.sleep(1)
+        if saved_updates != handler.message_stats.updates:
+            saved_updates = handler.message_stats.updates
+            handler.message_stats.save(handler.stats_path)
+
+
+class _ArrayItem:
+    """Element of a multiprocessing.Array with a multiprocessing.Value interface."""
+
+    __slots__ = ('array', 'index')
+
+    def __init__(self, array, index):
+        self.array = array
+        self.index = index
+
+    @property
+    def value(self):
+        return self.array[self.index]
+
+    @value.setter
+    def value(self, value):
+        self.array[self.index] = value
 
 
 async def stop_server(server):
@@ -209,15 +648,6 @@ def check_finish(server, global_stopped, local_stopped, error):
         local_stopped.value = 2
 
 
-async def _read_exact(reader, length, *, allow_eof=False):
-    """Reads exactly `length` bytes from reader."""
-    data = await reader.read(length)
-    if data or not allow_eof:
-        while len(data) < length:
-            data += await reader.read(length - len(data))
-    return data
-
-
 async def bridge(reader, writer, handler_fn, global_stopped, local_stopped,
                  bridge_stopped, error):
     bridge_id = random.randint(0, 10**10)
@@ -226,16 +656,13 @@ async def bridge(reader, writer, handler_fn, global_stopped, local_stopped,
     try:
         while 0 == global_stopped.value and 0 >= local_stopped.value and 0 == error.value and 0 == bridge_stopped[
                 0]:
-            header = await _read_exact(reader, 4, allow_eof=True)
-            if not header:
+            raw_message = await reader.read_frame()
+            if raw_message is None:
                 logging.debug(
                     f"Endpoint closed (Reader). port={_MY_PORT} bridge_id={bridge_id}"
                 )
                 break
 
-            raw_message_len = struct.unpack('I', header)[0]
-            raw_message = await _read_exact(reader, raw_message_len)
-
             logging.debug(
                 f"Message size={len(raw_message)} port={_MY_PORT} bridge_id={bridge_id}"
             )
@@ -246,21 +673,17 @@ async def bridge(reader, writer, handler_fn, global_stopped, local_stopped,
                 decision = True
 
             if decision:
-                writer.write(struct.pack('I', len(raw_message)))
-                writer.write(raw_message)
-                await writer.drain()
+                await writer.send_frame(raw_message)
 
         bridge_stopped[0] = 1
-        writer.close()
-        await writer.wait_closed()
+        await writer.close()
 
         logging.debug(
             f"Gracefully close bridge. port={_MY_PORT} bridge_id={bridge_id}")
-    except (ConnectionResetError, BrokenPipeError):
+    except (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError):
         bridge_stopped[0] = 1
         try:
-            writer.close()
-            await writer.wait_closed()
+            await writer.close()
         except:
             pass
         logging.debug(
@@ -275,26 +698,32 @@ async def handle_connection(outer_reader, outer_writer, inner_port, outer_port,
     try:
         inner_reader, inner_writer = await asyncio.open_connection(
             '127.0.0.1', inner_port)
+        inner = FramedStream(inner_reader,
+                             inner_writer,
+                             stats=handler.transport_stats)
+        outer = FramedStream(outer_reader,
+                             outer_writer,
+                             stats=handler.transport_stats)
 
         my_port = [outer_port]
         peer_port_holder = [None]
         bridge_stopped = [0]
 
         inner_to_outer = bridge(
-            inner_reader, outer_writer,
+            inner, outer,
             functools.partial(
                 handler._handle,
-                writer=inner_writer,
+                writer=inner,
                 sender_port_holder=my_port,
                 receiver_port_holder=peer_port_holder,
                 ordinal_to_writer=handler.recv_from_map,
             ), global_stopped, local_stopped, bridge_stopped, error)
 
         outer_to_inner = bridge(
-            outer_reader, inner_writer,
+            outer, inner,
             functools.partial(
                 handler._handle,
-                writer=outer_writer,
+                writer=outer,
                 sender_port_holder=peer_port_holder,
                 receiver_port_holder=my_port,
                 ordinal_to_writer=handler.send_to_map,
@@ -325,8 +754,11 @@ async def handle_connection(outer_reader, outer_writer, inner_port, outer_port,
 async def listener(inner_port, outer_port, handler_ctr, global_stopped,
                    local_stopped, error):
     logging.debug(f"Starting listener... port={_MY_PORT}")
+    handler = None
     try:
         handler = handler_ctr(port_holder_to_node_ord([outer_port]))
+        if handler.message_stats is not None:
+            asyncio.create_task(save_stats_periodically(handler))
 
         async def start_connection(reader, writer):
             await handle_connection(reader, writer, inner_port, outer_port,
@@ -368,6 +800,11 @@ async def listener(inner_port, outer_port, handler_ctr, global_stopped,
         )
         error.value = 1
         raise
+    finally:
+        if handler is not None and handler.message_stats is not None:
+            handler.message_stats.save(handler.stats_path)
+        if handler is not None and handler.capture is not None:
+            handler.capture.close()
 
 
 def start_server(inner_port, outer_port, handler_ctr, global_stopped,
@@ -378,6 +815,46 @@ def start_server(inner_port, outer_port, handler_ctr, global_stopped,
                  local_stopped, error))
 
 
+def serve_nodes(commands, handler_ctr, global_stopped, error, listener_states):
+    """Runs listeners of many nodes in one event loop.
+
+    Listeners are started on `(inner_port, outer_port)` requests read from the
+    `commands` queue and stop the same way as with separate processes.  Returns
+    once the proxy is stopped or fails.
+    """
+    asyncio.run(
+        _serve_nodes(commands, handler_ctr, global_stopped, error,
+                     listener_states))
+
+
+async def _serve_nodes(commands, handler_ctr, global_stopped, error,
+                       listener_states):
+    loop = asyncio.get_running_loop()
+    listeners = set()
+    while 0 == global_stopped.value and 0 == error.value:
+        try:
+            inner_port, outer_port = await loop.run_in_executor(
+                None, commands.get, True, 1)
+        except queue.Empty:
+            continue
+        local_stopped = _ArrayItem(listener_states,
+                                   port_holder_to_node_ord([outer_port]))
+        task = loop.create_task(
+            listener(inner_port, outer_port, handler_ctr, global_stopped,
+                     local_stopped, error))
+        listeners.add(task)
+        task.add_done_callback(listeners.discard)
+
+
+def wait_for_proxy_start(local_stopped, error):
+    deadline = time.monotonic() + 3
+    while local_stopped.value != 0:
+        if time.monotonic() > deadline:
+            error.value = 1
+            assert False, "The proxy failed to start after 3 seconds"
+        time.sleep(0.05)
+
+
 def proxify_node(node, ps, handler, global_stopped, error, proxy):
     inner_port = node.port
     outer_port = inner_port + 100
@@ -394,13 +871,7 @@ def proxify_node(node, ps, handler, global_stopped, error, proxy):
                                           global_stopped, local_stopped, error))
         p.start()
         ps.append(p)
-        for attempt in range(3):
-            if local_stopped.value == 0:
-                break
-            time.sleep(1)
-        else:
-            error.value = 1
-            assert False, "The proxy failed to start after 3 seconds"
+        wait_for_proxy_start(local_stopped, error)
         return local_stopped
 
     node.port = outer_port
@@ -0,0 +1,226 @@
+"""Capture of traffic passing through the proxy and its replay.
+
+With `NodesProxy(handler, capture=path)` every frame the proxy intercepts is
+appended to a capture file.  The file starts with an 8-byte magic followed by
+records, each made of a `RECORD_HEADER` and the raw frame:
+
+    u32 frame length
+    f64 Unix timestamp at which the proxy received the frame
+    u8  direction: INBOUND (to the proxified node) or OUTBOUND (from it)
+    i8  ordinal of the proxified node
+    i8  ordinal of the sender, -1 if not known
+    i8  ordinal of the receiver, -1 if not known
+    u8  PeerMessage variant
+    u8  RoutedMessageBody variant for Routed messages, 255 otherwise
+    ... frame
+
+All proxy processes append to the same file; each record is written with
+a single `writev` on a file opened with O_APPEND so records don't interleave.
+A record cut short by a killed process ends the capture.
+
+`CaptureReader` memory-maps the file, indexes records by message kind and
+yields frames as memoryviews without copying.  `replay` sends frames back to
+a node through `peer.Connection` at original or accelerated pace.
+"""
+
+import asyncio
+import collections
+import mmap
+import os
+import struct
+import time
+import typing
+
+from nacl.signing import SigningKey
+
+import peer
+from messages import schema
+from messages.network import PeerMessage, RoutedMessageBody
+
+MAGIC = b'NEARCAP1'
+RECORD_HEADER = struct.Struct('<IdBbbbBB')
+
+INBOUND = 0
+OUTBOUND = 1
+
+_NO_BODY = 255
+
+
+class Record(typing.NamedTuple):
+    offset: int
+    timestamp: float
+    direction: int
+    node: int
+    sender: typing.Optional[int]
+    receiver: typing.Optional[int]
+    type: str
+    body: typing.Optional[str]
+    frame: memoryview
+
+
+def create(path):
+    """Creates an empty capture file, truncating existing one."""
+    with open(path, 'wb') as wr:
+        wr.write(MAGIC)
+
+
+class CaptureWriter:
+    """Appends records of frames seen by a single proxy handler."""
+
+    def __init__(self, path, node):
+        self.node = node
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+
+    def write(self, frame, direction, sender, receiver, body_tag=None):
+        header = RECORD_HEADER.pack(len(frame), time.time(), direction,
+                                    self.node, -1 if sender is None else sender,
+                                    -1 if receiver is None else receiver,
+                                    frame[0] if frame else _NO_BODY,
+                                    _NO_BODY if body_tag is None else body_tag)
+        os.writev(self.fd, (header, frame))
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def _variant_name(type_, tag):
+    values = schema[type_]['values']
+    return values[tag][0] if tag < len(values) else f'#{tag}'
+
+
+def _kind(type_tag, body_tag):
+    body = None
+    if body_tag != _NO_BODY:
+        body = _variant_name(RoutedMessageBody, body_tag)
+    return _variant_name(PeerMessage, type_tag), body
+
+
+class CaptureReader:
+    """Reads capture file through a memory map."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as rd:
+            self._mmap = mmap.mmap(rd.fileno(), 0, access=mmap.ACCESS_READ)
+        assert self._mmap[:len(MAGIC)] == MAGIC, f'{path} is not a capture'
+        self._view = memoryview(self._mmap)
+        self._index = None
+
+    def close(self):
+        """Unmaps the file.
+
+        Frames of returned records are views into the mapped file.  If any of
+        them is still referenced, the file is unmapped once they are garbage
+        collected.
+        """
+        self._index = None
+        try:
+            self._view.release()
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _offsets(self):
+        pos = len(MAGIC)
+        end = len(self._mmap)
+        while pos + RECORD_HEADER.size <= end:
+            length = RECORD_HEADER.unpack_from(self._mmap, pos)[0]
+            if pos + RECORD_HEADER.size + length > end:
+                break
+            yield pos
+            pos += RECORD_HEADER.size + length
+
+    def record_at(self, offset):
+        (length, timestamp, direction, node, sender, receiver, type_tag,
+         body_tag) = RECORD_HEADER.unpack_from(self._mmap, offset)
+        start = offset + RECORD_HEADER.size
+        msg_type, body = _kind(type_tag, body_tag)
+        return Record(offset=offset,
+                      timestamp=timestamp,
+                      direction=direction,
+                      node=node,
+                      sender=None if sender < 0 else sender,
+                      receiver=None if receiver < 0 else receiver,
+                      type=msg_type,
+                      body=body,
+                      frame=self._view[start:start + length])
+
+    def index(self):
+        """Returns offsets of records keyed by (message kind, body kind)."""
+        if self._index is None:
+            index = collections.defaultdict(list)
+            for offset in self._offsets():
+                tags = RECORD_HEADER.unpack_from(self._mmap, offset)[-2:]
+                index[tags].append(offset)
+            self._index = {
+                _kind(*tags): offsets for tags, offsets in index.items()
+            }
+        return self._index
+
+    def records(self, *, types=None, node=None, direction=None):
+        """Yields records in the order they were written.
+
+        Args:
+            types: If given, only records whose message kind or
+                (message kind, body kind) pair is in the collection are
+                returned, e.g. `{'Block', ('Routed', 'ForwardTx')}`.
+            node: If given, only records seen by proxy of that node.
+            direction: If given, only records going in that direction.
+        """
+        if types is None:
+            offsets = self._offsets()
+        else:
+            offsets = sorted(offset for key, offsets in self.index().items()
+                             if key in types or key[0] in types
+                             for offset in offsets)
+        for offset in offsets:
+            record = self.record_at(offset)
+            if node is not None and record.node != node:
+                continue
+            if direction is not None and record.direction != direction:
+                continue
+            yield record
+
+
+async def replay(conn, records, *, speed=1.0):
+    """Sends frames of the records over the connection.
+
+    Args:
+        conn: peer.Connection to send the frames over.
+        records: Records to replay, in order.
+        speed: How many times faster than originally recorded to send the
+            frames.  If None, frames are sent as fast as possible.
+    Returns:
+        Number of frames sent.
+    """
+    count = 0
+    start = first = None
+    for record in records:
+        if speed is not None:
+            if first is None:
+                start, first = time.monotonic(), record.timestamp
+            due = start + (record.timestamp - first) / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await conn.send_raw(record.frame)
+        count += 1
+    return count
+
+
+async def replay_to_node(node, records, *, speed=1.0, key_pair=None):
+    """Connects to the node, performs a handshake and replays the records."""
+    conn = await peer.connect(node.addr())
+    await peer.run_handshake(conn, node.node_key.pk, key_pair or
+                             SigningKey.generate())
+    try:
+        return await replay(conn, records, speed=speed)
+    finally:
+        await conn.close()
@@ -1,4 +1,5 @@
-import logging, multiprocessing, random
+import heapq, logging, multiprocessing, random
+import proxy
 from proxy import ProxyHandler, NodesProxy
 
 
@@ -40,3 +41,156 @@ class RejectListProxy(NodesProxy):
     @staticmethod
     def create_reject_list(size):
         return multiprocessing.Array('i', [-1 for _ in range(size)])
+
+
+class LinkProfile:
+    """Properties of an emulated one-way network link.
+
+    Args:
+        delay: One-way delay in seconds.  Either a number or a callable
+            returning a sample of the delay distribution, e.g.
+            `lambda: random.lognormvariate(-3, 0.5)`.
+        jitter: Standard deviation, in seconds, of normally distributed noise
+            added to the delay.  The resulting delay is never negative.
+        bandwidth: Link capacity in bytes per second or None for unlimited.
+            Messages are queued behind the ones still being transmitted.
+        queue_limit: Maximum number of bytes queued for transmission on the
+            link when bandwidth is limited; messages which don't fit are
+            dropped.  None for unlimited.
+        reorder: Whether messages can overtake each other if their delays
+            differ.  If False, a message is never delivered before one sent
+            earlier over the same link.
+        loss: Probability of a message being dropped.
+    """
+
+    def __init__(self,
+                 delay=0.0,
+                 *,
+                 jitter=0.0,
+                 bandwidth=None,
+                 queue_limit=None,
+                 reorder=False,
+                 loss=0.0):
+        self.delay = delay
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.queue_limit = queue_limit
+        self.reorder = reorder
+        self.loss = loss
+
+    def sample_delay(self):
+        delay = self.delay() if callable(self.delay) else self.delay
+        if self.jitter:
+            delay += random.gauss(0, self.jitter)
+        return max(delay, 0.0)
+
+
+class EmulatedLink:
+    """State of a single emulated link: its transmission queue and ordering."""
+
+    def __init__(self, profile):
+        self.profile = profile
+        # Time at which the link finishes transmitting queued messages.
+        self.busy_until = 0.0
+        # Delivery time of the last message sent over the link.
+        self.last_arrival = 0.0
+
+    def schedule(self, size, now):
+        """Returns delivery time of a message sent at `now` or None to drop it."""
+        profile = self.profile
+        if profile.loss and random.uniform(0, 1) < profile.loss:
+            return None
+        sent = now
+        if profile.bandwidth:
+            start = max(now, self.busy_until)
+            queued = (start - now) * profile.bandwidth
+            limit = profile.queue_limit
+            if limit is not None and queued + size > limit:
+                return None
+            sent = self.busy_until = start + size / profile.bandwidth
+        arrival = sent + profile.sample_delay()
+        if not profile.reorder:
+            arrival = max(arrival, self.last_arrival)
+        self.last_arrival = max(arrival, self.last_arrival)
+        return arrival
+
+
+class NetworkEmulationHandler(ProxyHandler):
+    """Handler which delays messages according to per link profiles.
+
+    `links` maps `(from, to)` node ordinals to LinkProfile; links not listed
+    use `default` profile or are not shaped if it's None.  Messages of shaped
+    links are held in a single per-handler queue ordered by delivery time and
+    sent from a timer callback on the proxy event loop, so a delayed message
+    doesn't hold up the connection it arrived on.  Handshakes and messages
+    whose sender or receiver isn't known pass through unchanged.
+
+    Use with `start_cluster` via `functools.partial`, e.g.:
+
+        handler = functools.partial(NetworkEmulationHandler,
+                                    default=LinkProfile(0.05, jitter=0.01),
+                                    links={(0, 1): LinkProfile(bandwidth=1e6)})
+        start_cluster(..., message_handler=handler)
+
+    Subclasses can override `handle` and call `super().handle` for messages
+    which should go through the emulated network.
+    """
+
+    def __init__(self, ordinal, *, default=None, links=None):
+        super().__init__(ordinal)
+        self.default = default
+        self.profiles = dict(links or {})
+        self.links = {}
+        # Heap of (delivery time, sequence number, raw message, to, fr).
+        self.queue = []
+        self.sequence = 0
+        self.timer = None
+
+    def get_link(self, fr, to):
+        link = self.links.get((fr, to))
+        if link is None:
+            profile = self.profiles.get((fr, to), self.default)
+            if profile is None:
+                return None
+            link = self.links[(fr, to)] = EmulatedLink(profile)
+        return link
+
+    async def handle(self, msg, fr, to):
+        if msg is None or fr is None or to is None or msg.enum == 'Handshake':
+            return True
+        link = self.get_link(fr, to)
+        if link is None:
+            return True
+        raw_message = proxy.serialize_message(msg)
+        arrival = link.schedule(len(raw_message), self.loop.time())
+        if arrival is None:
+            logging.debug(
+                f'NODE {self.ordinal} dropping message {msg.enum} from {fr} to {to}'
+            )
+            return False
+        heapq.heappush(self.queue,
+                       (arrival, self.sequence, raw_message, to, fr))
+        self.sequence += 1
+        if self.queue[0][0] == arrival:
+            self._schedule_delivery()
+        return proxy.DEFERRED
+
+    def _schedule_delivery(self):
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = self.loop.call_at(self.queue[0][0], self._deliver)
+
+    def _deliver(self):
+        self.timer = None
+        now = self.loop.time()
+        while self.queue and self.queue[0][0] <= now:
+            _, _, raw_message, to, fr = heapq.heappop(self.queue)
+            writer = self.get_writer(to, fr)
+            if writer is None:
+                logging.info(
+                    f'NODE {self.ordinal} no connection to deliver message from {fr} to {to}'
+                )
+            else:
+                writer.write_frame(raw_message)
+        if self.queue:
+            self._schedule_delivery()
@@ -0,0 +1,251 @@
+"""Per-message-type traffic statistics collected by the proxy.
+
+With `NodesProxy(handler, collect_stats=True)` every proxy handler records,
+for each `(sender, receiver, PeerMessage kind, RoutedMessageBody kind)`, the
+number and total size of messages, how many of them were dropped, and
+histograms of the time spent in `ProxyHandler.handle` and of the whole time
+the proxy held the message (decoding, handling and re-encoding).
+
+Each handler periodically saves its `MessageStats` to a JSON file in a
+directory shared by all proxy processes; `NodesProxy.message_stats` merges
+them.  The result can be exported as Prometheus text format or summarised as
+JSON.
+"""
+
+import bisect
+import json
+import os
+import typing
+
+# Upper bounds, in seconds, of latency histogram buckets.  The last, implicit
+# bucket is +Inf.
+LATENCY_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+                   1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """Latency histogram with fixed LATENCY_BUCKETS buckets."""
+
+    __slots__ = ('buckets', 'sum', 'count')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other.buckets):
+            self.buckets[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q):
+        """Returns upper bound of the bucket containing q-th quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            total += count
+            if total >= rank:
+                return bound
+        return float('inf')
+
+    def to_dict(self):
+        return {'buckets': self.buckets, 'sum': self.sum, 'count': self.count}
+
+    @classmethod
+    def from_dict(cls, data):
+        ret = cls()
+        ret.buckets = list(data['buckets'])
+        ret.sum = data['sum']
+        ret.count = data['count']
+        return ret
+
+
+class MessageTypeStats:
+    """Statistics of messages of a single kind sent over a single link."""
+
+    __slots__ = ('count', 'bytes', 'dropped', 'handler_latency',
+                 'processing_latency')
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.handler_latency = Histogram()
+        self.processing_latency = Histogram()
+
+    def merge(self, other):
+        self.count += other.count
+        self.bytes += other.bytes
+        self.dropped += other.dropped
+        self.handler_latency.merge(other.handler_latency)
+        self.processing_latency.merge(other.processing_latency)
+
+
+# (sender ordinal, receiver ordinal, PeerMessage kind, RoutedMessageBody kind)
+# Ordinals are None if not known and body kind is None for messages other
+# than Routed.
+Key = typing.Tuple[typing.Optional[int], typing.Optional[int], str,
+                   typing.Optional[str]]
+
+
+class MessageStats:
+    """Message statistics keyed by `Key`."""
+
+    def __init__(self):
+        self.entries: typing.Dict[Key, MessageTypeStats] = {}
+        # Number of recorded messages; lets callers skip saving unchanged
+        # statistics.
+        self.updates = 0
+
+    def record(self, key: Key, size, dropped, handler_latency,
+               processing_latency):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = MessageTypeStats()
+        entry.count += 1
+        entry.bytes += size
+        entry.dropped += dropped
+        if handler_latency is not None:
+            entry.handler_latency.observe(handler_latency)
+        entry.processing_latency.observe(processing_latency)
+        self.updates += 1
+
+    def merge(self, other):
+        for key, other_entry in other.entries.items():
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = MessageTypeStats()
+            entry.merge(other_entry)
+        self.updates += other.updates
+
+    def to_dict(self):
+        return {
+            'messages': [{
+                'sender': key[0],
+                'receiver': key[1],
+                'type': key[2],
+                'body': key[3],
+                'count': entry.count,
+                'bytes': entry.bytes,
+                'dropped': entry.dropped,
+                'handler_latency': entry.handler_latency.to_dict(),
+                'processing_latency': entry.processing_latency.to_dict(),
+            } for key, entry in self.entries.items()]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        ret = cls()
+        for item in data['messages']:
+            entry = MessageTypeStats()
+            entry.count = item['count']
+            entry.bytes = item['bytes']
+            entry.dropped = item['dropped']
+            entry.handler_latency = Histogram.from_dict(item['handler_latency'])
+            entry.processing_latency = Histogram.from_dict(
+                item['processing_latency'])
+            key = (item['sender'], item['receiver'], item['type'], item['body'])
+            ret.entries[key] = entry
+            ret.updates += entry.count
+        return ret
+
+    def save(self, path):
+        """Atomically writes the statistics to a JSON file."""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as wr:
+            json.dump(self.to_dict(), wr)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as rd:
+            return cls.from_dict(json.load(rd))
+
+    def summary(self):
+        """Returns JSON-serialisable statistics aggregated over all links.
+
+        The list is sorted by total size of the messages, largest first.
+        Latencies are in seconds and are upper bounds of histogram buckets.
+        """
+        by_type = {}
+        for (_, _, msg_type, body), entry in self.entries.items():
+            total = by_type.get((msg_type, body))
+            if total is None:
+                total = by_type[(msg_type, body)] = MessageTypeStats()
+            total.merge(entry)
+        ret = []
+        for (msg_type, body), entry in by_type.items():
+            item = {
+                'type': msg_type,
+                'body': body,
+                'count': entry.count,
+                'bytes': entry.bytes,
+                'dropped': entry.dropped,
+            }
+            for name in ('handler_latency', 'processing_latency'):
+                histogram = getattr(entry, name)
+                item[name + '_p50'] = histogram.quantile(0.5)
+                item[name + '_p99'] = histogram.quantile(0.99)
+            ret.append(item)
+        ret.sort(key=lambda item: item['bytes'], reverse=True)
+        return ret
+
+    def to_prometheus(self):
+        """Returns the statistics in Prometheus text exposition format."""
+        lines = []
+
+        def labels(key, **extra):
+            names = ('sender', 'receiver', 'type', 'body')
+            values = [(name, value) for name, value in zip(names, key)]
+            values.extend(extra.items())
+            return ','.join(f'{name}="{"" if value is None else value}"'
+                            for name, value in values)
+
+        for name, attr, help in (
+            ('near_proxy_messages_total', 'count', 'Number of messages'),
+            ('near_proxy_message_bytes_total', 'bytes',
+             'Total size of messages'),
+            ('near_proxy_messages_dropped_total', 'dropped',
+             'Number of messages dropped by the proxy'),
+        ):
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} counter')
+            for key, entry in self.entries.items():
+                lines.append(f'{name}{{{labels(key)}}} {getattr(entry, attr)}')
+
+        for name, attr, help in (
+            ('near_proxy_handler_latency_seconds', 'handler_latency',
+             'Time spent in the proxy handler'),
+            ('near_proxy_processing_latency_seconds', 'processing_latency',
+             'Time the message was held by the proxy'),
+        ):
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} histogram')
+            for key, entry in self.entries.items():
+                histogram = getattr(entry, attr)
+                total = 0
+                bounds = [repr(float(b)) for b in LATENCY_BUCKETS] + ['+Inf']
+                for bound, count in zip(bounds, histogram.buckets):
+                    total += count
+                    lines.append(
+                        f'{name}_bucket{{{labels(key, le=bound)}}} {total}')
+                lines.append(f'{name}_sum{{{labels(key)}}} {histogram.sum}')
+                lines.append(f'{name}_count{{{labels(key)}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def load_dir(path):
+    """Merges statistics saved in all JSON files in given directory."""
+    ret = MessageStats()
+    for name in os.listdir(path):
+        if name.endswith('.json'):
+            ret.merge(MessageStats.load(os.path.join(path, name)))
+    return ret
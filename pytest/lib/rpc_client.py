@@ -0,0 +1,377 @@
+"""JSON-RPC client keeping connections to nodes alive.
+
+`requests.post` opens a new TCP connection for every call which dominates the
+cost of the small status and block queries tests issue in tight loops.
+`AsyncRpcClient` sends requests over a pool of keep-alive aiohttp connections
+and lets many of them be in flight at once; `RpcClient` runs it on a
+background event loop thread so it can be used from synchronous code.
+`BaseNode` and `mocknet_helpers` use the process-wide client returned by
+`shared()`.
+
+`json_rpc_batch` sends many calls as JSON-RPC 2.0 batch arrays so a bulk
+chain walk needs a fraction of the round trips.  Servers which reject batches
+are remembered and sent the calls as concurrent individual requests instead.
+Batches failing otherwise, e.g. timing out, are retried a few times and then
+sent as individual requests, which report the error if it persists.
+
+Errors are reported with `requests.exceptions` types so code catching them
+keeps working: `ConnectionError` if the node could not be reached, `ReadTimeout`
+if it did not respond in time and `HTTPError` for error HTTP statuses.
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import threading
+import typing
+import weakref
+
+import aiohttp
+import requests
+
+# Maximum number of connections, and thus requests in flight, per client.
+DEFAULT_CONCURRENCY = 32
+DEFAULT_TIMEOUT = 10
+# Maximum number of calls sent in a single batch request.  Larger batches are
+# split and the parts sent concurrently.
+MAX_BATCH_SIZE = 100
+# Number of times a batch failing other than by being rejected is retried.
+BATCH_RETRIES = 2
+
+# (host, port) address of a node's RPC server as returned by `rpc_addr()`.
+Addr = typing.Tuple[str, typing.Union[int, str]]
+# (method, params) of a JSON-RPC call.
+Call = typing.Tuple[str, typing.Any]
+
+
+def _url(addr: Addr, path=''):
+    return f'http://{addr[0]}:{addr[1]}{path}'
+
+
+def _request(method, params, id='dontcare'):
+    return {'method': method, 'params': params, 'id': id, 'jsonrpc': '2.0'}
+
+
+class AsyncRpcClient:
+    """Sends JSON-RPC requests over a pool of keep-alive connections."""
+
+    def __init__(self, *, concurrency: int = DEFAULT_CONCURRENCY):
+        self.concurrency = concurrency
+        self._session = None
+        # Addresses of servers which don't support batch requests.
+        self._no_batch = set()
+
+    def session(self) -> aiohttp.ClientSession:
+        """Returns the client session, creating it on first use.
+
+        Must be called from within the event loop the client is used on.
+        """
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.concurrency,
+                                             limit_per_host=self.concurrency)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  json_serialize=json.dumps)
+        return self._session
+
+    async def _fetch(self,
+                     method,
+                     url,
+                     timeout,
+                     check_status,
+                     text=False,
+                     **kw):
+        timeout = aiohttp.ClientTimeout(total=timeout)
+        # A node may close an idle connection just as it's being reused, in
+        # particular after it restarts.  Retry once on a fresh connection.
+        for attempt in range(2):
+            try:
+                async with self.session().request(method,
+                                                  url,
+                                                  timeout=timeout,
+                                                  **kw) as resp:
+                    if check_status and resp.status >= 400:
+                        response = requests.Response()
+                        response.status_code = resp.status
+                        response.reason = resp.reason
+                        response.url = url
+                        raise requests.exceptions.HTTPError(
+                            f'{resp.status} {resp.reason} for url: {url}',
+                            response=response)
+                    body = await resp.read()
+                    return body.decode('utf8') if text else json.loads(body)
+            except aiohttp.ServerDisconnectedError as ex:
+                if attempt:
+                    raise requests.exceptions.ConnectionError(ex) from ex
+            except asyncio.TimeoutError as ex:
+                raise requests.exceptions.ReadTimeout(
+                    f'{url} did not respond within {timeout.total} s') from ex
+            except aiohttp.ClientError as ex:
+                raise requests.exceptions.ConnectionError(ex) from ex
+
+    async def json_rpc(self,
+                       addr: Addr,
+                       method: str,
+                       params,
+                       timeout: float = DEFAULT_TIMEOUT,
+                       check_status: bool = True):
+        """Calls a JSON-RPC method and returns the decoded response."""
+        return await self._fetch('POST',
+                                 _url(addr),
+                                 timeout,
+                                 check_status,
+                                 json=_request(method, params))
+
+    async def json_rpc_many(self,
+                            addr: Addr,
+                            calls: typing.Iterable[Call],
+                            timeout: float = DEFAULT_TIMEOUT,
+                            check_status: bool = True):
+        """Issues (method, params) calls concurrently.
+
+        Returns responses in the order of the calls.  At most `concurrency`
+        requests are in flight at a time.
+        """
+        return await asyncio.gather(*(self.json_rpc(
+            addr, method, params, timeout=timeout, check_status=check_status)
+                                      for method, params in calls))
+
+    async def _batch(self, addr, calls, timeout):
+        """Sends calls in a single batch request.
+
+        Returns responses in the order of the calls or None if the server
+        rejects batch requests.  Raises `requests.exceptions` errors, or
+        ValueError for a response which isn't JSON, on other failures.
+        """
+        batch = [
+            _request(method, params, id=i)
+            for i, (method, params) in enumerate(calls)
+        ]
+        try:
+            responses = await self._fetch('POST',
+                                          _url(addr),
+                                          timeout,
+                                          True,
+                                          json=batch)
+        except requests.exceptions.HTTPError as e:
+            if 400 <= e.response.status_code < 500:
+                return None
+            raise
+        if not isinstance(responses, list):
+            return None
+        by_id = {
+            response.get('id'): response
+            for response in responses
+            if isinstance(response, dict)
+        }
+        if len(by_id) != len(calls) or any(
+                i not in by_id for i in range(len(calls))):
+            return None
+        return [by_id[i] for i in range(len(calls))]
+
+    async def _batch_part(self, addr, calls, timeout, check_status):
+        for _ in range(BATCH_RETRIES + 1):
+            if addr in self._no_batch:
+                break
+            try:
+                responses = await self._batch(addr, calls, timeout)
+            except (requests.exceptions.RequestException, ValueError):
+                continue
+            if responses is not None:
+                return responses
+            self._no_batch.add(addr)
+        return await self.json_rpc_many(addr,
+                                        calls,
+                                        timeout=timeout,
+                                        check_status=check_status)
+
+    async def json_rpc_batch(self,
+                             addr: Addr,
+                             calls: typing.Iterable[Call],
+                             timeout: float = DEFAULT_TIMEOUT,
+                             check_status: bool = True):
+        """Issues (method, params) calls in JSON-RPC batch requests.
+
+        Returns responses in the order of the calls.  Errors of individual
+        calls are returned as responses with an `error` field, same as with
+        `json_rpc`.  If the server rejects batch requests, i.e. answers one
+        with a 4xx status or with anything but a list of responses, the
+        calls are sent with `json_rpc_many` and the server isn't sent batches
+        again.  A batch failing otherwise is retried `BATCH_RETRIES` times
+        before its calls, and only its, are sent with `json_rpc_many`.
+        """
+        calls = list(calls)
+        parts = [
+            calls[i:i + MAX_BATCH_SIZE]
+            for i in range(0, len(calls), MAX_BATCH_SIZE)
+        ]
+        parts = await asyncio.gather(
+            *(self._batch_part(addr, part, timeout, check_status)
+              for part in parts))
+        return [response for part in parts for response in part]
+
+    async def get_status(self,
+                         addr: Addr,
+                         timeout: float = DEFAULT_TIMEOUT,
+                         check_status: bool = True):
+        """Returns response of the node's /status endpoint."""
+        return await self._fetch('GET', _url(addr, '/status'), timeout,
+                                 check_status)
+
+    async def get_metrics(self,
+                          addr: Addr,
+                          timeout: float = DEFAULT_TIMEOUT,
+                          check_status: bool = True) -> str:
+        """Returns the node's /metrics page in Prometheus text format."""
+        return await self._fetch('GET',
+                                 _url(addr, '/metrics'),
+                                 timeout,
+                                 check_status,
+                                 text=True)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+def _run_loop(loop):
+    try:
+        loop.run_forever()
+    finally:
+        loop.close()
+
+
+# Clients whose event loop threads need to be stopped at exit or forgotten in
+# forked children.
+_clients = weakref.WeakSet()
+
+
+class RpcClient:
+    """Synchronous wrapper running AsyncRpcClient on a background thread.
+
+    The event loop thread is started on first use.  A forked child process
+    starts its own thread and connection pool rather than sharing the
+    parent's.  Methods block until the response arrives and are safe to call
+    from many threads at once.
+    """
+
+    def __init__(self, *, concurrency: int = DEFAULT_CONCURRENCY):
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+        _clients.add(self)
+
+    def _forget(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+
+    def _run(self, fn, *args, **kw):
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=_run_loop,
+                                     args=(loop,),
+                                     name='rpc-client',
+                                     daemon=True).start()
+                    self._client = AsyncRpcClient(concurrency=self.concurrency)
+                    self._loop = loop
+        coro = fn(self._client, *args, **kw)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def json_rpc(self,
+                 addr: Addr,
+                 method: str,
+                 params,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 check_status: bool = True):
+        return self._run(AsyncRpcClient.json_rpc,
+                         addr,
+                         method,
+                         params,
+                         timeout=timeout,
+                         check_status=check_status)
+
+    def json_rpc_many(self,
+                      addr: Addr,
+                      calls: typing.Iterable[Call],
+                      timeout: float = DEFAULT_TIMEOUT,
+                      check_status: bool = True):
+        return self._run(AsyncRpcClient.json_rpc_many,
+                         addr,
+                         list(calls),
+                         timeout=timeout,
+                         check_status=check_status)
+
+    def json_rpc_batch(self,
+                       addr: Addr,
+                       calls: typing.Iterable[Call],
+                       timeout: float = DEFAULT_TIMEOUT,
+                       check_status: bool = True):
+        return self._run(AsyncRpcClient.json_rpc_batch,
+                         addr,
+                         list(calls),
+                         timeout=timeout,
+                         check_status=check_status)
+
+    def get_status(self,
+                   addr: Addr,
+                   timeout: float = DEFAULT_TIMEOUT,
+                   check_status: bool = True):
+        return self._run(AsyncRpcClient.get_status,
+                         addr,
+                         timeout=timeout,
+                         check_status=check_status)
+
+    def get_metrics(self,
+                    addr: Addr,
+                    timeout: float = DEFAULT_TIMEOUT,
+                    check_status: bool = True) -> str:
+        return self._run(AsyncRpcClient.get_metrics,
+                         addr,
+                         timeout=timeout,
+                         check_status=check_status)
+
+    def close(self):
+        """Closes the connections and stops the event loop thread."""
+        with self._lock:
+            loop, client = self._loop, self._client
+            self._loop = self._client = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(client.close(),
+                                             loop).result(timeout=1)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+
+
+_shared = None
+
+
+def shared() -> RpcClient:
+    """Returns the process-wide client."""
+    global _shared
+    if _shared is None:
+        _shared = RpcClient()
+    return _shared
+
+
+def _forget_all():
+    for client in list(_clients):
+        client._forget()
+
+
+def _close_all():
+    for client in list(_clients):
+        try:
+            client.close()
+        except Exception:
+            pass
+
+
+os.register_at_fork(after_in_child=_forget_all)
+atexit.register(_close_all)
@@ -1,8 +1,29 @@
+import struct
+
+
 class BinarySerializer:
 
-    def __init__(self, schema):
+    def __init__(self, schema, *, compiled=False, zero_copy=False):
+        """Creates a Borsh serializer for given schema.
+
+        Args:
+            schema: Dictionary mapping message classes to their description.
+            compiled: If True, `serialize` and `deserialize` use a codec
+                compiled from the schema (see `compile_schema`) rather than
+                interpreting the schema for every field.  The output is the
+                same in both modes but the compiled codec is considerably
+                faster.  Note that the compiled mode does not affect the
+                lower-level `serialize_field`/`deserialize_field` methods.
+            zero_copy: If True, implies `compiled` and makes `deserialize`
+                decode `Vec<u8>` fields into memoryview slices of the input
+                rather than copying them.  See `SchemaCodec` for details.
+        """
         self.array = bytearray()
         self.schema = schema
+        if compiled or zero_copy:
+            self.codec = compile_schema(schema, zero_copy=zero_copy)
+        else:
+            self.codec = None
 
     def read_bytes(self, n):
         assert n + self.offset <= len(
@@ -149,13 +170,568 @@ class BinarySerializer:
             assert False, structSchema
 
     def serialize(self, obj):
+        if self.codec is not None:
+            return self.codec.serialize(obj)
         self.serialize_struct(obj)
         return bytes(self.array)
 
     def deserialize(self, bytes_, type_):
+        if self.codec is not None:
+            return self.codec.deserialize(bytes_, type_)
         self.array = bytearray(bytes_)
         self.offset = 0
         ret = self.deserialize_field(type_)
         assert self.offset == len(bytes_), "%s != %s" % (self.offset,
                                                          len(bytes_))
         return ret
+
+
+# Struct objects used by the compiled codec for fixed-width integers.  Borsh
+# encodes all integers as little endian.
+_INT_STRUCTS = {
+    1: struct.Struct('<B'),
+    2: struct.Struct('<H'),
+    4: struct.Struct('<I'),
+    8: struct.Struct('<Q'),
+}
+_U32 = _INT_STRUCTS[4]
+
+
+def _truncated(pos, n, buf):
+    return AssertionError(f'n: {n} offset: {pos}, length: {len(buf)}')
+
+
+def _unsupported(what):
+    """Returns encoder and decoder which fail for unsupported field types.
+
+    Schema may contain placeholders (e.g. `None` for enum variants which
+    haven’t been ported yet).  The interpreted serializer fails only when it
+    encounters such field and the compiled codec mimics that behaviour.
+    """
+
+    def fail(*args):
+        assert False, what
+
+    return fail, fail
+
+
+class SchemaCodec:
+    """Borsh codec compiled from a schema.
+
+    Rather than interpreting the schema for every field of every message, the
+    codec translates each schema entry once into a pair of closures: an
+    encoder which appends serialised value to a bytearray and a decoder which
+    reads a value from a buffer at given position and returns it together
+    with the position past it.  Integers are handled with `struct` and
+    `int.from_bytes` rather than byte by byte.
+
+    The codec produces the same bytes, the same decoded objects and raises the
+    same exception types as `BinarySerializer`.  Use `compile_schema` rather
+    than creating the object directly so that compiled codecs are shared.
+
+    A zero-copy codec decodes directly from a memoryview over the input and
+    returns `Vec<u8>` fields as memoryview slices of it rather than lists of
+    ints.  Nothing is copied until the caller materialises such field with
+    `bytes(...)`, which makes decoding large messages (e.g. chunk parts) cheap.
+    Fixed-size byte arrays (hashes, keys, signatures) are still decoded into
+    `bytes` since copying them is cheaper than creating a memoryview object
+    and they are routinely compared and hashed.  Note that each slice keeps
+    the whole input buffer alive and that a mutable input (e.g. a bytearray
+    reused for reading) must not be modified while the decoded message is in
+    use.  Both kinds of codecs accept memoryviews in place of bytes when
+    serialising.
+    """
+
+    def __init__(self, schema, zero_copy=False):
+        self.schema = schema
+        self.zero_copy = zero_copy
+        self._encoders = {}
+        self._decoders = {}
+        self._field_cache = {}
+        for type_, struct_schema in schema.items():
+            enc, dec = self._compile_struct(type_, struct_schema)
+            self._encoders[type_] = enc
+            self._decoders[type_] = dec
+
+    def serialize(self, obj):
+        out = bytearray()
+        self._encoders[type(obj)](obj, out)
+        return bytes(out)
+
+    def deserialize(self, bytes_, type_):
+        if self.zero_copy:
+            # Slicing bytes is the fastest way to get the small fixed-size
+            # fields so only wrap other buffers (which slicing would copy) in
+            # a memoryview.
+            if not isinstance(bytes_, bytes):
+                bytes_ = memoryview(bytes_).cast('B')
+        elif not isinstance(bytes_, bytes):
+            bytes_ = bytes(bytes_)
+        ret, pos = self.field_decoder(type_)(bytes_, 0)
+        assert pos == len(bytes_), "%s != %s" % (pos, len(bytes_))
+        return ret
+
+    def field_encoder(self, field_type):
+        """Returns encoder for given field type; see `field_decoder`."""
+        return self._compile_field_cached(field_type)[0]
+
+    def field_decoder(self, field_type):
+        """Returns decoder for given field type.
+
+        The decoder takes a buffer and position to read from and returns
+        a `(value, new_position)` tuple.
+        """
+        return self._compile_field_cached(field_type)[1]
+
+    def _compile_field_cached(self, field_type):
+        try:
+            return self._field_cache[field_type]
+        except KeyError:
+            pass
+        except TypeError:
+            # Unhashable field type (e.g. a list); don’t cache.
+            return self._compile_field(field_type)
+        ret = self._compile_field(field_type)
+        self._field_cache[field_type] = ret
+        return ret
+
+    def _compile_struct(self, type_, struct_schema):
+        kind = struct_schema.get('kind')
+        if kind == 'struct':
+            return self._compile_struct_fields(type_, struct_schema['fields'])
+        elif kind == 'enum':
+            return self._compile_enum(type_, struct_schema['field'],
+                                      struct_schema['values'])
+        return _unsupported(struct_schema)
+
+    def _compile_struct_fields(self, type_, fields):
+        compiled = [(name, self._compile_field(field_type))
+                    for name, field_type in fields]
+        encoders = tuple((name, enc) for name, (enc, _) in compiled)
+        decoders = tuple((name, dec) for name, (_, dec) in compiled)
+
+        def encode(obj, out):
+            for name, enc in encoders:
+                enc(getattr(obj, name), out)
+
+        # Don't call __init__; generated classes' constructors take field
+        # values and message classes have no other initialisation to do.
+        new = object.__new__
+
+        def decode(buf, pos):
+            ret = new(type_)
+            for name, dec in decoders:
+                value, pos = dec(buf, pos)
+                setattr(ret, name, value)
+            return ret, pos
+
+        return encode, decode
+
+    def _compile_enum(self, type_, tag_field, values):
+        by_name = {}
+        by_ordinal = []
+        for idx, (name, field_type) in enumerate(values):
+            enc, dec = self._compile_field(field_type)
+            by_name.setdefault(name, (idx, enc))
+            by_ordinal.append((name, dec))
+        by_ordinal = tuple(by_ordinal)
+        new = object.__new__
+
+        def encode(obj, out):
+            name = getattr(obj, tag_field)
+            try:
+                idx, enc = by_name[name]
+            except KeyError:
+                assert False, name
+            assert idx < 256
+            out.append(idx)
+            enc(getattr(obj, name), out)
+
+        def decode(buf, pos):
+            if pos >= len(buf):
+                raise _truncated(pos, 1, buf)
+            # Unknown ordinal raises IndexError just like the interpreted
+            # serializer; callers rely on that to skip unparsable messages.
+            name, dec = by_ordinal[buf[pos]]
+            ret = new(type_)
+            setattr(ret, tag_field, name)
+            value, pos = dec(buf, pos + 1)
+            setattr(ret, name, value)
+            return ret, pos
+
+        return encode, decode
+
+    def _compile_field(self, field_type):
+        if type(field_type) == tuple:
+            return self._compile_tuple(field_type)
+        elif type(field_type) == str:
+            if field_type == 'bool':
+                return self._compile_bool()
+            elif field_type[0] == 'u':
+                return self._compile_int(int(field_type[1:]) // 8)
+            elif field_type == 'string':
+                return self._compile_string()
+        elif type(field_type) == list:
+            assert len(field_type) == 1
+            if type(field_type[0]) == int:
+                return self._compile_fixed_bytes(field_type[0])
+            elif field_type[0] == 'u8':
+                return self._compile_u8_vec()
+            return self._compile_vec(field_type[0])
+        elif type(field_type) == dict:
+            if field_type.get('kind') == 'option':
+                return self._compile_option(field_type['type'])
+        elif type(field_type) == type:
+            return self._compile_type_ref(field_type)
+        return _unsupported(field_type)
+
+    def _compile_tuple(self, types):
+        if not types:
+            return (lambda value, out: None), (lambda buf, pos: (None, pos))
+        compiled = tuple(self._compile_field(t) for t in types)
+        encoders = tuple(enc for enc, _ in compiled)
+        decoders = tuple(dec for _, dec in compiled)
+
+        def encode(value, out):
+            assert len(value) == len(encoders)
+            for v, enc in zip(value, encoders):
+                enc(v, out)
+
+        def decode(buf, pos):
+            ret = []
+            for dec in decoders:
+                value, pos = dec(buf, pos)
+                ret.append(value)
+            return tuple(ret), pos
+
+        return encode, decode
+
+    @staticmethod
+    def _compile_bool():
+
+        def encode(value, out):
+            assert isinstance(value, bool), str(type(value))
+            out.append(value)
+
+        def decode(buf, pos):
+            if pos >= len(buf):
+                raise _truncated(pos, 1, buf)
+            value = buf[pos]
+            assert 0 <= value <= 1, f"Fail to deserialize bool: {value}"
+            return bool(value), pos + 1
+
+        return encode, decode
+
+    @staticmethod
+    def _compile_int(n_bytes):
+        st = _INT_STRUCTS.get(n_bytes)
+        if st is not None:
+            pack = st.pack
+            unpack_from = st.unpack_from
+
+            def encode(value, out):
+                try:
+                    out += pack(value)
+                except struct.error as ex:
+                    raise AssertionError(f'{value} out of range') from ex
+
+            def decode(buf, pos):
+                end = pos + n_bytes
+                if end > len(buf):
+                    raise _truncated(pos, n_bytes, buf)
+                return unpack_from(buf, pos)[0], end
+        else:
+
+            def encode(value, out):
+                assert value >= 0
+                try:
+                    out += value.to_bytes(n_bytes, 'little')
+                except OverflowError as ex:
+                    raise AssertionError(f'{value} out of range') from ex
+
+            def decode(buf, pos):
+                end = pos + n_bytes
+                if end > len(buf):
+                    raise _truncated(pos, n_bytes, buf)
+                return int.from_bytes(buf[pos:end], 'little'), end
+
+        return encode, decode
+
+    @staticmethod
+    def _compile_string():
+        pack = _U32.pack
+        unpack_from = _U32.unpack_from
+
+        def encode(value, out):
+            b = value.encode('utf8')
+            out += pack(len(b))
+            out += b
+
+        def decode(buf, pos):
+            if pos + 4 > len(buf):
+                raise _truncated(pos, 4, buf)
+            n = unpack_from(buf, pos)[0]
+            pos += 4
+            end = pos + n
+            if end > len(buf):
+                raise _truncated(pos, n, buf)
+            return str(buf[pos:end], 'utf8'), end
+
+        return encode, decode
+
+    @staticmethod
+    def _compile_fixed_bytes(n):
+
+        def encode(value, out):
+            assert type(value) == bytes or type(value) == memoryview
+            assert len(value) == n, "len(%s) = %s != %s" % (value, len(value),
+                                                            n)
+            out += value
+
+        def decode(buf, pos):
+            end = pos + n
+            if end > len(buf):
+                raise _truncated(pos, n, buf)
+            return bytes(buf[pos:end]), end
+
+        return encode, decode
+
+    def _compile_u8_vec(self):
+        # Vec<u8> is decoded into a list of ints to match the interpreted
+        # serializer unless zero-copy decoding was requested.
+        zero_copy = self.zero_copy
+        pack = _U32.pack
+        unpack_from = _U32.unpack_from
+
+        def encode(value, out):
+            out += pack(len(value))
+            try:
+                out += bytes(value)
+            except ValueError as ex:
+                raise AssertionError(str(ex)) from ex
+
+        def decode(buf, pos):
+            if pos + 4 > len(buf):
+                raise _truncated(pos, 4, buf)
+            n = unpack_from(buf, pos)[0]
+            pos += 4
+            end = pos + n
+            if end > len(buf):
+                raise _truncated(pos, n, buf)
+            if zero_copy:
+                return memoryview(buf)[pos:end], end
+            return list(buf[pos:end]), end
+
+        return encode, decode
+
+    def _compile_vec(self, element_type):
+        enc, dec = self._compile_field(element_type)
+        pack = _U32.pack
+        unpack_from = _U32.unpack_from
+
+        def encode(value, out):
+            out += pack(len(value))
+            for el in value:
+                enc(el, out)
+
+        def decode(buf, pos):
+            if pos + 4 > len(buf):
+                raise _truncated(pos, 4, buf)
+            n = unpack_from(buf, pos)[0]
+            pos += 4
+            ret = []
+            for _ in range(n):
+                value, pos = dec(buf, pos)
+                ret.append(value)
+            return ret, pos
+
+        return encode, decode
+
+    def _compile_option(self, inner_type):
+        enc, dec = self._compile_field(inner_type)
+
+        def encode(value, out):
+            if value is None:
+                out.append(0)
+            else:
+                out.append(1)
+                enc(value, out)
+
+        def decode(buf, pos):
+            if pos >= len(buf):
+                raise _truncated(pos, 1, buf)
+            if buf[pos] == 0:
+                return None, pos + 1
+            return dec(buf, pos + 1)
+
+        return encode, decode
+
+    def _compile_type_ref(self, type_):
+        # Look the struct codecs up at call time so that schema entries can
+        # refer to each other regardless of their order in the schema.
+        encoders = self._encoders
+        decoders = self._decoders
+
+        def encode(value, out):
+            assert type(value) == type_, "%s != type(%s)" % (type_, value)
+            encoders[type_](value, out)
+
+        def decode(buf, pos):
+            return decoders[type_](buf, pos)
+
+        return encode, decode
+
+
+# Compiled codecs keyed by id of the schema and zero-copy flag.  The schema
+# object is kept alongside the codec so its id cannot be reused while the entry
+# exists.
+_COMPILED_SCHEMAS = {}
+
+
+def compile_schema(schema, *, zero_copy=False):
+    """Returns a `SchemaCodec` for given schema, compiling it if necessary.
+
+    Codecs are cached per schema object so compiling happens once for each
+    module-level schema (e.g. `messages.schema` or `transaction.schema`).
+    Schemas must not be modified after they are compiled.
+    """
+    key = (id(schema), zero_copy)
+    entry = _COMPILED_SCHEMAS.get(key)
+    if entry is None or entry[0] is not schema:
+        entry = (schema, SchemaCodec(schema, zero_copy=zero_copy))
+        _COMPILED_SCHEMAS[key] = entry
+    return entry[1]
+
+
+# Value of fields which haven't been set, used when comparing messages.
+_UNSET = object()
+
+
+class SchemaStruct:
+    """Base of classes generated by `generate_classes` for struct entries.
+
+    Fields may be given to the constructor positionally, in schema order, or
+    by name.  Fields which aren't given stay unset.  Objects compare equal if
+    they are of the same type and all their fields are equal.
+    """
+
+    __slots__ = ()
+    _fields = ()
+
+    def __init__(self, *args, **kwargs):
+        fields = self._fields
+        if len(args) > len(fields):
+            raise TypeError(f'{type(self).__name__} takes at most '
+                            f'{len(fields)} arguments ({len(args)} given)')
+        for name, value in zip(fields, args):
+            setattr(self, name, value)
+        for name, value in kwargs.items():
+            if name not in fields:
+                raise TypeError(f'{type(self).__name__} has no field {name}')
+            setattr(self, name, value)
+
+    def _key(self):
+        return tuple(getattr(self, name, _UNSET) for name in self._fields)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        # Fields such as lists aren't hashable and don't contribute to the
+        # hash which keeps it consistent with equality.
+        ret = hash(type(self))
+        for value in self._key():
+            try:
+                ret = hash((ret, value))
+            except TypeError:
+                pass
+        return ret
+
+
+class SchemaEnum(SchemaStruct):
+    """Base of classes generated by `generate_classes` for enum entries.
+
+    The constructor takes name of the variant and its value, e.g.
+    `PeerMessage('Routed', routed)`.  Only the tag field and attribute of the
+    selected variant are set.
+    """
+
+    __slots__ = ()
+    _tag = None
+
+    def __init__(self, variant=None, value=None):
+        if variant is not None:
+            setattr(self, self._tag, variant)
+            setattr(self, variant, value)
+
+    def _key(self):
+        variant = getattr(self, self._tag, None)
+        if variant is None:
+            return (None, _UNSET)
+        return (variant, getattr(self, variant, _UNSET))
+
+
+def _replace_types(field_type, classes):
+    if type(field_type) == type:
+        return classes.get(field_type, field_type)
+    elif type(field_type) == tuple:
+        return tuple(_replace_types(t, classes) for t in field_type)
+    elif type(field_type) == list:
+        return [_replace_types(t, classes) for t in field_type]
+    elif type(field_type) == dict and 'type' in field_type:
+        return dict(field_type,
+                    type=_replace_types(field_type['type'], classes))
+    return field_type
+
+
+def generate_classes(schema, namespace):
+    """Replaces classes of schema entries with generated slotted classes.
+
+    Message classes are declared as plain classes, optionally with helper
+    methods, and described by a list of `[class, description]` entries.  For
+    each struct and enum entry this creates a class with the same name, body
+    and `__slots__` for all fields (for enums, the tag field and all
+    variants) deriving from `SchemaStruct` or `SchemaEnum`.  Such objects have
+    no `__dict__` which considerably reduces memory used by large decoded
+    messages.
+
+    Args:
+        schema: List of `[class, description]` entries.  It's modified in
+            place to refer to the generated classes.
+        namespace: Globals of the module declaring the classes.  Names bound
+            to the original classes are rebound to the generated ones.
+    """
+    classes = {}
+    for cls, description in schema:
+        kind = description.get('kind')
+        if issubclass(cls, SchemaStruct) or kind not in ('struct', 'enum'):
+            continue
+        assert cls.__bases__ == (object,), cls
+        body = {
+            name: value
+            for name, value in vars(cls).items()
+            if name not in ('__dict__', '__weakref__')
+        }
+        if kind == 'struct':
+            base = SchemaStruct
+            slots = tuple(name for name, _ in description['fields'])
+            body['_fields'] = slots
+        else:
+            base = SchemaEnum
+            slots = (description['field'],) + tuple(
+                dict.fromkeys(name for name, _ in description['values']))
+            body['_tag'] = description['field']
+        body['__slots__'] = slots
+        classes[cls] = type(cls.__name__, (base,), body)
+
+    for entry in schema:
+        entry[0] = classes.get(entry[0], entry[0])
+        description = entry[1]
+        for key in ('fields', 'values'):
+            for field in description.get(key, ()):
+                field[1] = _replace_types(field[1], classes)
+    for name, value in list(namespace.items()):
+        if isinstance(value, type) and value in classes:
+            namespace[name] = classes[value]
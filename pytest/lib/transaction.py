@@ -1,14 +1,25 @@
-from serializer import BinarySerializer
+from serializer import BinarySerializer, compile_schema
+import functools
 import hashlib
-from ed25519 import SigningKey
+import itertools
+import struct
+from nacl.signing import SigningKey
 import base58
 
+from key import Key
 from messages.tx import *
 from messages.crypto import *
 from messages.bridge import *
 
 schema = dict(tx_schema + crypto_schema + bridge_schema)
 
+# Borsh encoding of SignedTransaction is that of the Transaction followed by
+# the signature: key type (0 for ed25519) and 64 bytes of signature data.
+_ED25519_SIGNATURE_PREFIX = b'\0'
+
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+
 
 def compute_tx_hash(receiverId, nonce, actions, blockHash, accountId, pk):
     tx = Transaction()
@@ -21,7 +32,7 @@ def compute_tx_hash(receiverId, nonce, actions, blockHash, accountId, pk):
     tx.actions = actions
     tx.blockHash = blockHash
 
-    msg = BinarySerializer(schema).serialize(tx)
+    msg = BinarySerializer(schema, compiled=True).serialize(tx)
     hash_ = hashlib.sha256(msg).digest()
 
     return tx, hash_
@@ -29,18 +40,180 @@ def compute_tx_hash(receiverId, nonce, actions, blockHash, accountId, pk):
 
 def sign_and_serialize_transaction(receiverId, nonce, actions, blockHash,
                                    accountId, pk, sk):
-    tx, hash_ = compute_tx_hash(receiverId, nonce, actions, blockHash,
-                                accountId, pk)
-
-    signature = Signature()
-    signature.keyType = 0
-    signature.data = SigningKey(sk).sign(hash_)
-
-    signedTx = SignedTransaction()
-    signedTx.transaction = tx
-    signedTx.signature = signature
-
-    return BinarySerializer(schema).serialize(signedTx)
+    tx = Transaction(signerId=accountId,
+                     publicKey=PublicKey(0, pk),
+                     nonce=nonce,
+                     receiverId=receiverId,
+                     blockHash=blockHash,
+                     actions=actions)
+    body = compile_schema(schema).serialize(tx)
+    signature = _signing_key(sk).sign(hashlib.sha256(body).digest())
+    return body + _ED25519_SIGNATURE_PREFIX + signature.signature
+
+
+@functools.lru_cache(maxsize=1024)
+def _signing_key(sk: bytes) -> SigningKey:
+    """Returns signing key for a 64-byte ed25519 secret key.
+
+    NEAR secret keys are the 32-byte seed followed by the public key.
+    """
+    return SigningKey(bytes(sk[:32]))
+
+
+def _sign_hashes(sk, hashes):
+    key = _signing_key(sk)
+    return [key.sign(hash_).signature for hash_ in hashes]
+
+
+class TxSigner:
+    """Signs transactions with a single access key.
+
+    Keys are decoded and the signing key set up once.  Each transaction is
+    serialized once; the signature of its hash is appended to the serialized
+    body which gives the serialized SignedTransaction.  Use `get_signer` to
+    get a cached signer for a `Key`.
+    """
+
+    def __init__(self, key):
+        self.account_id = key.account_id
+        self.pk = key.decoded_pk()
+        self.sk = key.decoded_sk()
+        self._public_key = PublicKey(0, self.pk)
+        self._signing_key = _signing_key(self.sk)
+        self._codec = compile_schema(schema)
+
+    def serialize(self, receiver_id, nonce, actions, block_hash) -> bytes:
+        """Returns serialized, unsigned Transaction."""
+        return self._codec.serialize(
+            Transaction(signerId=self.account_id,
+                        publicKey=self._public_key,
+                        nonce=nonce,
+                        receiverId=receiver_id,
+                        blockHash=block_hash,
+                        actions=actions))
+
+    def sign(self, receiver_id, nonce, actions, block_hash) -> bytes:
+        """Returns serialized SignedTransaction."""
+        return self.sign_and_get_hash(receiver_id, nonce, actions,
+                                      block_hash)[0]
+
+    def sign_and_get_hash(self, receiver_id, nonce, actions, block_hash):
+        """Returns serialized SignedTransaction and base58 transaction hash."""
+        body = self.serialize(receiver_id, nonce, actions, block_hash)
+        hash_ = hashlib.sha256(body).digest()
+        signature = self._signing_key.sign(hash_).signature
+        return (body + _ED25519_SIGNATURE_PREFIX + signature,
+                base58.b58encode(hash_).decode('utf8'))
+
+    def sign_many(self, txs, *, executor=None, chunk_size=512):
+        """Signs many transactions.
+
+        Args:
+            txs: Iterable of (receiver_id, nonce, actions, block_hash) tuples.
+            executor: Optional `concurrent.futures.ProcessPoolExecutor` (or
+                any executor) to sign in.  Transactions are serialized in the
+                calling process and only their hashes and signatures are
+                passed to and from the workers.
+            chunk_size: Number of transactions signed by a single task.
+        Returns:
+            List of serialized SignedTransactions in the order of `txs`.
+        """
+        return self.sign_bodies([self.serialize(*tx) for tx in txs],
+                                executor=executor,
+                                chunk_size=chunk_size)
+
+    def sign_bodies(self, bodies, *, executor=None, chunk_size=512):
+        """Signs serialized transactions; see `sign_many`."""
+        hashes = [hashlib.sha256(body).digest() for body in bodies]
+        if executor is None:
+            signatures = _sign_hashes(self.sk, hashes)
+        else:
+            chunks = [
+                hashes[i:i + chunk_size]
+                for i in range(0, len(hashes), chunk_size)
+            ]
+            signatures = itertools.chain.from_iterable(
+                executor.map(_sign_hashes, itertools.repeat(self.sk), chunks))
+        return [
+            body + _ED25519_SIGNATURE_PREFIX + signature
+            for body, signature in zip(bodies, signatures)
+        ]
+
+    def template(self, actions, receiver_id='') -> 'TxTemplate':
+        """Returns template of transactions with given actions."""
+        return TxTemplate(self, actions, receiver_id)
+
+
+class TxTemplate:
+    """Pre-encoded transaction differing only in nonce, receiver and block hash.
+
+    The transaction is serialized once and offsets of the variable fields
+    recorded.  New transactions are produced by patching those bytes in a copy
+    of the encoded body and signing it, without constructing any message
+    objects.  Receiver may have a different length than the template's.
+    """
+
+    def __init__(self, signer, actions, receiver_id=''):
+        self.signer = signer
+        self.receiver_id = receiver_id
+        self._body = signer.serialize(receiver_id, 0, actions, bytes(32))
+        # signerId (u32 length and the string) and publicKey (key type and 32
+        # bytes) precede the nonce.
+        self._nonce_offset = 4 + len(signer.account_id.encode('utf8')) + 33
+        self._receiver_offset = self._nonce_offset + 8
+        self._receiver_end = self._receiver_offset + 4 + len(
+            receiver_id.encode('utf8'))
+
+    def body(self, nonce, block_hash, receiver_id=None) -> bytes:
+        """Returns serialized, unsigned Transaction."""
+        assert len(block_hash) == 32, len(block_hash)
+        body = bytearray(self._body)
+        body[self._receiver_end:self._receiver_end + 32] = block_hash
+        if receiver_id is not None and receiver_id != self.receiver_id:
+            receiver = receiver_id.encode('utf8')
+            body[self._receiver_offset:self._receiver_end] = _U32.pack(
+                len(receiver)) + receiver
+        _U64.pack_into(body, self._nonce_offset, nonce)
+        return bytes(body)
+
+    def sign(self, nonce, block_hash, receiver_id=None) -> bytes:
+        """Returns serialized SignedTransaction."""
+        body = self.body(nonce, block_hash, receiver_id)
+        signature = self.signer._signing_key.sign(
+            hashlib.sha256(body).digest()).signature
+        return body + _ED25519_SIGNATURE_PREFIX + signature
+
+    def sign_and_get_hash(self, nonce, block_hash, receiver_id=None):
+        """Returns serialized SignedTransaction and base58 transaction hash."""
+        body = self.body(nonce, block_hash, receiver_id)
+        hash_ = hashlib.sha256(body).digest()
+        signature = self.signer._signing_key.sign(hash_).signature
+        return (body + _ED25519_SIGNATURE_PREFIX + signature,
+                base58.b58encode(hash_).decode('utf8'))
+
+    def sign_many(self, txs, *, executor=None, chunk_size=512):
+        """Signs many transactions.
+
+        Args:
+            txs: Iterable of (nonce, block_hash) or (nonce, block_hash,
+                receiver_id) tuples.
+            executor, chunk_size: See `TxSigner.sign_many`.
+        Returns:
+            List of serialized SignedTransactions in the order of `txs`.
+        """
+        return self.signer.sign_bodies([self.body(*tx) for tx in txs],
+                                       executor=executor,
+                                       chunk_size=chunk_size)
+
+
+@functools.lru_cache(maxsize=1024)
+def _cached_signer(account_id, pk, sk):
+    return TxSigner(Key(account_id, pk, sk))
+
+
+def get_signer(key) -> TxSigner:
+    """Returns a cached TxSigner for given Key."""
+    return _cached_signer(key.account_id, key.pk, key.sk)
 
 
 def create_create_account_action():
@@ -135,10 +308,8 @@ def create_delete_account_action(beneficiary):
 
 def sign_create_account_tx(creator_key, new_account_id, nonce, block_hash):
     action = create_create_account_action()
-    return sign_and_serialize_transaction(new_account_id, nonce, [action],
-                                          block_hash, creator_key.account_id,
-                                          creator_key.decoded_pk(),
-                                          creator_key.decoded_sk())
+    return get_signer(creator_key).sign(new_account_id, nonce, [action],
+                                        block_hash)
 
 
 def sign_create_account_with_full_access_key_and_balance_tx(
@@ -147,76 +318,52 @@ def sign_create_account_with_full_access_key_and_balance_tx(
     full_access_key_action = create_full_access_key_action(new_key.decoded_pk())
     payment_action = create_payment_action(balance)
     actions = [create_account_action, full_access_key_action, payment_action]
-    return sign_and_serialize_transaction(new_account_id, nonce, actions,
-                                          block_hash, creator_key.account_id,
-                                          creator_key.decoded_pk(),
-                                          creator_key.decoded_sk())
+    return get_signer(creator_key).sign(new_account_id, nonce, actions,
+                                        block_hash)
 
 
 def sign_delete_access_key_tx(signer_key, target_account_id, key_for_deletion,
                               nonce, block_hash):
     action = create_delete_access_key_action(key_for_deletion.decoded_pk())
-    return sign_and_serialize_transaction(target_account_id, nonce, [action],
-                                          block_hash, signer_key.account_id,
-                                          signer_key.decoded_pk(),
-                                          signer_key.decoded_sk())
+    return get_signer(signer_key).sign(target_account_id, nonce, [action],
+                                       block_hash)
 
 
 def sign_payment_tx(key, to, amount, nonce, blockHash):
     action = create_payment_action(amount)
-    return sign_and_serialize_transaction(to, nonce, [action], blockHash,
-                                          key.account_id, key.decoded_pk(),
-                                          key.decoded_sk())
+    return get_signer(key).sign(to, nonce, [action], blockHash)
 
 
 def sign_payment_tx_and_get_hash(key, to, amount, nonce, block_hash):
     action = create_payment_action(amount)
-    _, hash_bytes = compute_tx_hash(to, nonce, [action], block_hash,
-                                    key.account_id, key.decoded_pk())
-    signed_tx = sign_payment_tx(key, to, amount, nonce, block_hash)
-    return signed_tx, base58.b58encode(hash_bytes).decode('utf8')
+    return get_signer(key).sign_and_get_hash(to, nonce, [action], block_hash)
 
 
 def sign_staking_tx(signer_key, validator_key, amount, nonce, blockHash):
     action = create_staking_action(amount, validator_key.decoded_pk())
-    return sign_and_serialize_transaction(signer_key.account_id, nonce,
-                                          [action], blockHash,
-                                          signer_key.account_id,
-                                          signer_key.decoded_pk(),
-                                          signer_key.decoded_sk())
+    return get_signer(signer_key).sign(signer_key.account_id, nonce, [action],
+                                       blockHash)
 
 
 def sign_staking_tx_and_get_hash(signer_key, validator_key, amount, nonce,
                                  block_hash):
     action = create_staking_action(amount, validator_key.decoded_pk())
-    _, hash_bytes = compute_tx_hash(signer_key.account_id, nonce, [action],
-                                    block_hash, signer_key.account_id,
-                                    signer_key.decoded_pk())
-    signed_tx = sign_staking_tx(signer_key, validator_key, amount, nonce,
-                                block_hash)
-    return signed_tx, base58.b58encode(hash_bytes).decode('utf8')
+    return get_signer(signer_key).sign_and_get_hash(signer_key.account_id,
+                                                    nonce, [action], block_hash)
 
 
 def sign_deploy_contract_tx(signer_key, code, nonce, blockHash):
     action = create_deploy_contract_action(code)
-    return sign_and_serialize_transaction(signer_key.account_id, nonce,
-                                          [action], blockHash,
-                                          signer_key.account_id,
-                                          signer_key.decoded_pk(),
-                                          signer_key.decoded_sk())
+    return get_signer(signer_key).sign(signer_key.account_id, nonce, [action],
+                                       blockHash)
 
 
 def sign_function_call_tx(signer_key, contract_id, methodName, args, gas,
                           deposit, nonce, blockHash):
     action = create_function_call_action(methodName, args, gas, deposit)
-    return sign_and_serialize_transaction(contract_id, nonce, [action],
-                                          blockHash, signer_key.account_id,
-                                          signer_key.decoded_pk(),
-                                          signer_key.decoded_sk())
+    return get_signer(signer_key).sign(contract_id, nonce, [action], blockHash)
 
 
 def sign_delete_account_tx(key, to, beneficiary, nonce, block_hash):
     action = create_delete_account_action(beneficiary)
-    return sign_and_serialize_transaction(to, nonce, [action], block_hash,
-                                          key.account_id, key.decoded_pk(),
-                                          key.decoded_sk())
+    return get_signer(key).sign(to, nonce, [action], block_hash)
@@ -0,0 +1,262 @@
+"""Tracks submitted transactions until they are included and final.
+
+`TxTracker` records when each transaction was submitted and follows the chain
+through a `cluster.BaseNode`'s RPC, fetching every new block and the chunks
+produced in it once, no matter how many transactions are tracked.  A
+transaction is included when it shows up in a new chunk and final when a
+later block names a block at or above its inclusion height as the last final
+one.  Inclusion and finality times are taken from block timestamps so they
+don't depend on how often the tracker polls; clocks of the submitting host
+and the nodes are assumed to be in sync.
+
+Transactions not included within `drop_after` seconds, as measured by block
+timestamps, are counted as dropped.
+
+    tracker = TxTracker(node)
+    tracker.submit(signed_tx)
+    ...
+    tracker.wait(timeout=60)
+    tracker.log()
+
+`load_generator.LoadGenerator(tracker=...)` registers every transaction it
+has successfully sent.
+"""
+
+import collections
+import threading
+import time
+import typing
+
+import cluster
+from configured_logger import logger
+from load_generator import LatencyHistogram
+
+# Seconds after which transactions not included in a block are considered
+# dropped.
+DEFAULT_DROP_AFTER = 60
+# Number of recent block heights remembered to resolve `last_final_block`.
+_RECENT_BLOCKS = 1000
+
+
+class TxTracker:
+    """Follows blocks to measure inclusion and finality latency of txs.
+
+    Memory use is proportional to the number of transactions not yet final
+    and work done per block to the number of transactions in it.  Methods
+    may be called from different threads.
+    """
+
+    def __init__(self,
+                 node: cluster.BaseNode,
+                 *,
+                 drop_after: float = DEFAULT_DROP_AFTER,
+                 batch_size: int = 50) -> None:
+        self.node = node
+        self.drop_after = drop_after
+        self.batch_size = batch_size
+        self.submitted = 0
+        self.rejected = 0
+        self.included = 0
+        self.final = 0
+        self.dropped = 0
+        # From submission to the timestamp of the including block.
+        self.inclusion_latency = LatencyHistogram()
+        # From submission to the timestamp of the block finalising the
+        # including block.
+        self.finality_latency = LatencyHistogram()
+        self._lock = threading.Lock()
+        # Held while fetching blocks so they are processed only once.
+        self._poll_lock = threading.Lock()
+        # Submission times of transactions not yet included by hash.
+        self._pending = {}
+        # (submission time, hash) in order of submission for expiring.
+        self._pending_order = collections.deque()
+        # Submission times of included, not yet final transactions by
+        # inclusion height.
+        self._unfinal = collections.OrderedDict()
+        # Heights of recently processed blocks by hash.
+        self._heights = collections.OrderedDict()
+        self._next_height = None
+
+    def track(self,
+              tx_hash: str,
+              submitted_at: typing.Optional[float] = None) -> None:
+        """Starts tracking transaction submitted at given time.time()."""
+        submitted_at = time.time() if submitted_at is None else submitted_at
+        with self._lock:
+            self.submitted += 1
+            self._pending[tx_hash] = submitted_at
+            self._pending_order.append((submitted_at, tx_hash))
+
+    def submit(self, signed_tx: bytes) -> typing.Optional[str]:
+        """Sends transaction with broadcast_tx_async and starts tracking it.
+
+        Returns transaction hash or None if the node rejected it.
+        """
+        self.start()
+        submitted_at = time.time()
+        response = self.node.send_tx(signed_tx)
+        if 'result' not in response:
+            logger.info(f'Transaction rejected: {response}')
+            with self._lock:
+                self.submitted += 1
+                self.rejected += 1
+            return None
+        self.track(response['result'], submitted_at)
+        return response['result']
+
+    def start(self) -> None:
+        """Starts following blocks after the latest one, unless started.
+
+        Transactions included in blocks up to the latest one are not
+        noticed; call before submitting transactions tracked with `track`.
+        """
+        with self._poll_lock:
+            if self._next_height is None:
+                latest = self.node.get_latest_block(check_storage=False)
+                self._next_height = latest.height + 1
+
+    def _fetch_blocks(self, start, end):
+        blocks = []
+        for batch_start in range(start, end, self.batch_size):
+            heights = range(batch_start, min(end,
+                                             batch_start + self.batch_size))
+            responses = self.node.json_rpc_batch([
+                ('block', [h]) for h in heights
+            ])
+            # Heights with no block are skipped.
+            blocks.extend(response['result']
+                          for response in responses
+                          if 'result' in response)
+        return blocks
+
+    def _fetch_txs(self, blocks):
+        """Returns hashes of transactions in chunks new in the blocks."""
+        chunk_hashes = [
+            chunk['chunk_hash']
+            for block in blocks
+            for chunk in block['chunks']
+            if chunk['height_included'] == block['header']['height']
+        ]
+        if not chunk_hashes:
+            return {}
+        responses = self.node.json_rpc_batch([('chunk', {
+            'chunk_id': chunk_hash
+        }) for chunk_hash in chunk_hashes])
+        txs = {}
+        for chunk_hash, response in zip(chunk_hashes, responses):
+            if 'result' not in response:
+                logger.info(f'Failed to fetch chunk {chunk_hash}: {response}')
+                continue
+            txs[chunk_hash] = [
+                tx['hash'] for tx in response['result']['transactions']
+            ]
+        return txs
+
+    def poll(self) -> int:
+        """Processes blocks produced since the last poll.
+
+        Returns number of processed blocks.
+        """
+        self.start()
+        with self._poll_lock:
+            latest = self.node.get_latest_block(check_storage=False).height
+            if latest < self._next_height:
+                return 0
+            blocks = self._fetch_blocks(self._next_height, latest + 1)
+            txs = self._fetch_txs(blocks)
+            with self._lock:
+                for block in blocks:
+                    self._process_block(block, txs)
+            self._next_height = latest + 1
+            return len(blocks)
+
+    def _process_block(self, block, txs):
+        header = block['header']
+        height = header['height']
+        timestamp = int(header['timestamp']) / 1e9
+        self._heights[header['hash']] = height
+        if len(self._heights) > _RECENT_BLOCKS:
+            self._heights.popitem(last=False)
+
+        for chunk in block['chunks']:
+            for tx_hash in txs.get(chunk['chunk_hash'], ()):
+                submitted_at = self._pending.pop(tx_hash, None)
+                if submitted_at is None:
+                    continue
+                self.included += 1
+                self.inclusion_latency.record(timestamp - submitted_at)
+                self._unfinal.setdefault(height, []).append(submitted_at)
+
+        final_height = self._heights.get(header.get('last_final_block'))
+        if final_height is not None:
+            while self._unfinal:
+                included_height = next(iter(self._unfinal))
+                if included_height > final_height:
+                    break
+                for submitted_at in self._unfinal.pop(included_height):
+                    self.final += 1
+                    self.finality_latency.record(timestamp - submitted_at)
+
+        # Submission times are only roughly ordered when transactions are
+        # tracked from many threads; it's enough for expiry.
+        while self._pending_order:
+            submitted_at, tx_hash = self._pending_order[0]
+            if timestamp - submitted_at < self.drop_after:
+                break
+            self._pending_order.popleft()
+            if self._pending.pop(tx_hash, None) is not None:
+                self.dropped += 1
+
+    def outstanding(self) -> int:
+        """Returns number of tracked transactions not yet final or dropped."""
+        with self._lock:
+            return len(self._pending) + sum(map(len, self._unfinal.values()))
+
+    def wait(self, timeout: float, poll_interval: float = 0.5) -> bool:
+        """Polls until all tracked transactions are final or dropped.
+
+        Returns whether that happened within the timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            self.poll()
+            if not self.outstanding():
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
+
+    def summary(self) -> typing.Dict:
+        with self._lock:
+            done = self.included + self.dropped
+            return {
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'included': self.included,
+                'final': self.final,
+                'dropped': self.dropped,
+                'pending': len(self._pending),
+                'drop_rate': self.dropped / done if done else None,
+                'inclusion_latency': self.inclusion_latency.summary(),
+                'finality_latency': self.finality_latency.summary(),
+            }
+
+    def log(self) -> None:
+
+        def latency(summary):
+            return ' '.join(
+                f'{key} {"-" if summary[key] is None else round(summary[key], 3)}'
+                for key in ('p50', 'p90', 'p99', 'max'))
+
+        summary = self.summary()
+        logger.info(f'Transactions: {summary["submitted"]} submitted, '
+                    f'{summary["rejected"]} rejected, '
+                    f'{summary["included"]} included, '
+                    f'{summary["final"]} final, '
+                    f'{summary["dropped"]} dropped, '
+                    f'{summary["pending"]} pending')
+        logger.info(f'Inclusion latency s: '
+                    f'{latency(summary["inclusion_latency"])}')
+        logger.info(f'Finality latency s: '
+                    f'{latency(summary["finality_latency"])}')
@@ -1,11 +1,15 @@
 import atexit
 import base58
+import collections
+import ctypes
+import ctypes.util
 import hashlib
 import json
 import os
 import pathlib
 import random
 import re
+import select
 import shutil
 import subprocess
 import sys
@@ -13,6 +17,7 @@ import tempfile
 import time
 import typing
 
+import requests
 from retrying import retry
 from rc import gcloud
 
@@ -39,7 +44,30 @@ class TxContext:
         return int(r['result']['amount']) + int(r['result']['locked'])
 
     def get_balances(self):
-        return [self.get_balance(i) for i in range(self.num_nodes)]
+        # Query each node for balances of all its accounts in one round trip
+        # and fall back to get_balance, which retries, on errors.  Nodes
+        # rejecting batches are sent the queries one by one by rpc_client,
+        # which then raises ValueError for responses which aren't JSON.
+        by_node = collections.defaultdict(list)
+        for whose in range(self.num_nodes):
+            by_node[self.act_to_val[whose]].append(whose)
+        balances = [None] * self.num_nodes
+        for node, accounts in by_node.items():
+            try:
+                responses = self.nodes[node].json_rpc_batch([('query', {
+                    'request_type': 'view_account',
+                    'account_id': 'test%s' % whose,
+                    'finality': 'optimistic'
+                }) for whose in accounts])
+            except (requests.exceptions.RequestException, ValueError):
+                responses = [{}] * len(accounts)
+            for whose, r in zip(accounts, responses):
+                if 'result' in r:
+                    balances[whose] = int(r['result']['amount']) + int(
+                        r['result']['locked'])
+                else:
+                    balances[whose] = self.get_balance(whose)
+        return balances
 
     def send_moar_txs(self, last_block_hash, num, use_routing):
         last_balances = [x for x in self.expected_balances]
@@ -68,12 +96,51 @@ class TxContext:
                 self.next_nonce += 1
 
 
+# Flags of inotify_init1 and events of inotify_add_watch; see inotify(7).
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = os.O_CLOEXEC
+_IN_MODIFY = 0x2
+
+
+def _inotify_watch(path) -> typing.Optional[int]:
+    """Returns inotify descriptor signalling writes to the file.
+
+    Returns None where inotify is not available, e.g. on macOS.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(path), _IN_MODIFY) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
 class LogTracker:
-    """Opens up a log file, scrolls to the end and allows to check for patterns.
+    """Follows a node's log file and allows to check for patterns.
+
+    The tracker remembers how far it has read the file and each check scans
+    only data appended since, read in chunks of complete lines so memory use
+    doesn't grow with the size of the log.  The last line is scanned even if
+    it isn't complete yet, e.g. when the node died before ending it, and only
+    what is appended to it is scanned once more of it is written.  ANSI
+    escape codes are stripped and patterns are matched as bytes so the log
+    isn't decoded.  Patterns are plain substrings; many of them are matched
+    in a single pass.
+
+    `wait_for` blocks until one of the patterns appears.  On Linux it sleeps
+    until inotify reports a write to the file rather than polling.
 
     The tracker works only on local nodes.
     """
 
+    # Size of chunks the file is read in.
+    CHUNK_SIZE = 1 << 20
+
     def __init__(self, node: cluster.BaseNode) -> None:
         """Initialises the tracker for given local node.
 
@@ -86,27 +153,123 @@ class LogTracker:
         if not isinstance(node, cluster.LocalNode):
             raise NotImplementedError()
         self.fname = node.stderr_name
-        with open(self.fname) as f:
-            f.seek(0, 2)
-            self.offset = f.tell()
+        self._file = open(self.fname, 'rb')
+        self._file.seek(0, 2)
+        self._offset = self._file.tell()
+        # Incomplete last line read from the file.
+        self._pending = b''
+        # Length of the stripped incomplete last line which has been scanned.
+        self._pending_scanned = 0
+        # Stripped lines read from the file but not scanned yet because a
+        # pattern was found before them.
+        self._backlog = b''
+        # inotify descriptor, opened on first wait; -1 if unavailable.
+        self._inotify = None
+
+    def __del__(self) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if getattr(self, '_file', None) is not None:
+            self._file.close()
+            self._file = None
+        if getattr(self, '_inotify', None) is not None:
+            if self._inotify >= 0:
+                os.close(self._inotify)
+            self._inotify = None
+
+    @property
+    def offset(self) -> int:
+        """Offset in the file up to which data has been read."""
+        return self._offset
+
+    @offset.setter
+    def offset(self, offset: int) -> None:
+        self._offset = offset
+        self._pending = b''
+        self._pending_scanned = 0
+        self._backlog = b''
 
     # Pattern matching ANSI escape codes starting with a Control Sequence
     # Introducer (CSI) sequence.  Most notably Select Graphic Rendition (SGR)
     # such as ‘\x1b[35;41m’.
-    _CSI_RE = re.compile('\x1b\\[[^\x40-\x7E]*[\x40-\x7E]')
+    _CSI_RE = re.compile(b'\x1b\\[[^\x40-\x7E]*[\x40-\x7E]')
+
+    def _strip(self, data: bytes) -> bytes:
+        if b'\x1b' in data:
+            data = self._CSI_RE.sub(b'', data)
+        return data
+
+    def _read_chunks(self) -> typing.Iterator[typing.Tuple[bytes, int]]:
+        """Yields data from the file starting from the offset.
 
-    def _read_file(self) -> str:
-        """Returns data from the file starting from the offset."""
-        with open(self.fname) as rd:
-            rd.seek(self.offset)
-            data = rd.read()
-            self.offset = rd.tell()
-        # Strip ANSI codes
-        return self._CSI_RE.sub('', data)
+        Data is yielded in chunks of lines with ANSI codes stripped.  Escape
+        codes never span lines so they're never split between chunks.  All
+        lines but the one at the end of the file are complete.
+
+        Each chunk is yielded along with the number of its leading bytes
+        which have been yielded before as part of the incomplete last line;
+        matches ending within them have been seen already.
+        """
+        if self._backlog:
+            data, self._backlog = self._backlog, b''
+            yield data, 0
+        size = os.fstat(self._file.fileno()).st_size
+        if size < self._offset:
+            # The file was truncated; start over.
+            self.offset = 0
+        while self._offset < size:
+            self._file.seek(self._offset)
+            data = self._file.read(min(self.CHUNK_SIZE, size - self._offset))
+            if not data:
+                break
+            self._offset += len(data)
+            data = self._pending + data
+            end = data.rfind(b'\n') + 1
+            self._pending = data[end:]
+            if end:
+                scanned, self._pending_scanned = self._pending_scanned, 0
+                yield self._strip(data[:end]), scanned
+        if self._pending:
+            data = self._strip(self._pending)
+            if len(data) > self._pending_scanned:
+                scanned, self._pending_scanned = self._pending_scanned, len(
+                    data)
+                yield data, scanned
+
+    @staticmethod
+    def _compile(patterns: typing.Sequence[str]) -> typing.Pattern[bytes]:
+        return re.compile(b'|'.join(
+            re.escape(pattern.encode()) for pattern in patterns))
+
+    def find(self, patterns: typing.Iterable[str]) -> typing.Optional[str]:
+        """Returns the first of the patterns found in new logs, if any.
+
+        Logs up to the end of the line the pattern was found in are consumed
+        so the next call continues after it.
+        """
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        matcher = self._compile(patterns)
+        for data, scanned in self._read_chunks():
+            match = matcher.search(data)
+            while match is not None and match.end() <= scanned:
+                match = matcher.search(data, match.start() + 1)
+            if match is not None:
+                end = data.find(b'\n', match.end()) + 1
+                if end:
+                    self._backlog = data[end:] + self._backlog
+                return match.group().decode()
+        return None
 
     def check(self, pattern: str) -> bool:
         """Check whether the pattern can be found in the logs."""
-        return pattern in self._read_file()
+        needle = pattern.encode()
+        found = False
+        for data, scanned in self._read_chunks():
+            start = max(0, scanned - len(needle) + 1)
+            found = found or data.find(needle, start) >= 0
+        return found
 
     def reset(self) -> None:
         """Resets log offset to beginning of the file."""
@@ -114,7 +277,62 @@ class LogTracker:
 
     def count(self, pattern: str) -> int:
         """Count number of occurrences of pattern in new logs."""
-        return self._read_file().count(pattern)
+        return self.counts([pattern])[pattern]
+
+    def counts(self, patterns: typing.Iterable[str]) -> typing.Dict[str, int]:
+        """Count number of occurrences of each of patterns in new logs."""
+        encoded = {pattern: pattern.encode() for pattern in patterns}
+        result = dict.fromkeys(encoded, 0)
+        for data, scanned in self._read_chunks():
+            for pattern, needle in encoded.items():
+                start = max(0, scanned - len(needle) + 1)
+                result[pattern] += data.count(needle, start)
+        return result
+
+    def _wait_for_write(self, timeout: float) -> None:
+        if self._inotify is None:
+            fd = _inotify_watch(self.fname)
+            self._inotify = -1 if fd is None else fd
+        if self._inotify < 0:
+            time.sleep(min(timeout, 0.1))
+            return
+        if select.select([self._inotify], [], [], timeout)[0]:
+            try:
+                while os.read(self._inotify, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def wait_for(self,
+                 patterns: typing.Iterable[str],
+                 timeout: float = 60) -> str:
+        """Waits until one of the patterns appears in new logs.
+
+        Args:
+            patterns: Pattern, or patterns, to wait for.
+            timeout: How long to wait, in seconds.
+        Returns:
+            The pattern found.  Logs are consumed up to the end of the line it
+            was found in.
+        Raises:
+            AssertionError: If none of the patterns appears before timeout
+                passes.
+        """
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        patterns = list(patterns)
+        end = time.monotonic() + timeout
+        while True:
+            found = self.find(patterns)
+            if found is not None:
+                return found
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                raise AssertionError(
+                    f'Timed out waiting for {patterns} in {self.fname}')
+            # Writes may also be missed between the scan and the wait; look
+            # at the file at least once a second anyway.
+            self._wait_for_write(min(remaining, 1))
 
 
 def chain_query(node, block_handler, *, block_hash=None, max_blocks=-1):
@@ -125,35 +343,21 @@ def chain_query(node, block_handler, *, block_hash=None, max_blocks=-1):
     """
     block_hash = block_hash or node.get_latest_block().hash
     initial_validators = node.validators()
-
-    if max_blocks == -1:
-        while True:
-            validators = node.validators()
-            if validators != initial_validators:
-                logger.critical(
-                    f'Fatal: validator set of node {node} changes, from {initial_validators} to {validators}'
-                )
-                sys.exit(1)
-            block = node.get_block(block_hash)['result']
-            block_handler(block)
-            block_hash = block['header']['prev_hash']
-            block_height = block['header']['height']
-            if block_height == 0:
-                break
-    else:
-        for _ in range(max_blocks):
+    # Blocks are fetched in batches; validators are checked once per batch.
+    batch_size = 50 if max_blocks == -1 else max(1, min(max_blocks, 50))
+
+    for count, block in enumerate(
+            node.walk_blocks(block_hash, batch_size=batch_size)):
+        if count == max_blocks:
+            break
+        if count % batch_size == 0:
             validators = node.validators()
             if validators != initial_validators:
                 logger.critical(
                     f'Fatal: validator set of node {node} changes, from {initial_validators} to {validators}'
                 )
                 sys.exit(1)
-            block = node.get_block(block_hash)['result']
-            block_handler(block)
-            block_hash = block['header']['prev_hash']
-            block_height = block['header']['height']
-            if block_height == 0:
-                break
+        block_handler(block)
 
 
 def get_near_tempdir(subdir=None, *, clean=False):
@@ -232,11 +436,18 @@ def obj_to_string(obj, extra='    ', full=False):
     if type(obj) in [tuple, list]:
         return "tuple" + '\n' + '\n'.join(
             (extra + obj_to_string(x, extra + '    ')) for x in obj)
-    elif hasattr(obj, "__dict__"):
+    elif hasattr(obj, "__dict__") or hasattr(obj, "__slots__"):
+        fields = getattr(obj, "__dict__", None)
+        if fields is None:
+            fields = {
+                item: getattr(obj, item)
+                for item in obj.__slots__
+                if hasattr(obj, item)
+            }
         return str(obj.__class__) + '\n' + '\n'.join(
-            extra + (str(item) + ' = ' +
-                     obj_to_string(obj.__dict__[item], extra + '    '))
-            for item in sorted(obj.__dict__))
+            extra +
+            (str(item) + ' = ' + obj_to_string(fields[item], extra + '    '))
+            for item in sorted(fields))
     elif isinstance(obj, bytes):
         if not full:
             if len(obj) > 10:
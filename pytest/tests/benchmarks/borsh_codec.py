@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""Compares interpreted, compiled and zero-copy Borsh serialization.
+
+Encodes and decodes a few representative messages (transactions, handshakes,
+routed messages, large SyncData and PartialEncodedChunk messages) using the
+interpreted `BinarySerializer`, the codec compiled by
+`serializer.compile_schema` and its zero-copy variant.  Prints number of
+operations per second for each as well as peak memory allocated while
+decoding a single message.
+
+Usage:
+
+    python3 pytest/tests/benchmarks/borsh_codec.py [--iterations N]
+"""
+
+import argparse
+import pathlib
+import sys
+import time
+import tracemalloc
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+from nacl.signing import SigningKey
+
+import lightclient
+import messages
+import peer
+import transaction
+from configured_logger import logger
+from key import Key
+from messages.crypto import PublicKey, Signature
+from messages.block import (PartialEncodedChunk, PartialEncodedChunkPart,
+                            PartialEncodedChunkV2)
+from messages.network import Edge, PeerMessage, RoutedMessageBody, SyncData
+from serializer import BinarySerializer
+
+
+def make_transaction(key):
+    return transaction.sign_function_call_tx(key, 'contract.near',
+                                             'ft_transfer',
+                                             b'{"receiver_id": "bob.near"}',
+                                             3 * 10**14, 1, 42, bytes(32))
+
+
+def make_sync_data(num_edges):
+    edges = []
+    for i in range(num_edges):
+        edge = Edge()
+        edge.peer0 = PublicKey()
+        edge.peer0.keyType = 0
+        edge.peer0.data = bytes([i % 256]) * 32
+        edge.peer1 = PublicKey()
+        edge.peer1.keyType = 0
+        edge.peer1.data = bytes([(i + 1) % 256]) * 32
+        edge.nonce = i
+        edge.signature0 = Signature()
+        edge.signature0.keyType = 0
+        edge.signature0.data = bytes(64)
+        edge.signature1 = Signature()
+        edge.signature1.keyType = 0
+        edge.signature1.data = bytes(64)
+        edge.removal_info = None
+        edges.append(edge)
+    msg = PeerMessage()
+    msg.enum = 'Sync'
+    msg.Sync = SyncData()
+    msg.Sync.edges = edges
+    msg.Sync.accounts = []
+    return msg
+
+
+def zero_value(field_type):
+    """Creates a value of given type with all fields zeroed."""
+    if type(field_type) == tuple:
+        return tuple(zero_value(t) for t in field_type) if field_type else ()
+    if type(field_type) == str:
+        return {'bool': False, 'string': ''}.get(field_type, 0)
+    if type(field_type) == list:
+        if type(field_type[0]) == int:
+            return bytes(field_type[0])
+        return []
+    if type(field_type) == dict:
+        return None
+    struct_schema = messages.schema[field_type]
+    ret = field_type()
+    if struct_schema['kind'] == 'struct':
+        for name, t in struct_schema['fields']:
+            setattr(ret, name, zero_value(t))
+    else:
+        name, t = next(
+            (name, t) for name, t in struct_schema['values'] if t is not None)
+        setattr(ret, struct_schema['field'], name)
+        setattr(ret, name, zero_value(t))
+    return ret
+
+
+def make_partial_encoded_chunk(num_parts, part_size):
+    chunk = PartialEncodedChunkV2()
+    chunk.header = zero_value(messages.block.ShardChunkHeader)
+    chunk.parts = []
+    for i in range(num_parts):
+        part = PartialEncodedChunkPart()
+        part.part_ord = i
+        part.part = bytes([i % 256]) * part_size
+        part.merkle_proof = zero_value(messages.crypto.MerklePath)
+        chunk.parts.append(part)
+    chunk.receipts = []
+    body = RoutedMessageBody()
+    body.enum = 'VersionedPartialEncodedChunk'
+    body.VersionedPartialEncodedChunk = PartialEncodedChunk()
+    body.VersionedPartialEncodedChunk.enum = 'V2'
+    body.VersionedPartialEncodedChunk.V2 = chunk
+    msg = zero_value(PeerMessage)
+    msg.enum = 'Routed'
+    msg.Routed = zero_value(messages.network.RoutedMessage)
+    msg.Routed.body = body
+    return msg
+
+
+def make_messages():
+    """Returns list of (name, schema, type, raw bytes) tuples to benchmark."""
+    key = Key.implicit_account()
+    signed_tx = make_transaction(key)
+    tx = BinarySerializer(transaction.schema).deserialize(
+        signed_tx, transaction.SignedTransaction)
+
+    tx_msg = PeerMessage()
+    tx_msg.enum = 'Transaction'
+    tx_msg.Transaction = tx
+
+    node_key = SigningKey.generate()
+    handshake = peer.create_handshake(node_key, 'ed25519:' + '1' * 32, 24567)
+
+    body = RoutedMessageBody()
+    body.enum = 'ForwardTx'
+    body.ForwardTx = tx
+
+    class Target:
+        node_key = key
+
+    routed = peer.create_and_sign_routed_peer_message(body, Target, node_key)
+
+    inner_lite = lightclient.BlockHeaderInnerLite()
+    inner_lite.height = 123456
+    inner_lite.epoch_id = bytes(32)
+    inner_lite.next_epoch_id = bytes(32)
+    inner_lite.prev_state_root = bytes(32)
+    inner_lite.outcome_root = bytes(32)
+    inner_lite.timestamp = int(time.time() * 1e9)
+    inner_lite.next_bp_hash = bytes(32)
+    inner_lite.block_merkle_root = bytes(32)
+
+    ret = [
+        ('SignedTransaction', transaction.schema, transaction.SignedTransaction,
+         signed_tx),
+        ('BlockHeaderInnerLite', lightclient.inner_lite_schema,
+         lightclient.BlockHeaderInnerLite,
+         BinarySerializer(lightclient.inner_lite_schema).serialize(inner_lite)),
+    ]
+    for name, msg in (
+        ('PeerMessage::Transaction', tx_msg),
+        ('PeerMessage::Handshake', handshake),
+        ('PeerMessage::Routed(ForwardTx)', routed),
+        ('PeerMessage::Sync(500 edges)', make_sync_data(500)),
+        ('PeerMessage::Routed(PartialEncodedChunk 16x64KiB)',
+         make_partial_encoded_chunk(16, 64 * 1024)),
+    ):
+        raw = BinarySerializer(messages.schema).serialize(msg)
+        ret.append((name, messages.schema, PeerMessage, raw))
+    return ret
+
+
+def measure(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return iterations / (time.perf_counter() - start)
+
+
+def peak_memory(fn):
+    """Returns peak memory in bytes allocated by a single call to fn."""
+    tracemalloc.start()
+    try:
+        ret = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del ret
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    for name, schema, type_, raw in make_messages():
+        obj = BinarySerializer(schema).deserialize(raw, type_)
+        compiled = BinarySerializer(schema, compiled=True)
+        assert compiled.serialize(obj) == raw, name
+        assert BinarySerializer(schema).serialize(
+            compiled.deserialize(raw, type_)) == raw, name
+
+        # Large messages get fewer iterations so the run stays short.
+        iterations = max(3, args.iterations * 200 // max(200, len(raw)))
+        encode = {
+            'interpreted':
+                lambda: BinarySerializer(schema).serialize(obj),
+            'compiled':
+                lambda: BinarySerializer(schema, compiled=True).serialize(obj),
+        }
+        decode = {
+            'interpreted':
+                lambda: BinarySerializer(schema).deserialize(raw, type_),
+            'compiled':
+                lambda: BinarySerializer(schema, compiled=True).deserialize(
+                    raw, type_),
+            'zero-copy':
+                lambda: BinarySerializer(schema, zero_copy=True).deserialize(
+                    raw, type_),
+        }
+
+        logger.info(f'{name} ({len(raw)} bytes)')
+        for label, fns in (('encode', encode), ('decode', decode)):
+            baseline = None
+            for mode, fn in fns.items():
+                ops = measure(fn, iterations)
+                baseline = baseline or ops
+                line = (f'  {label} {mode:>11}: {ops:10.0f} ops/s '
+                        f'({ops / baseline:4.1f}x)')
+                if label == 'decode':
+                    line += f', peak memory {peak_memory(fn) / 1024:9.1f} KiB'
+                logger.info(line)
+
+
+if __name__ == '__main__':
+    main()
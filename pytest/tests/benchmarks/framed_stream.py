@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Measures throughput of framed message streams.
+
+Sends a flood of messages over a socket pair once writing and draining every
+message separately (as peer.Connection and the proxy used to) and once with
+framing.FramedStream which coalesces writes and drains only on high water
+mark.
+
+Usage:
+
+    python3 pytest/tests/benchmarks/framed_stream.py [--messages N] [--size B]
+"""
+
+import argparse
+import asyncio
+import pathlib
+import socket
+import struct
+import sys
+import time
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import framing
+from configured_logger import logger
+
+
+async def drain_each(writer, reader, frames):
+
+    async def send():
+        for frame in frames:
+            writer.write(struct.pack('I', len(frame)))
+            writer.write(frame)
+            await writer.drain()
+
+    async def recv():
+        for _ in frames:
+            length = struct.unpack('I', await reader.read(4))[0]
+            data = b''
+            while len(data) < length:
+                data += await reader.read(length - len(data))
+
+    await asyncio.gather(send(), recv())
+
+
+async def framed(writer, reader, frames):
+    sender = framing.FramedStream(None, writer)
+    receiver = framing.FramedStream(reader, None)
+
+    async def send():
+        for frame in frames:
+            await sender.send_frame(frame)
+        sender.flush()
+
+    async def recv():
+        for _ in frames:
+            await receiver.read_frame()
+
+    await asyncio.gather(send(), recv())
+    return sender.stats
+
+
+async def run(name, fn, frames):
+    sock_a, sock_b = socket.socketpair()
+    _, writer = await asyncio.open_connection(sock=sock_a)
+    reader, _ = await asyncio.open_connection(sock=sock_b)
+    start = time.perf_counter()
+    stats = await fn(writer, reader, frames)
+    elapsed = time.perf_counter() - start
+    line = (f'{name:>10}: {len(frames) / elapsed:9.0f} msg/s, '
+            f'{sum(map(len, frames)) / elapsed / 2**20:7.1f} MiB/s')
+    if stats:
+        line += f', {stats.writes} writes, {stats.drains} drains'
+    logger.info(line)
+    sock_a.close()
+    sock_b.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--size', type=int, default=200)
+    args = parser.parse_args()
+    frames = [bytes(args.size)] * args.messages
+    asyncio.run(run('drain each', drain_each, frames))
+    asyncio.run(run('framed', framed, frames))
+
+
+if __name__ == '__main__':
+    main()
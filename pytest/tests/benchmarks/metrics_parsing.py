@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Compares parsing of a neard /metrics page.
+
+Extracts the metrics `metrics.Metrics` and `MetricsSampler` look at:
+
+* with `prometheus_client.parser.text_string_to_metric_families`, the way
+  `metrics.py` used to, and
+* with `metrics_parser.MetricsParser`, from bytes and fed in 64 KiB chunks.
+
+By default the page is synthesised to resemble that of a neard node tracking
+four shards with a few hundred peers: thousands of labelled series of which
+a few dozen samples are extracted.  A page captured from a node, e.g. with
+`curl http://127.0.0.1:3030/metrics > metrics.txt`, can be given instead.
+
+Usage:
+
+    python3 pytest/tests/benchmarks/metrics_parsing.py [--page FILE] [--runs N]
+"""
+
+import argparse
+import pathlib
+import random
+import sys
+import time
+
+from prometheus_client import parser
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import metrics_parser
+import metrics_sampler
+from configured_logger import logger
+
+BOUNDS = ('0.005', '0.01', '0.025', '0.05', '0.1', '0.25', '0.5', '1', '2.5',
+          '5', '10', '+Inf')
+MESSAGE_TYPES = ('Block', 'BlockHeaders', 'Transaction', 'Routed',
+                 'PartialEncodedChunk', 'PartialEncodedChunkRequest',
+                 'PartialEncodedChunkResponse', 'SyncAccountsData', 'Ping',
+                 'Pong', 'Challenge', 'EpochSyncRequest', 'StateRequestPart')
+
+
+def histogram(lines, name, labels, rng):
+    prefix = ','.join(f'{k}="{v}"' for k, v in labels.items())
+    prefix = prefix + ',' if prefix else ''
+    count = 0
+    for bound in BOUNDS:
+        count += rng.randrange(1000)
+        lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+    labels = f'{{{prefix[:-1]}}}' if prefix else ''
+    lines.append(f'{name}_sum{labels} {count * 0.12}')
+    lines.append(f'{name}_count{labels} {count}')
+
+
+def synthesise_page(num_peers=300, num_shards=4, seed=0):
+    """Returns a /metrics page shaped like that of a busy neard node."""
+    rng = random.Random(seed)
+    lines = []
+
+    def family(name, type_, help_):
+        lines.append(f'# HELP {name} {help_}')
+        lines.append(f'# TYPE {name} {type_}')
+
+    family('near_block_processing_time', 'histogram', 'Block processing time')
+    histogram(lines, 'near_block_processing_time', {}, rng)
+    for name in ('near_block_processed_total',
+                 'near_transaction_processed_total',
+                 'near_chunk_produced_total', 'near_block_produced_total'):
+        family(name, 'counter', name)
+        lines.append(f'{name} {rng.randrange(10**7)}')
+    for name in ('near_memory_usage_bytes', 'near_blocks_per_minute',
+                 'near_block_height_head', 'near_peer_connections_total'):
+        family(name, 'gauge', name)
+        lines.append(f'{name} {rng.randrange(10**9)}')
+    for name in ('near_peer_message_received_by_type_total',
+                 'near_peer_message_received_by_type_bytes',
+                 'near_peer_message_sent_by_type_total'):
+        family(name, 'counter', name)
+        for peer in range(num_peers):
+            for type_ in MESSAGE_TYPES:
+                lines.append(f'{name}{{peer_id="ed25519:peer{peer}",'
+                             f'type="{type_}"}} {rng.randrange(10**6)}')
+    family('near_peer_message_latency', 'histogram', 'Message latency')
+    for type_ in MESSAGE_TYPES:
+        histogram(lines, 'near_peer_message_latency', {'type': type_}, rng)
+    for name in ('near_applying_chunks_time', 'near_chunk_tgas_used_hist',
+                 'near_apply_chunk_delay_seconds'):
+        family(name, 'histogram', name)
+        for shard in range(num_shards):
+            histogram(lines, name, {'shard_id': str(shard)}, rng)
+    for name in ('near_database_op_latency_by_op_and_column',
+                 'near_store_write_latency'):
+        family(name, 'histogram', name)
+        for column in range(60):
+            for op in ('get', 'set', 'delete'):
+                histogram(lines, name, {
+                    'op': op,
+                    'column': f'Col{column}'
+                }, rng)
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def reference_parse(page, metrics):
+    return [
+        sample
+        for family in parser.text_string_to_metric_families(page.decode())
+        if family.name in metrics for sample in family.samples
+    ]
+
+
+def fed_parse(page, parser_, chunk_size=65536):
+    samples = []
+    for i in range(0, len(page), chunk_size):
+        samples.extend(parser_.feed(page[i:i + chunk_size]))
+    samples.extend(parser_.close())
+    return samples
+
+
+def measure(name, fn, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        samples = fn()
+    elapsed = (time.perf_counter() - start) / runs
+    logger.info(f'{name:>28}: {elapsed * 1e3:8.2f} ms per page, '
+                f'{len(samples)} samples')
+    return elapsed
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    argparser.add_argument('--page', help='captured /metrics page')
+    argparser.add_argument('--runs', type=int, default=20)
+    args = argparser.parse_args()
+
+    if args.page:
+        page = pathlib.Path(args.page).read_bytes()
+    else:
+        page = synthesise_page()
+    lines = page.count(b'\n')
+    logger.info(f'Page of {len(page)} bytes, {lines} lines')
+
+    metrics = metrics_sampler.DEFAULT_SERIES
+    parser_ = metrics_parser.MetricsParser(metrics)
+    baseline = measure('prometheus_client',
+                       lambda: reference_parse(page, metrics), args.runs)
+    for name, fn in (
+        ('MetricsParser.parse', lambda: parser_.parse(page)),
+        ('MetricsParser.feed', lambda: fed_parse(page, parser_)),
+    ):
+        elapsed = measure(name, fn, args.runs)
+        logger.info(f'{name:>28}: {baseline / elapsed:.1f}x faster')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Compares memory and latency of NodesProxy modes.
+
+Proxifies a number of fake nodes, which send every message back, using one
+process per node (the default), a single shared event loop thread and
+a couple of worker processes.  For each mode prints memory (USS) used by the
+proxy processes and round trip latency of messages sent through the proxy
+(every message goes through the handler twice).
+
+Usage:
+
+    python3 pytest/tests/benchmarks/nodes_proxy.py [--nodes N] [--messages M]
+"""
+
+import argparse
+import pathlib
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import time
+
+import psutil
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import echo_nodes
+import proxy
+from configured_logger import logger
+from messages import schema
+from messages.network import PeerMessage
+from serializer import BinarySerializer
+
+MODES = {'process per node': None, 'single thread': 0, '2 workers': 2}
+
+
+def serve(workers, ports):
+    """Runs the proxy of nodes on given ports until stdin is closed."""
+    nodes_proxy = proxy.NodesProxy(proxy.ProxyHandler, workers=workers)
+    for port in ports:
+        node = echo_nodes.EchoNode(port)
+        nodes_proxy.proxify_node(node)
+        node._start_proxy()
+    print('ready', flush=True)
+    sys.stdin.read()
+
+
+def memory_usage(pid):
+    """Returns unique memory of the process and all its descendants."""
+    process = psutil.Process(pid)
+    return sum(p.memory_full_info().uss
+               for p in [process] + process.children(recursive=True))
+
+
+def measure_latency(ports, num_messages):
+    msg = PeerMessage()
+    msg.enum = 'BlockRequest'
+    msg.BlockRequest = bytes(32)
+    raw = BinarySerializer(schema).serialize(msg)
+    frame = struct.pack('I', len(raw)) + raw
+
+    socks = [socket.create_connection(('127.0.0.1', port)) for port in ports]
+    latencies = []
+    for i in range(num_messages):
+        sock = socks[i % len(socks)]
+        start = time.perf_counter()
+        sock.sendall(frame)
+        assert sock.recv(len(frame), socket.MSG_WAITALL) == frame
+        latencies.append(time.perf_counter() - start)
+    for sock in socks:
+        sock.close()
+    return latencies
+
+
+def run_mode(name, workers, nodes, args):
+    cmd = [
+        sys.executable, __file__, '--serve',
+        str(workers), '--ports', ','.join(str(node.port) for node in nodes)
+    ]
+    server = subprocess.Popen(cmd,
+                              stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE,
+                              text=True)
+    try:
+        assert server.stdout.readline().strip() == 'ready'
+        memory = memory_usage(server.pid)
+        latencies = sorted(
+            measure_latency([node.port + 100 for node in nodes], args.messages))
+    finally:
+        server.stdin.close()
+        server.wait(10)
+    median = statistics.median(latencies) * 1e6
+    p99 = latencies[int(len(latencies) * 0.99)] * 1e6
+    logger.info(f'{name:>16}: memory {memory / 2**20:7.1f} MiB, '
+                f'latency median {median:6.0f} µs, p99 {p99:6.0f} µs')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--nodes', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    parser.add_argument('--ports', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    assert 0 < args.nodes <= 100
+
+    if args.serve is not None:
+        serve(None if args.serve == 'None' else int(args.serve),
+              [int(port) for port in args.ports.split(',')])
+        return
+
+    nodes = echo_nodes.start(args.nodes)
+    logger.info(f'{args.nodes} nodes, {args.messages} messages')
+    for name, workers in MODES.items():
+        run_mode(name, workers, nodes, args)
+
+
+if __name__ == '__main__':
+    main()
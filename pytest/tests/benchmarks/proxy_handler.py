@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Measures per-message CPU cost of the proxy message handling.
+
+Runs `ProxyHandler._handle` on a few kinds of messages with a handler which,
+like `RejectListHandler`, looks only at the kind of the message and lets it
+through.  Compares lazy decoding (the default) with full decoding of every
+message.
+
+Usage:
+
+    python3 pytest/tests/benchmarks/proxy_handler.py [--iterations N]
+"""
+
+import argparse
+import asyncio
+import pathlib
+import sys
+import time
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import borsh_codec
+from configured_logger import logger
+from messages.network import PeerMessage
+from proxy import ProxyHandler
+
+
+class KindHandler(ProxyHandler):
+
+    async def handle(self, msg, fr, to):
+        msg_type = msg.enum if msg.enum != 'Routed' else msg.Routed.body.enum
+        return msg_type is not None
+
+
+class EagerKindHandler(KindHandler):
+    lazy_decoding = False
+
+
+async def measure(handler_cls, raw, iterations):
+    handler = handler_cls(0)
+    kw = {
+        'writer': None,
+        'sender_port_holder': [24578 + 100],
+        'receiver_port_holder': [24577 + 100],
+        'ordinal_to_writer': {},
+    }
+    start = time.perf_counter()
+    for _ in range(iterations):
+        assert await handler._handle(raw, **kw) is True
+    return iterations / (time.perf_counter() - start)
+
+
+async def run(iterations):
+    for name, schema, type_, raw in borsh_codec.make_messages():
+        if type_ is not PeerMessage or name.endswith('Handshake'):
+            continue
+        # Large messages get fewer iterations so the run stays short.
+        count = max(3, iterations * 200 // max(200, len(raw)))
+        eager = await measure(EagerKindHandler, raw, count)
+        lazy = await measure(KindHandler, raw, count)
+        logger.info(f'{name} ({len(raw)} bytes): {eager:9.0f} msg/s eager, '
+                    f'{lazy:9.0f} msg/s lazy ({lazy / eager:.1f}x)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""Compares status and block fetch throughput of JSON-RPC clients.
+
+Starts a fake RPC server, in a separate process, answering /status and
+`block` requests with responses of realistic size and measures requests per
+second achieved by:
+
+* `requests`, opening a connection per request, as `BaseNode` used to do,
+* `rpc_client.RpcClient` issuing requests one by one over a kept-alive
+  connection and
+* `RpcClient.json_rpc_many` fetching blocks with a number of requests in
+  flight.
+
+Usage:
+
+    python3 pytest/tests/benchmarks/rpc_throughput.py [--requests N]
+"""
+
+import argparse
+import pathlib
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import rpc_client
+from configured_logger import logger
+
+STATUS = {
+    'chain_id': 'localnet',
+    'sync_info': {
+        'latest_block_hash': 'A' * 44,
+        'latest_block_height': 1234,
+        'latest_state_root': 'B' * 44,
+        'latest_block_time': '2022-01-01T00:00:00.000000000Z',
+        'syncing': False,
+    },
+    'validators': [{
+        'account_id': f'test{i}',
+        'is_slashed': False
+    } for i in range(4)],
+    'version': {
+        'build': 'benchmark',
+        'version': 'trunk'
+    },
+}
+
+BLOCK = {
+    'author':
+        'test0',
+    'header': {
+        'height': 1234,
+        'hash': 'A' * 44,
+        'prev_hash': 'C' * 44,
+        'timestamp': 1640995200000000000,
+        'chunks_included': 4,
+    },
+    'chunks': [{
+        'chunk_hash': 'D' * 44,
+        'shard_id': i,
+        'gas_used': 0,
+        'gas_limit': 1000000000000000,
+        'outcome_root': 'E' * 44,
+        'tx_root': 'F' * 44,
+    } for i in range(4)],
+}
+
+
+def serve(port):
+    from aiohttp import web
+
+    async def status(request):
+        return web.json_response(STATUS)
+
+    async def rpc(request):
+        body = await request.json()
+        return web.json_response({
+            'jsonrpc': '2.0',
+            'id': body['id'],
+            'result': BLOCK
+        })
+
+    app = web.Application()
+    app.router.add_get('/status', status)
+    app.router.add_post('/', rpc)
+    web.run_app(app, host='127.0.0.1', port=port, print=None)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(addr):
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(addr).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def requests_status(addr):
+    r = requests.get('http://%s:%s/status' % addr, timeout=10)
+    r.raise_for_status()
+    return r.json()
+
+
+def requests_block(addr, height):
+    j = {
+        'method': 'block',
+        'params': {
+            'block_id': height
+        },
+        'id': 'dontcare',
+        'jsonrpc': '2.0'
+    }
+    r = requests.post('http://%s:%s' % addr, json=j, timeout=10)
+    r.raise_for_status()
+    return r.json()
+
+
+def measure(fn, count):
+    start = time.perf_counter()
+    fn(count)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve)
+        return
+
+    addr = ('127.0.0.1', free_port())
+    server = subprocess.Popen(
+        [sys.executable, __file__, '--serve',
+         str(addr[1])])
+    try:
+        wait_for_server(addr)
+        client = rpc_client.RpcClient(concurrency=args.concurrency)
+        blocks = [('block', {'block_id': height}) for height in range(100)]
+        cases = (
+            ('status', 'requests',
+             lambda n: [requests_status(addr) for _ in range(n)]),
+            ('status', 'RpcClient',
+             lambda n: [client.get_status(addr) for _ in range(n)]),
+            ('block', 'requests',
+             lambda n: [requests_block(addr, height) for height in range(n)]),
+            ('block', 'RpcClient', lambda n: [
+                client.json_rpc(addr, 'block', {'block_id': height})
+                for height in range(n)
+            ]),
+            ('block', f'json_rpc_many x{args.concurrency}', lambda n: [
+                client.json_rpc_many(addr, blocks)
+                for _ in range(n // len(blocks))
+            ]),
+        )
+        baselines = {}
+        for name, mode, fn in cases:
+            fn(10)
+            rate = measure(fn, args.requests)
+            baseline = baselines.setdefault(name, rate)
+            logger.info(f'{name:>6} {mode:>20}: {rate:8.0f} req/s '
+                        f'({rate / baseline:4.1f}x)')
+        client.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
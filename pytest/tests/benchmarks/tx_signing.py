@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Compares transaction signing throughput.
+
+Signs payment transactions:
+
+* the way `transaction.py` used to: decoding the key and creating an
+  `ed25519.SigningKey` for every transaction and serializing the transaction
+  twice,
+* with `transaction.sign_payment_tx` which uses a cached `TxSigner`,
+* with `TxSigner.sign_many` in the calling process,
+* with `TxSigner.sign_many` fanned out over a process pool and
+* with `TxTemplate` patching nonce and block hash in pre-encoded transaction,
+  one by one and with `TxTemplate.sign_many`.
+
+Usage:
+
+    python3 pytest/tests/benchmarks/tx_signing.py [--txs N] [--processes P]
+"""
+
+import argparse
+import concurrent.futures
+import os
+import pathlib
+import sys
+import time
+
+import ed25519
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import transaction
+from configured_logger import logger
+from key import Key
+from serializer import BinarySerializer
+
+
+def legacy_sign_payment_tx(key, to, amount, nonce, block_hash):
+    actions = [transaction.create_payment_action(amount)]
+    tx, hash_ = transaction.compute_tx_hash(to, nonce, actions, block_hash,
+                                            key.account_id, key.decoded_pk())
+    signature = transaction.Signature()
+    signature.keyType = 0
+    signature.data = ed25519.SigningKey(key.decoded_sk()).sign(hash_)
+    signed = transaction.SignedTransaction()
+    signed.transaction = tx
+    signed.signature = signature
+    return BinarySerializer(transaction.schema, compiled=True).serialize(signed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--txs', type=int, default=20000)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    key = Key.implicit_account()
+    block_hash = bytes(32)
+    signer = transaction.get_signer(key)
+    txs = [('bob.near', nonce, [transaction.create_payment_action(1)],
+            block_hash) for nonce in range(args.txs)]
+
+    with concurrent.futures.ProcessPoolExecutor(args.processes) as executor:
+        # Start the workers before measuring.
+        signer.sign_many(txs[:args.processes], executor=executor, chunk_size=1)
+        template = signer.template([transaction.create_payment_action(1)],
+                                   'bob.near')
+        params = [(nonce, block_hash) for nonce in range(args.txs)]
+        cases = (
+            # The legacy path is slow; sign fewer transactions.
+            ('legacy', len(txs) // 10, lambda n: [
+                legacy_sign_payment_tx(key, 'bob.near', 1, nonce, block_hash)
+                for nonce in range(n)
+            ]),
+            ('sign_payment_tx', len(txs), lambda n: [
+                transaction.sign_payment_tx(key, 'bob.near', 1, nonce,
+                                            block_hash) for nonce in range(n)
+            ]),
+            ('sign_many', len(txs), lambda n: signer.sign_many(txs[:n])),
+            (f'sign_many x{args.processes} processes', len(txs),
+             lambda n: signer.sign_many(txs[:n], executor=executor)),
+            ('TxTemplate.sign', len(txs),
+             lambda n: [template.sign(*tx) for tx in params[:n]]),
+            ('TxTemplate.sign_many', len(txs),
+             lambda n: template.sign_many(params[:n])),
+        )
+        baseline = None
+        for name, count, fn in cases:
+            start = time.perf_counter()
+            fn(count)
+            rate = count / (time.perf_counter() - start)
+            baseline = baseline or rate
+            logger.info(
+                f'{name:>26}: {rate:9.0f} tx/s ({rate / baseline:5.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -4,124 +4,44 @@ Generates transactions on a mocknet node.
 This file is uploaded to each mocknet node and run there.
 """
 
-import json
 import random
 import sys
+import threading
 import time
 
-import base58
-import requests
-from rc import pmap
-
 # Don't use the pathlib magic because this file runs on a remote machine.
 sys.path.append('lib')
 import mocknet_helpers
 import account
+import cluster
 import key
+import load_generator
 import mocknet
+import tx_tracker
 from configured_logger import logger
 
 # We need to slowly deploy contracts, otherwise we stall out the nodes
 CONTRACT_DEPLOY_TIME = 10 * mocknet.NUM_ACCOUNTS
 TEST_TIMEOUT = 12 * 60 * 60
+# How long to generate load between reports.
+LOAD_WINDOW = 10 * 60
+# How often to fetch the block hash transactions refer to.
+BLOCK_HASH_REFRESH = 60
 
 
-def send_transfer(account, node_account):
-    next_id = random.randrange(mocknet.NUM_ACCOUNTS)
-    dest_account_id = mocknet.load_testing_account_id(
-        node_account.key.account_id, next_id)
-    mocknet_helpers.retry_and_ignore_errors(
-        lambda: account.send_transfer_tx(dest_account_id))
-
-
-def function_call_set_delete_state(account, i, node_account):
-    assert i < len(function_call_state)
+def keep_staking(node_account, stop):
+    """Repeats the staking transactions every `mocknet.STAKING_TIMEOUT`.
 
-    if not function_call_state[i]:
-        action = "add"
-    elif len(function_call_state[i]) >= 100:
-        action = "delete"
-    else:
-        action = random.choice(["add", "delete"])
-
-    if action == "add":
-        next_id = random.randrange(mocknet.NUM_ACCOUNTS)
-        next_val = random.randint(0, 1000)
-        next_account_id = mocknet.load_testing_account_id(
-            node_account.key.account_id, next_id)
-        s = f'{{"account_id": "account_{next_val}", "message":"{next_val}"}}'
-        logger.info(
-            f'Calling function "set_state" of account {next_account_id} with arguments {s} from account {account.key.account_id}'
-        )
-        tx_res = mocknet_helpers.retry_and_ignore_errors(
-            lambda: account.send_call_contract_raw_tx(
-                next_account_id, 'set_state', s.encode('utf-8'), 0))
-        logger.info(
-            f'{account.key.account_id} set_state on {next_account_id} {tx_res}')
-        function_call_state[i].append((next_id, next_val))
-    else:
-        assert function_call_state[i]
-        item = random.choice(function_call_state[i])
-        (next_id, next_val) = item
-        next_account_id = mocknet.load_testing_account_id(
-            node_account.key.account_id, next_id)
-        s = f'{{"account_id": "account_{next_val}"}}'
-        logger.info(
-            f'Calling function "delete_state" of account {next_account_id} with arguments {s} from account {account.key.account_id}'
-        )
-        tx_res = mocknet_helpers.retry_and_ignore_errors(
-            lambda: account.send_call_contract_raw_tx(
-                next_account_id, 'delete_state', s.encode('utf-8'), 0))
-        logger.info(
-            f'{account.key.account_id} delete_state on {next_account_id} {tx_res}'
-        )
-        if item in function_call_state[i]:
-            function_call_state[i].remove(item)
-            logger.info(
-                f'Successfully removed {item} from function_call_state. New #items: {len(function_call_state[i])}'
-            )
-        else:
-            logger.info(
-                f'{item} is not in function_call_state even though this is impossible. #Items: {len(function_call_state[i])}'
-            )
-
-
-def function_call_ft_transfer_call(account, i, node_account):
-    next_id = random.randint(0, mocknet.NUM_ACCOUNTS - 1)
-    dest_account_id = mocknet.load_testing_account_id(
-        node_account.key.account_id, next_id)
-
-    s = f'{{"receiver_id": "{dest_account_id}", "amount": "3", "msg": "\\"hi\\""}}'
-    logger.info(
-        f'Calling function "ft_transfer_call" with arguments {s} on account {account.key.account_id} contract {dest_account_id}'
-    )
-    tx_res = mocknet_helpers.retry_and_ignore_errors(
-        lambda: account.send_call_contract_raw_tx(
-            dest_account_id, 'ft_transfer_call', s.encode('utf-8'), 1))
-    logger.info(
-        f'{account.key.account_id} ft_transfer to {dest_account_id} {tx_res}')
-
-
-QUERIES_PER_TX = 5
-
-
-def random_transaction(account, i, node_account, max_tps_per_node):
-    time.sleep(random.random() * mocknet.NUM_ACCOUNTS / max_tps_per_node / 3)
-    choice = random.randint(0, 2)
-    if choice == 0:
-        logger.info(f'Account {i} transfers')
-        send_transfer(account, node_account)
-    elif choice == 1:
-        function_call_set_delete_state(account, i, node_account)
-    elif choice == 2:
-        function_call_ft_transfer_call(account, i, node_account)
-
-
-def send_random_transactions(node_account, test_accounts, max_tps_per_node):
-    pmap(
-        lambda index_and_account: random_transaction(index_and_account[
-            1], index_and_account[0], node_account, max_tps_per_node),
-        enumerate(test_accounts))
+    Staking is repeated in case the validator selection algorithm changes.
+    Runs until `stop` is set.
+    """
+    last_staking = 0
+    while True:
+        staked_time = mocknet.stake_available_amount(node_account, last_staking)
+        if staked_time is not None:
+            last_staking = staked_time
+        if stop.wait(mocknet.STAKING_TIMEOUT):
+            return
 
 
 def write_tx_events(accounts_and_indices, filename):
@@ -236,26 +156,42 @@ def main(argv):
 
     logger.info('Done deploying')
 
-    global function_call_state
-    function_call_state = [[]] * mocknet.NUM_ACCOUNTS
-
-    # begin with only transfers for TPS measurement
-    total_tx_sent, elapsed_time = 0, 0
+    receivers = [
+        mocknet.load_testing_account_id(node_account.key.account_id, i)
+        for i in range(mocknet.NUM_ACCOUNTS)
+    ]
+    tracker = tx_tracker.TxTracker(cluster.RpcNode(*node_account.rpc_infos[0]))
+    generator = load_generator.LoadGenerator(
+        test_accounts, [
+            load_generator.transfer(receivers),
+            load_generator.set_delete_state(receivers),
+            load_generator.ft_transfer_call(receivers),
+        ],
+        node_account.rpc_infos,
+        rate=max_tps_per_node,
+        block_hash_refresh=BLOCK_HASH_REFRESH,
+        tracker=tracker)
     logger.info(
         f'Start the test, expected TPS {max_tps_per_node} over the next {TEST_TIMEOUT} seconds'
     )
-    last_staking = 0
+    # Staking runs on its own timer so that load is generated in long windows.
+    stop_staking = threading.Event()
+    staking = threading.Thread(target=keep_staking,
+                               args=(node_account, stop_staking),
+                               daemon=True)
+    staking.start()
     start_time = time.monotonic()
-    while time.monotonic() - start_time < TEST_TIMEOUT:
-        # Repeat the staking transactions in case the validator selection algorithm changes.
-        staked_time = mocknet.stake_available_amount(node_account, last_staking)
-        if staked_time is not None:
-            last_staking = staked_time
-
-        elapsed_time = time.monotonic() - start_time
-        total_tx_sent = mocknet_helpers.throttle_txns(
-            send_random_transactions, total_tx_sent, elapsed_time,
-            max_tps_per_node, node_account, test_accounts)
+    try:
+        while time.monotonic() - start_time < TEST_TIMEOUT:
+            generator.run_sync(
+                min(LOAD_WINDOW,
+                    TEST_TIMEOUT - (time.monotonic() - start_time)))
+            generator.report.log()
+            tracker.poll()
+            tracker.log()
+    finally:
+        stop_staking.set()
+        staking.join()
     logger.info('Stop the test')
 
     write_tx_events(test_accounts, f'{mocknet.TX_OUT_FILE}.0')
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""Tests that compiled Borsh codec matches the interpreted BinarySerializer.
+
+Generates random objects for every type in the message schemas and checks
+that both serializers produce identical bytes and decode them back into
+identical objects.  The test does not start any nodes.
+"""
+
+import pathlib
+import random
+import sys
+import unittest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import lightclient
+import messages
+import serializer
+import transaction
+
+SCHEMAS = (messages.schema, transaction.schema, lightclient.inner_lite_schema)
+
+
+def is_supported(schema, field_type, seen=()):
+    """Returns whether values of given type can be serialised at all.
+
+    Some enum variants in the schema are placeholders (`None`) and some types
+    are referenced but not described; such values cannot be serialised.
+    """
+    if field_type is None:
+        return False
+    if type(field_type) == tuple:
+        return all(is_supported(schema, t, seen) for t in field_type)
+    if type(field_type) == list:
+        return (type(field_type[0]) == int or
+                is_supported(schema, field_type[0], seen))
+    if type(field_type) == dict:
+        return is_supported(schema, field_type['type'], seen)
+    if type(field_type) == type:
+        if field_type in seen:
+            return True
+        if field_type not in schema:
+            return False
+        struct_schema = schema[field_type]
+        seen = seen + (field_type,)
+        if struct_schema['kind'] == 'struct':
+            return all(
+                is_supported(schema, t, seen)
+                for _, t in struct_schema['fields'])
+        return any(
+            is_supported(schema, t, seen) for _, t in struct_schema['values'])
+    return True
+
+
+def random_value(schema, field_type, rng, depth=0):
+    """Generates a random value of given type."""
+    if type(field_type) == tuple:
+        if not field_type:
+            return ()
+        return tuple(random_value(schema, t, rng, depth) for t in field_type)
+    if type(field_type) == str:
+        if field_type == 'bool':
+            return rng.random() < 0.5
+        if field_type == 'string':
+            return ''.join(
+                rng.choice('abcdefgh.-_żółw') for _ in range(rng.randint(0, 8)))
+        return rng.getrandbits(int(field_type[1:]))
+    if type(field_type) == list:
+        if type(field_type[0]) == int:
+            return bytes(rng.getrandbits(8) for _ in range(field_type[0]))
+        count = 0 if depth > 3 else rng.randint(0, 3)
+        return [
+            random_value(schema, field_type[0], rng, depth + 1)
+            for _ in range(count)
+        ]
+    if type(field_type) == dict:
+        if depth > 3 or rng.random() < 0.3:
+            return None
+        return random_value(schema, field_type['type'], rng, depth + 1)
+    struct_schema = schema[field_type]
+    ret = field_type()
+    if struct_schema['kind'] == 'struct':
+        for name, t in struct_schema['fields']:
+            setattr(ret, name, random_value(schema, t, rng, depth + 1))
+    else:
+        values = [(name, t)
+                  for name, t in struct_schema['values']
+                  if is_supported(schema, t)]
+        name, t = rng.choice(values)
+        setattr(ret, struct_schema['field'], name)
+        setattr(ret, name, random_value(schema, t, rng, depth + 1))
+    return ret
+
+
+def to_plain(value):
+    """Converts decoded message into nested lists and dicts for comparison."""
+    if isinstance(value, (list, tuple)):
+        return type(value)(to_plain(v) for v in value)
+    if hasattr(value, '__dict__'):
+        return {k: to_plain(v) for k, v in vars(value).items()}
+    if isinstance(value, serializer.SchemaStruct):
+        return {
+            k: to_plain(getattr(value, k))
+            for k in type(value).__slots__
+            if hasattr(value, k)
+        }
+    return value
+
+
+class BorshCodecTest(unittest.TestCase):
+
+    def _check_roundtrip(self, schema, obj):
+        interpreted = serializer.BinarySerializer(schema)
+        compiled = serializer.BinarySerializer(schema, compiled=True)
+        data = interpreted.serialize(obj)
+        self.assertEqual(data, compiled.serialize(obj))
+        decoded = compiled.deserialize(data, type(obj))
+        self.assertEqual(data,
+                         serializer.BinarySerializer(schema).serialize(decoded))
+        self.assertEqual(to_plain(interpreted.deserialize(data, type(obj))),
+                         to_plain(decoded))
+
+    def _check_zero_copy(self, schema, obj):
+        data = serializer.BinarySerializer(schema).serialize(obj)
+        buf = bytearray(data)
+        decoded = serializer.BinarySerializer(schema,
+                                              zero_copy=True).deserialize(
+                                                  buf, type(obj))
+        self.assertEqual(
+            data,
+            serializer.BinarySerializer(schema,
+                                        compiled=True).serialize(decoded))
+
+    def test_random_objects(self):
+        rng = random.Random(42)
+        for schema in SCHEMAS:
+            for type_ in schema:
+                if not is_supported(schema, type_):
+                    continue
+                for _ in range(20):
+                    with self.subTest(type=type_.__name__):
+                        obj = random_value(schema, type_, rng)
+                        self._check_roundtrip(schema, obj)
+                        self._check_zero_copy(schema, obj)
+
+    def test_signed_transaction(self):
+        actions = [
+            transaction.create_payment_action(10**24),
+            transaction.create_function_call_action('foo', b'{"a": 1}',
+                                                    3 * 10**14, 0),
+        ]
+        tx, _ = transaction.compute_tx_hash('bob.near', 7, actions,
+                                            bytes(range(32)), 'alice.near',
+                                            bytes(32))
+        self._check_roundtrip(transaction.schema, tx)
+
+    def test_zero_copy_fields(self):
+        tx, _ = transaction.compute_tx_hash(
+            'bob.near', 7,
+            [transaction.create_deploy_contract_action(b'\0asm' * 1000)],
+            bytes(range(32)), 'alice.near', bytes(32))
+        data = serializer.BinarySerializer(transaction.schema).serialize(tx)
+        view = memoryview(data)
+        decoded = serializer.BinarySerializer(transaction.schema,
+                                              zero_copy=True).deserialize(
+                                                  view, type(tx))
+        code = decoded.actions[0].deployContract.code
+        self.assertIsInstance(code, memoryview)
+        self.assertIs(code.obj, data)
+        self.assertEqual(b'\0asm' * 1000, bytes(code))
+        self.assertEqual(bytes(range(32)), decoded.blockHash)
+        self.assertIsInstance(decoded.blockHash, bytes)
+        self.assertEqual('alice.near', decoded.signerId)
+
+    def test_errors(self):
+        codec = serializer.compile_schema(messages.schema)
+        rng = random.Random(7)
+        msg = random_value(messages.schema, messages.network.PeerMessage, rng)
+        data = codec.serialize(msg)
+        # Unknown enum ordinal is reported as IndexError which callers use
+        # to skip unparsable messages.
+        with self.assertRaises(IndexError):
+            codec.deserialize(b'\xff' + data[1:], messages.network.PeerMessage)
+        with self.assertRaises(AssertionError):
+            codec.deserialize(data + b'\0', messages.network.PeerMessage)
+        with self.assertRaises(AssertionError):
+            codec.deserialize(
+                bytes([11]) + bytes(10), messages.network.PeerMessage)
+
+    def test_codec_is_cached(self):
+        self.assertIs(serializer.compile_schema(messages.schema),
+                      serializer.compile_schema(messages.schema))
+
+
+if __name__ == '__main__':
+    unittest.main()
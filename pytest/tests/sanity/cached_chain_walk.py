@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""Tests the block cache used when walking the chain of a fake RPC server.
+
+The test does not start any real nodes.
+"""
+
+import copy
+import multiprocessing
+import pathlib
+import sys
+import tempfile
+import unittest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import block_cache
+import cluster
+import fake_rpc
+
+
+class FakeChainHandler(fake_rpc.ChainHandler):
+    """Serves blocks of `server.chain` and a chunk with any hash."""
+
+    def chunk(self, chunk_hash):
+        return {
+            'header': {
+                'chunk_hash': chunk_hash
+            },
+            'transactions': [{
+                'hash': f'tx_{chunk_hash}'
+            }]
+        }
+
+
+def extend_chain(server, height):
+    """Adds blocks up to given height to server.chain; the last is latest."""
+    start = max((h for h in server.chain if isinstance(h, int)), default=-1)
+    for h in range(start + 1, height + 1):
+        block = {
+            'header': {
+                'height': h,
+                'hash': f'hash{h}',
+                'prev_hash': f'hash{h - 1}' if h else None
+            },
+            'chunks': [{
+                'chunk_hash': f'chunk{h}'
+            }]
+        }
+        server.chain[h] = server.chain[f'hash{h}'] = block
+    server.latest = height
+
+
+def child_opens_own_cache(parent_cache, result):
+    result.value = block_cache.shared() is not parent_cache
+
+
+class BlockCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = fake_rpc.start(FakeChainHandler, chain={})
+        self.node = cluster.RpcNode(*self.server.server_address)
+        self.node.is_check_store = False
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = str(pathlib.Path(self.tempdir.name) / 'blocks.sqlite')
+
+    def tearDown(self):
+        fake_rpc.stop(self.server)
+        self.tempdir.cleanup()
+
+    def walk(self, head):
+        return [
+            block['header']['height']
+            for block in self.node.walk_blocks(f'hash{head}')
+        ]
+
+    def test_persistent_walk(self):
+        extend_chain(self.server, 120)
+        self.node.block_cache = block_cache.BlockCache(self.path)
+        self.assertEqual(list(range(120, -1, -1)), self.walk(120))
+        # The head and three batches of fifty blocks.
+        self.assertEqual(4, self.server.requests)
+        self.node.block_cache.close()
+
+        # Another run re-analysing the chain after ten more blocks.
+        extend_chain(self.server, 130)
+        self.server.requests = 0
+        self.node.block_cache = block_cache.BlockCache(self.path)
+        self.assertEqual(list(range(130, -1, -1)), self.walk(130))
+        # The head and a single batch ending at the cached blocks.
+        self.assertEqual(2, self.server.requests)
+        self.server.requests = 0
+        self.assertEqual(list(range(130, -1, -1)), self.walk(130))
+        self.assertEqual(0, self.server.requests)
+        self.assertEqual(['hash42'], self.node.block_cache.block_hashes_at(42))
+
+        heights = list(self.node.get_all_heights())
+        self.assertEqual(list(range(1, 131)), heights)
+
+    def test_lru(self):
+        extend_chain(self.server, 9)
+        cache = block_cache.BlockCache(self.path, memory_items=5)
+        cache.put_blocks(self.server.chain[h] for h in range(10))
+        self.assertEqual(5, len(cache._lru))
+        for h in range(10):
+            self.assertEqual(self.server.chain[h], cache.get_block(f'hash{h}'))
+            self.assertTrue(cache.has_block(f'hash{h}'))
+        self.assertEqual(10, cache.hits)
+        self.assertIsNone(cache.get_block('hash10'))
+        self.assertFalse(cache.has_block('hash10'))
+        self.assertEqual(1, cache.misses)
+        # Inserting blocks again is a no-op.
+        cache.put_block(self.server.chain[0])
+        self.assertEqual(['hash0'], cache.block_hashes_at(0))
+
+    def test_memory_only(self):
+        extend_chain(self.server, 9)
+        cache = block_cache.BlockCache(memory_items=5)
+        cache.put_blocks(self.server.chain[h] for h in range(10))
+        # Without a file only the last five blocks are kept.
+        self.assertIsNone(cache.get_block('hash4'))
+        self.assertFalse(cache.has_block('hash4'))
+        self.assertEqual(self.server.chain[5], cache.get_block('hash5'))
+        self.assertEqual(['hash9'], cache.block_hashes_at(9))
+        self.assertEqual([], cache.block_hashes_at(0))
+
+    def test_copies(self):
+        extend_chain(self.server, 1)
+        for path in (None, self.path):
+            cache = block_cache.BlockCache(path, memory_items=1)
+            block = copy.deepcopy(self.server.chain[0])
+            cache.put_block(block)
+            # Neither the caller's block nor what lookups return are cached.
+            block['header']['height'] = 5
+            cache.get_block('hash0')['header']['height'] = 6
+            self.assertEqual(self.server.chain[0], cache.get_block('hash0'))
+            if path:
+                # Blocks read from the file.
+                cache.put_block(self.server.chain[1])
+                cache.get_block('hash0')['header']['height'] = 6
+                self.assertEqual(self.server.chain[0], cache.get_block('hash0'))
+            cache.close()
+
+        self.node.block_cache = block_cache.BlockCache()
+        self.node.get_block_by_hash('hash1')['result']['header'].clear()
+        self.assertEqual(self.server.chain[1],
+                         self.node.get_block_by_hash('hash1')['result'])
+
+    def test_chunks(self):
+        self.node.block_cache = block_cache.BlockCache()
+        responses = self.node.get_chunks(['a', 'b', 'a'])
+        self.assertEqual(['a', 'b', 'a'], [
+            response['result']['header']['chunk_hash'] for response in responses
+        ])
+        self.assertEqual((1, 2), (self.server.requests, self.server.calls))
+        responses = self.node.get_chunks(['c', 'b', 'a'])
+        self.assertEqual(['tx_c', 'tx_b', 'tx_a'], [
+            response['result']['transactions'][0]['hash']
+            for response in responses
+        ])
+        self.assertEqual((2, 3), (self.server.requests, self.server.calls))
+
+    def test_get_block_by_hash(self):
+        extend_chain(self.server, 3)
+        self.node.block_cache = block_cache.BlockCache()
+        for _ in range(3):
+            self.assertEqual(self.server.chain[3],
+                             self.node.get_block_by_hash('hash3')['result'])
+        self.assertIn('error', self.node.get_block_by_hash('hash4'))
+        self.assertEqual(2, self.server.requests)
+
+    def test_fork(self):
+        cache = block_cache.shared()
+        self.assertIs(cache, block_cache.shared())
+        ctx = multiprocessing.get_context('fork')
+        result = ctx.Value('i', 0)
+        process = ctx.Process(target=child_opens_own_cache,
+                              args=(cache, result))
+        process.start()
+        process.join(10)
+        self.assertEqual(0, process.exitcode)
+        self.assertEqual(1, result.value)
+
+
+if __name__ == '__main__':
+    unittest.main()
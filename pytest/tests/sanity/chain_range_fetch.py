@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Tests fetching block summaries by height range from a fake RPC server.
+
+The test does not start any real nodes.
+"""
+
+import pathlib
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import block_cache
+import chain_fetcher
+import cluster
+import fake_rpc
+
+# Timestamp, in seconds, of block at height 0.
+GENESIS_TIME = 1600000000
+
+
+class FakeChainHandler(fake_rpc.ChainHandler):
+    """Serves blocks with two chunks at heights up to `server.latest`.
+
+    Blocks are a second apart and heights in `server.skipped` have none.
+    Shard 1 produces a new chunk only at even heights.  A new chunk at height
+    h has h transactions and 1000 * h gas used.
+    """
+
+    def block(self, block_id):
+        height = block_id
+        if isinstance(height, str):
+            height = int(height[len('block'):])
+        if height > self.server.latest or height in self.server.skipped:
+            return None
+        return make_block(height)
+
+    def chunk(self, chunk_hash):
+        height = int(chunk_hash.split('_')[1])
+        return {
+            'header': {
+                'chunk_hash': chunk_hash
+            },
+            'transactions': [{
+                'hash': f'tx{i}'
+            } for i in range(height)]
+        }
+
+
+def make_block(height):
+    chunks = []
+    for shard in range(2):
+        included = height if shard == 0 or height % 2 == 0 else height - 1
+        chunks.append({
+            'chunk_hash': f'chunk{shard}_{included}',
+            'height_included': included,
+            'gas_used': 1000 * included,
+        })
+    return {
+        'header': {
+            'height': height,
+            'hash': f'block{height}',
+            'timestamp': (GENESIS_TIME + height) * 10**9,
+        },
+        'chunks': chunks,
+    }
+
+
+class ChainFetcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = fake_rpc.start(FakeChainHandler,
+                                     latest=200,
+                                     skipped={5, 6, 101})
+        self.node = cluster.RpcNode(*self.server.server_address)
+        self.node.is_check_store = False
+        self.node.block_cache = block_cache.BlockCache()
+
+    def tearDown(self):
+        fake_rpc.stop(self.server)
+
+    def test_fetch_heights(self):
+        summary = chain_fetcher.fetch_heights(self.node,
+                                              1,
+                                              120,
+                                              concurrency=4,
+                                              batch_size=10)
+        heights = [h for h in range(1, 121) if h not in (5, 6, 101)]
+        self.assertEqual(heights, summary.heights.tolist())
+        self.assertEqual(3, summary.skipped)
+        np.testing.assert_array_equal(GENESIS_TIME + summary.heights,
+                                      summary.timestamps)
+        even = summary.heights % 2 == 0
+        np.testing.assert_array_equal(summary.heights, summary.tx_count[:, 0])
+        np.testing.assert_array_equal(np.where(even, summary.heights, 0),
+                                      summary.tx_count[:, 1])
+        np.testing.assert_array_equal(np.where(even, 1000 * summary.heights, 0),
+                                      summary.gas_used[:, 1])
+        # A batch of blocks and one of chunks per ten heights.
+        self.assertEqual(24, self.server.requests)
+
+        # Blocks and chunks come from the cache now.
+        self.server.requests = 0
+        summary = chain_fetcher.fetch_heights(self.node,
+                                              1,
+                                              120,
+                                              concurrency=4,
+                                              batch_size=10)
+        self.assertEqual(117, len(summary))
+        self.assertEqual(12, self.server.requests)
+
+    def test_fetch_time_range(self):
+        summary = chain_fetcher.fetch_time_range(self.node,
+                                                 GENESIS_TIME + 49.5,
+                                                 GENESIS_TIME + 150.5,
+                                                 concurrency=2,
+                                                 batch_size=20)
+        heights = [h for h in range(50, 151) if h != 101]
+        self.assertEqual(heights, summary.heights.tolist())
+
+        summary = chain_fetcher.fetch_time_range(self.node,
+                                                 None,
+                                                 None,
+                                                 duration=10.5)
+        self.assertEqual(list(range(190, 200)), summary.heights.tolist())
+
+    def test_rates(self):
+        summary = chain_fetcher.fetch_heights(self.node, 0, 200)
+        rates = summary.rates()
+        self.assertAlmostEqual(1, rates['bps'], delta=0.02)
+        # Shard 0 has h transactions at height h and shard 1 as many every
+        # other block; about 1.5 * 200 transactions per second at the end.
+        self.assertGreater(rates['tps'], 100)
+
+        window = summary.sliding_rates(10)
+        self.assertTrue(np.isnan(window['bps'][0]))
+        row = window[summary.heights.tolist().index(150)]
+        self.assertEqual(150, row['height'])
+        self.assertAlmostEqual(1, row['bps'])
+        # Blocks 141 to 150: 1455 transactions in shard 0 and 730 in shard 1.
+        self.assertAlmostEqual(218.5, row['tps'])
+        self.assertAlmostEqual(218500, row['gas_per_second'])
+        # The window of block 102 spans the skipped height 101.
+        row = window[summary.heights.tolist().index(102)]
+        self.assertAlmostEqual(0.9, row['bps'])
+
+
+if __name__ == '__main__':
+    unittest.main()
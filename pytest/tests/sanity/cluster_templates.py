@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Tests creating cluster configuration from cached templates.
+
+The test uses a fake neard which only implements the localnet command and
+does not start any nodes.
+"""
+
+import json
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import cluster
+import cluster_template
+
+FAKE_NEARD = '''#!{python}
+import argparse, json, pathlib, sys
+parser = argparse.ArgumentParser()
+parser.add_argument('--home', default=str(pathlib.Path.home() / '.near'))
+parser.add_argument('command')
+parser.add_argument('--v', type=int)
+parser.add_argument('--n', type=int)
+parser.add_argument('--shards', type=int)
+parser.add_argument('--prefix')
+args = parser.parse_args()
+with open(pathlib.Path(sys.argv[0]).parent / 'invocations', 'a') as f:
+    f.write(' '.join(sys.argv[1:]) + '\\n')
+for i in range(args.v + args.n):
+    home = pathlib.Path(args.home) / f'{{args.prefix}}{{i}}'
+    home.mkdir(parents=True, exist_ok=True)
+    genesis = {{'epoch_length': 500, 'num_shards': args.shards, 'records': []}}
+    (home / 'genesis.json').write_text(json.dumps(genesis))
+    (home / 'config.json').write_text(json.dumps({{'consensus': {{'a': 1}}}}))
+    for name in ('node_key.json', 'validator_key.json'):
+        (home / name).write_text(json.dumps({{'account_id': f'test{{i}}'}}))
+    print(f'Generated node key, validator key, genesis file in {{home}}',
+          file=sys.stderr)
+'''
+
+
+class ClusterTemplateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        root = pathlib.Path(self.tempdir.name)
+        self.bin = root / 'bin'
+        self.bin.mkdir()
+        neard = self.bin / 'neard'
+        neard.write_text(FAKE_NEARD.format(python=sys.executable))
+        neard.chmod(0o755)
+        self.home = root / 'home'
+        self.templates = root / 'templates'
+        patch = mock.patch.dict(
+            os.environ, {
+                'HOME': str(self.home),
+                cluster_template.TEMPLATES_ENV_VAR: str(self.templates),
+            })
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.config = {
+            'local': True,
+            'near_root': str(self.bin),
+            'binary_name': 'neard',
+        }
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def invocations(self):
+        path = self.bin / 'invocations'
+        return path.read_text().splitlines() if path.exists() else []
+
+    def init(self, genesis_changes, client_changes={}, **config):
+        _, node_dirs = cluster.init_cluster(2, 1, 2,
+                                            dict(self.config, **config),
+                                            genesis_changes, client_changes)
+        return [pathlib.Path(node_dir) for node_dir in node_dirs]
+
+    def read(self, node_dir, name, key):
+        return json.loads((node_dir / name).read_text())[key]
+
+    def test_templates(self):
+        changes = [['epoch_length', 10]]
+        node_dirs = self.init(changes, {1: {'consensus': {'b': 2}}})
+        self.assertEqual(1, len(self.invocations()))
+        self.assertEqual([self.home / '.near' / f'test{i}' for i in range(3)],
+                         node_dirs)
+        self.assertEqual(
+            10, self.read(node_dirs[0], 'genesis.json', 'epoch_length'))
+        consensus = self.read(node_dirs[1], 'config.json', 'consensus')
+        self.assertEqual({'a': 1, 'b': 2}, consensus)
+
+        # Same shape reuses the template after test's changes are dropped.
+        cluster.apply_genesis_changes(node_dirs[0], [['epoch_length', 20]])
+        (node_dirs[1] / 'data').mkdir()
+        node_dirs = self.init(changes)
+        self.assertEqual(1, len(self.invocations()))
+        self.assertEqual(
+            10, self.read(node_dirs[0], 'genesis.json', 'epoch_length'))
+        consensus = self.read(node_dirs[1], 'config.json', 'consensus')
+        self.assertEqual({'a': 1}, consensus)
+        self.assertEqual(
+            'test2', self.read(node_dirs[2], 'validator_key.json',
+                               'account_id'))
+        self.assertFalse((node_dirs[1] / 'data').exists())
+
+        # Different genesis changes or binary need a new template.
+        self.init([['epoch_length', 20]])
+        self.assertEqual(2, len(self.invocations()))
+        self.assertEqual(2, len(os.listdir(self.templates)))
+        os.utime(self.bin / 'neard', ns=(0, 0))
+        self.init(changes)
+        self.assertEqual(3, len(self.invocations()))
+        # Templates of the rebuilt binary are removed.
+        self.assertEqual(1, len(os.listdir(self.templates)))
+
+    def test_eviction(self):
+        with mock.patch.object(cluster_template, 'MAX_TEMPLATES', 2):
+            for epoch_length in (10, 20):
+                self.init([['epoch_length', epoch_length]])
+            self.assertEqual(2, len(os.listdir(self.templates)))
+            # Using the first template makes the second least recently used.
+            for name in os.listdir(self.templates):
+                os.utime(self.templates / name / 'template.json', (0, 0))
+            self.init([['epoch_length', 10]])
+            self.init([['epoch_length', 30]])
+            self.assertEqual(3, len(self.invocations()))
+            self.assertEqual(2, len(os.listdir(self.templates)))
+            self.init([['epoch_length', 10]])
+            self.assertEqual(3, len(self.invocations()))
+            self.init([['epoch_length', 20]])
+            self.assertEqual(4, len(self.invocations()))
+
+        # Templates of binaries which no longer exist are removed too.
+        other = self.bin / 'other'
+        shutil.copy2(self.bin / 'neard', other)
+        self.init([['epoch_length', 10]], binary_name='other')
+        other.unlink()
+        self.init([['epoch_length', 40]])
+        self.assertEqual(6, len(self.invocations()))
+        self.assertEqual(3, len(os.listdir(self.templates)))
+
+    def test_disabled(self):
+        self.init([['epoch_length', 10]], cluster_templates=False)
+        node_dirs = self.init([['epoch_length', 10]], cluster_templates=False)
+        self.assertEqual(['localnet --v 2 --shards 2 --n 1 --prefix test'] * 2,
+                         self.invocations())
+        self.assertEqual(
+            10, self.read(node_dirs[0], 'genesis.json', 'epoch_length'))
+        self.assertFalse(self.templates.exists())
+
+    def test_clone_writes(self):
+        changes = [['epoch_length', 10]]
+        node_dirs = self.init(changes)
+        # Writing into a clone's files in place, like populate.copy_genesis
+        # does, mustn't change the template.
+        for node_dir in node_dirs:
+            for name in ('genesis.json', 'config.json', 'node_key.json'):
+                with open(node_dir / name, 'w') as f:
+                    f.write('{"epoch_length": 20, "consensus": 0, '
+                            '"account_id": 0}')
+        node_dirs = self.init(changes)
+        self.assertEqual(1, len(self.invocations()))
+        for node_dir in node_dirs:
+            self.assertEqual(
+                10, self.read(node_dir, 'genesis.json', 'epoch_length'))
+            self.assertEqual({'a': 1},
+                             self.read(node_dir, 'config.json', 'consensus'))
+        self.assertEqual('test1',
+                         self.read(node_dirs[1], 'node_key.json', 'account_id'))
+
+    def test_reflink_file(self):
+        src = pathlib.Path(self.tempdir.name) / 'src'
+        src.write_text('genesis')
+        dst = pathlib.Path(self.tempdir.name) / 'dst'
+        cluster_template._reflink_file(src, dst)
+        self.assertEqual('genesis', dst.read_text())
+        self.assertNotEqual(os.stat(src).st_ino, os.stat(dst).st_ino)
+        dst.write_text('changed')
+        self.assertEqual('genesis', src.read_text())
+
+
+if __name__ == '__main__':
+    unittest.main()
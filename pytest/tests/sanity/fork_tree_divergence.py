@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""Tests fork_tree.ForkTree against walking previous block hashes.
+
+The test does not start any real nodes.
+"""
+
+import pathlib
+import random
+import sys
+import unittest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+from fork_tree import ForkTree
+
+
+def make_chain(rng, length, fork_probability, fork_depth):
+    """Returns blocks as (hash, prev_hash, height) with occasional forks.
+
+    A block forks off one of `fork_depth` blocks below the latest one, if
+    any.  A block may be at the same height as others.
+    """
+    blocks = [('B0', 'GENESIS_PREV', 0)]
+    for i in range(1, length):
+        prev_hash, _, prev_height = blocks[-1]
+        if rng.random() < fork_probability:
+            prev_hash, _, prev_height = rng.choice(blocks[-fork_depth:])
+        height = prev_height + rng.choice((1, 1, 1, 2))
+        blocks.append((f'B{i}', prev_hash, height))
+    return blocks
+
+
+def walk_pair(mapping, b1, b2):
+    """Divergence the way stress.blocks_tracker used to compute it."""
+    (p1, h1), (p2, h2) = mapping[b1], mapping[b2]
+    smaller = min(h1, h2)
+    try:
+        while b1 != b2:
+            while h1 > h2:
+                (b1, (p1, h1)) = (p1, mapping[p1])
+            while h2 > h1:
+                (b2, (p2, h2)) = (p2, mapping[p2])
+            while h1 == h2 and b1 != b2:
+                (b1, (p1, h1)) = (p1, mapping[p1])
+                (b2, (p2, h2)) = (p2, mapping[p2])
+        return smaller - h1
+    except KeyError:
+        # some blocks were missing in the mapping, so do our best estimate
+        return smaller - min(h1, h2)
+
+
+class ForkTreeTest(unittest.TestCase):
+
+    def test_queries(self):
+        tree = ForkTree()
+        #   B0 - B1 - B2 - B3 - B4
+        #          \
+        #           C2 - C3
+        for block in [('B0', 'X', 0), ('B1', 'B0', 1), ('B2', 'B1', 2),
+                      ('B3', 'B2', 3), ('B4', 'B3', 4), ('C2', 'B1', 2),
+                      ('C3', 'C2', 3)]:
+            self.assertTrue(tree.add(*block))
+        self.assertFalse(tree.add('B4', 'B3', 4))
+        self.assertEqual(7, len(tree))
+        self.assertIn('C3', tree)
+        self.assertEqual('B1', tree.lca('B4', 'C3'))
+        self.assertEqual('B2', tree.lca('B2', 'B4'))
+        self.assertEqual(2, tree.divergence('B4', 'C3'))
+        self.assertEqual(0, tree.divergence('B4', 'B2'))
+        self.assertEqual('B1', tree.ancestor('B4', 1))
+        self.assertEqual('C2', tree.ancestor('C3', 2))
+        self.assertEqual('C3', tree.ancestor('C3', 3))
+        self.assertIsNone(tree.ancestor('C3', 4))
+        self.assertEqual(['B2', 'C2'], tree.hashes_at(2))
+        self.assertEqual(
+            (2, 1, 1),
+            (tree.max_divergence, tree.fork_count, tree.orphan_count))
+
+    def test_orphans(self):
+        tree = ForkTree()
+        tree.add('B5', 'B4', 5)
+        tree.add('B3', 'B2', 3)
+        tree.add('C5', 'C4', 5)
+        self.assertEqual(3, tree.orphan_count)
+        self.assertIsNone(tree.lca('B5', 'B3'))
+        self.assertEqual('B5', tree.root('B5'))
+        tree.add('B4', 'B3', 4)
+        self.assertEqual(2, tree.orphan_count)
+        self.assertEqual('B3', tree.root('B5'))
+        self.assertEqual('B3', tree.lca('B5', 'B3'))
+        self.assertEqual('B3', tree.ancestor('B5', 3))
+        # Without a common ancestor divergence is a lower bound: C5's chain
+        # continues with C4, so a common ancestor could be B3 at most.
+        self.assertEqual(2, tree.divergence('B5', 'C5'))
+        tree.add('C4', 'C3', 4)
+        # Now it continues with C3, so B2 at most.
+        self.assertEqual(3, tree.divergence('B5', 'C5'))
+        tree.add('C3', 'B2', 3)
+        tree.add('B2', 'B1', 2)
+        self.assertEqual('B2', tree.lca('B5', 'C5'))
+        self.assertEqual(3, tree.divergence('B5', 'C5'))
+        self.assertEqual(3, tree.max_divergence)
+        self.assertEqual((1, 1), (tree.fork_count, tree.orphan_count))
+
+    def test_missing_common_parent(self):
+        tree = ForkTree()
+        tree.add('A', 'G', 1)
+        tree.add('B', 'A', 2)
+        tree.add('C', 'G', 2)
+        self.assertIsNone(tree.lca('B', 'C'))
+        # Both chains continue with G which is at most at height 0.
+        self.assertEqual(2, tree.divergence('B', 'C'))
+        self.assertEqual(2, tree.max_divergence)
+
+    def test_against_walk(self):
+        window = 8
+        for seed in range(300):
+            rng = random.Random(seed)
+            blocks = make_chain(rng, 100, rng.choice((0.1, 0.3)),
+                                rng.choice((2, 5, 100)))
+            full = ForkTree(window)
+            for block in blocks:
+                full.add(*block)
+            # Like stress.blocks_tracker, only see some of the blocks, in
+            # arbitrary order.
+            seen = rng.sample(blocks, rng.randint(2, len(blocks)))
+            tree = ForkTree(window)
+            mapping = {}
+            for block_hash, prev_hash, height in seen:
+                tree.add(block_hash, prev_hash, height)
+                mapping[block_hash] = (prev_hash, height)
+            largest = 0
+            for a, (_, height_a) in mapping.items():
+                for b, (_, height_b) in mapping.items():
+                    if abs(height_a - height_b) >= window:
+                        continue
+                    walk = walk_pair(mapping, a, b)
+                    divergence = tree.divergence(a, b)
+                    # Never below the old walk nor above the divergence with
+                    # all blocks known.
+                    msg = f'seed {seed}, {a} and {b}'
+                    self.assertLessEqual(walk, divergence, msg=msg)
+                    self.assertLessEqual(divergence,
+                                         full.divergence(a, b),
+                                         msg=msg)
+                    largest = max(largest, divergence)
+            self.assertLessEqual(largest, tree.max_divergence)
+            self.assertLessEqual(tree.max_divergence, full.max_divergence)
+            self.assertEqual(
+                sum(prev not in mapping for prev, _ in mapping.values()),
+                tree.orphan_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Tests framing.FramedStream used by peer.Connection and the proxy.
+
+The test does not start any nodes.
+"""
+
+import asyncio
+import pathlib
+import socket
+import struct
+import sys
+import unittest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import framing
+import peer
+
+
+async def open_pair(**kw):
+    """Returns two FramedStreams connected to each other."""
+    sock_a, sock_b = socket.socketpair()
+    a = framing.FramedStream(*await asyncio.open_connection(sock=sock_a), **kw)
+    b = framing.FramedStream(*await asyncio.open_connection(sock=sock_b), **kw)
+    return a, b
+
+
+class FramedStreamTest(unittest.TestCase):
+
+    def test_frames(self):
+
+        async def run():
+            a, b = await open_pair()
+            frames = [b'', b'x', bytes(range(256)) * 100]
+            for frame in frames:
+                a.write_frame(frame)
+            # Frames written in one iteration go out in a single write.
+            self.assertEqual(0, a.stats.writes)
+            await asyncio.sleep(0)
+            self.assertEqual(1, a.stats.writes)
+            for frame in frames:
+                self.assertEqual(frame, await b.read_frame())
+
+            # Large frames are written right away and without copying.
+            frames.append(bytes(range(256)) * 1000)
+            a.write_frame(frames[-1])
+            self.assertEqual(3, a.stats.writes)
+            self.assertEqual(frames[-1], await b.read_frame())
+
+            await a.send_frame(b'last')
+            await a.close()
+            self.assertEqual(b'last', await b.read_frame())
+            self.assertIsNone(await b.read_frame())
+
+            stats = a.stats.as_dict()
+            self.assertEqual(5, stats['frames_sent'])
+            self.assertEqual(sum(map(len, frames)) + 4, stats['bytes_sent'])
+            self.assertEqual(5, b.stats.frames_received)
+            self.assertEqual(stats['bytes_sent'], b.stats.bytes_received)
+            await b.close()
+
+        asyncio.run(run())
+
+    def test_high_water(self):
+
+        async def run():
+            a, b = await open_pair(high_water=1000)
+            for _ in range(10):
+                await a.send_frame(bytes(100))
+            # Only every tenth or so send waits for the transport.
+            self.assertEqual(1, a.stats.drains)
+            a.flush()
+            for _ in range(10):
+                self.assertEqual(bytes(100), await b.read_frame())
+            await a.close()
+            await b.close()
+
+        asyncio.run(run())
+
+    def test_truncated_frame(self):
+
+        async def run():
+            sock_a, sock_b = socket.socketpair()
+            stream = framing.FramedStream(*await asyncio.open_connection(
+                sock=sock_b))
+            sock_a.sendall(struct.pack('I', 10) + b'abc')
+            sock_a.close()
+            with self.assertRaises(asyncio.IncompleteReadError):
+                await stream.read_frame()
+            await stream.close()
+
+        asyncio.run(run())
+
+    def test_peer_connection(self):
+
+        async def run():
+            sock_a, sock_b = socket.socketpair()
+            a = peer.Connection(*await asyncio.open_connection(sock=sock_a))
+            b = peer.Connection(*await asyncio.open_connection(sock=sock_b))
+            await a.send(peer.create_peer_request())
+            await a.close()
+            self.assertEqual('PeersRequest', (await b.recv()).enum)
+            self.assertIsNone(await b.recv())
+            self.assertTrue(b.is_closed)
+            self.assertEqual(1, a.stats.frames_sent)
+            await b.close()
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Tests least-squares line fits of data.py against NumPy's polyfit."""
+
+import pathlib
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import data
+
+
+def reference(xs, ys):
+    slope, intercept = np.polyfit(xs, ys, 1)
+    residual = ys - (slope * xs + intercept)
+    r2 = 1 - (residual @ residual) / ((ys - ys.mean()) @ (ys - ys.mean()))
+    return slope, intercept, r2
+
+
+class LinearFitTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Block timestamps in seconds are large numbers a second apart.
+        self.xs = 1.6e9 + np.cumsum(rng.uniform(0.5, 1.5, 1000))
+        self.ys = 3 * self.xs + rng.normal(0, 10, 1000)
+
+    def assertFit(self, xs, ys, fit):
+        slope, intercept, r2 = reference(xs, ys)
+        # Timestamps have about seven significant digits after the first
+        # one so fits of few points differ in rounding.
+        self.assertAlmostEqual(slope,
+                               fit['slope'],
+                               delta=1e-5 * max(1, abs(slope)))
+        # With x far from zero the intercept is ill-conditioned; compare the
+        # fitted lines at the first point instead.
+        self.assertAlmostEqual(slope * xs[0] + intercept,
+                               fit['slope'] * xs[0] + fit['intercept'],
+                               delta=1e-3)
+        self.assertAlmostEqual(r2, fit['R^2'], delta=1e-6)
+
+    def test_linear_regression(self):
+        self.assertFit(
+            self.xs, self.ys,
+            data.linear_regression(self.xs.tolist(), self.ys.tolist()))
+        self.assertAlmostEqual(
+            2, data.compute_rate(list(np.arange(100) / 2 + 1.6e9)))
+        fit = data.linear_regression([1, 2, 3], [5, 7, 9])
+        self.assertEqual((2, 3, 1),
+                         (fit['slope'], fit['intercept'], fit['R^2']))
+        fit = data.linear_regression([1, 1], [2, 4])
+        self.assertEqual((0, 3, 0),
+                         (fit['slope'], fit['intercept'], fit['R^2']))
+
+    def test_incremental(self):
+        fit = data.LinearFit()
+        for x, y in zip(self.xs[:100], self.ys[:100]):
+            fit.add(x, y)
+        for i in range(100, 1000, 300):
+            fit.add_many(self.xs[i:i + 300], self.ys[i:i + 300])
+        self.assertEqual(1000, fit.n)
+        self.assertFit(self.xs, self.ys, fit.result())
+        for x, y in zip(self.xs[:500], self.ys[:500]):
+            fit.remove(x, y)
+        self.assertFit(self.xs[500:], self.ys[500:], fit.result())
+
+    def test_windowed(self):
+        window = 60
+        fit = data.WindowedLinearFit(window)
+        for i, (x, y) in enumerate(zip(self.xs, self.ys)):
+            if i < 500:
+                fit.add(x, y)
+            elif i % 50 == 0:
+                fit.add_many(self.xs[i:i + 50], self.ys[i:i + 50])
+            else:
+                continue
+            end = min(i + 50, 1000) if i >= 500 else i + 1
+            mask = self.xs[:end] >= self.xs[end - 1] - window
+            self.assertEqual(mask.sum(), fit.n)
+            if fit.n > 2:
+                self.assertFit(self.xs[:end][mask], self.ys[:end][mask],
+                               fit.result())
+        with self.assertRaises(AssertionError):
+            fit.add(self.xs[0], 0)
+
+    def test_cumulative(self):
+        self.assertEqual([1, 3, 6, 10], data.compute_cumulative([1, 2, 3, 4]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Tests reconstructing block and chunk timing from synthetic neard logs.
+
+The test does not start any real nodes.
+"""
+
+import pathlib
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import log_analysis
+
+# 2022-06-01T00:00:00Z
+DAY = 1654041600
+
+
+def iso(seconds):
+    clock = seconds - DAY
+    return (f'2022-06-01T{clock // 3600:02.0f}:{clock % 3600 // 60:02.0f}:'
+            f'{clock % 60:09.6f}Z')
+
+
+def syslog(seconds):
+    return 'Jun  1 ' + iso(seconds)[11:-4]
+
+
+def node_log(node, stamp, heights):
+    """Returns log of a node which produces even blocks and processes all.
+
+    Block h is produced at h seconds by node h % 2 and processed 0.1 s later
+    by its producer and 0.3 s later by the other node.  Its chunk is
+    produced at h - 0.5 s and received 0.2 s later by node 0 and 0.4 s later
+    by node 1.
+    """
+    lines = [f'{stamp(DAY)}  INFO neard: Starting the node\n']
+    for h in heights:
+        t = DAY + h
+        producer = h % 2
+        if producer == node:
+            lines.append(
+                f'{stamp(t - 0.5)} DEBUG produce_chunk: client: Produced chunk '
+                f'with 3 txs and 0 receipts height={h} shard_id=0 '
+                f'me=test{node} chunk_hash=C{h} prev_block_hash=B{h - 1}\n')
+            lines.append(f'{stamp(t)} DEBUG client: Some("test{node}") '
+                         f'Producing block at height {h}, parent {h - 1} @ '
+                         f'B{h - 1}, 1 new chunks\n')
+        lines.append(f'{stamp(t - 0.3 + 0.2 * node)} DEBUG chunks: Process '
+                     f'partial encoded chunk:  parts 4 '
+                     f'chunk_hash=ChunkHash(C{h}) height={h} shard_id=0\n')
+        lines.append(f'{stamp(t + (0.1 if producer == node else 0.3))} '
+                     f'DEBUG process_block{{provenance=NONE}}: chain: '
+                     f'\x1b[2mHead updated to B{h} at {h}\x1b[0m\n')
+        lines.append(f'{stamp(t + 0.35)} DEBUG network: unrelated height={h}\n')
+    return ''.join(lines)
+
+
+class LogAnalysisTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.heights = [h for h in range(1, 21) if h != 13]
+        self.paths = []
+        for node, stamp in enumerate((iso, syslog)):
+            path = pathlib.Path(self.tempdir.name) / f'node{node}.log'
+            path.write_text(node_log(node, stamp, self.heights))
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_parse_line(self):
+        line = log_analysis.parse_line(
+            '2022-06-01T00:00:01.500000Z DEBUG span{a=1}: near_chunks::lib: '
+            'Requesting. height=5 shard_id=1 chunk_hash="a b"\n')
+        self.assertEqual(DAY + 1.5, line.time)
+        self.assertEqual(('DEBUG', 'near_chunks::lib', 'span{a=1}'),
+                         (line.level, line.target, line.spans))
+        self.assertEqual('Requesting.', line.message)
+        self.assertEqual({
+            'height': '5',
+            'shard_id': '1',
+            'chunk_hash': 'a b'
+        }, line.fields)
+        self.assertIsNone(log_analysis.parse_line('thread panicked at\n'))
+
+    def test_analyze(self):
+        for processes in (1, 2):
+            analysis = log_analysis.analyze(self.paths,
+                                            processes=processes,
+                                            year=2022)
+            self.assertEqual(['node0.log', 'node1.log'], analysis.nodes)
+            self.check(analysis)
+
+    def check(self, analysis):
+        blocks = analysis.block_timing()
+        self.assertEqual(self.heights, blocks['height'].tolist())
+        self.assertEqual([h % 2 for h in self.heights],
+                         blocks['producer'].tolist())
+        np.testing.assert_allclose(DAY + blocks['height'], blocks['produced'])
+        expected = np.array(
+            [[0.1, 0.3] if h % 2 == 0 else [0.3, 0.1] for h in self.heights])
+        np.testing.assert_allclose(expected, blocks['delay'], atol=1e-3)
+
+        chunks = analysis.chunk_skew()
+        self.assertEqual(self.heights, chunks['height'].tolist())
+        self.assertEqual([0] * len(self.heights), chunks['shard_id'].tolist())
+        self.assertEqual([2] * len(self.heights), chunks['nodes'].tolist())
+        np.testing.assert_allclose(0.2, chunks['skew'], atol=1e-3)
+        np.testing.assert_allclose(DAY + chunks['height'] - 0.5,
+                                   chunks['produced'])
+
+        self.assertEqual([13], analysis.missing_heights().tolist())
+        gaps = analysis.head_gaps(1.5)
+        self.assertEqual(
+            [(0, 14, 12), (1, 14, 12)],
+            [(int(g['node']), int(g['height']), int(g['previous_height']))
+             for g in gaps])
+        np.testing.assert_allclose(2, gaps['gap'])
+        self.assertEqual(len(self.heights),
+                         len(analysis.select('head_updated', node=1)))
+        analysis.log()
+
+    def test_empty(self):
+        path = pathlib.Path(self.tempdir.name) / 'empty.log'
+        path.write_text('')
+        analysis = log_analysis.analyze([path])
+        self.assertEqual(0, len(analysis.block_timing()))
+        self.assertEqual(0, len(analysis.chunk_skew()))
+        self.assertEqual(0, len(analysis.missing_heights()))
+        self.assertEqual(0, len(analysis.head_gaps(1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
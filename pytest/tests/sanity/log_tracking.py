@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Tests utils.LogTracker following a log file written by the test.
+
+The test does not start any real nodes.
+"""
+
+import pathlib
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import cluster
+import utils
+
+
+class FakeLocalNode(cluster.LocalNode):
+    """Local node which only has a log file."""
+
+    def __init__(self, stderr_name):
+        self.stderr_name = stderr_name
+
+
+class LogTrackerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tempdir.name) / 'stderr'
+        self.path.write_bytes(b'old line: transition to State Sync\n')
+        self.node = FakeLocalNode(self.path)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def write(self, data):
+        with open(self.path, 'ab') as f:
+            f.write(data)
+
+    def test_check_and_count(self):
+        tracker = utils.LogTracker(self.node)
+        self.assertFalse(tracker.check('transition to State Sync'))
+        self.write(b'\x1b[2m2022-01-01\x1b[0m \x1b[32mINFO\x1b[0m '
+                   b'transition to \x1b[1mState\x1b[0m Sync\n')
+        self.assertTrue(tracker.check('transition to State Sync'))
+        self.assertFalse(tracker.check('transition to State Sync'))
+
+        tracker.reset()
+        self.assertEqual(2, tracker.count('transition to State Sync'))
+        tracker.offset = 0
+        self.assertEqual({
+            'State Sync': 2,
+            'INFO': 1,
+            'missing': 0
+        }, tracker.counts(['State Sync', 'INFO', 'missing']))
+        tracker.close()
+
+    def test_chunks(self):
+        tracker = utils.LogTracker(self.node)
+        tracker.CHUNK_SIZE = 7
+        lines = [f'line {i} \x1b[31m#{i}\x1b[0m\n'.encode() for i in range(100)]
+        # An incomplete line is matched once it's completed.
+        self.write(b''.join(lines) + b'partial ')
+        self.assertEqual(100, tracker.count(' #'))
+        self.assertFalse(tracker.check('partial line'))
+        self.write(b'line\n')
+        self.assertTrue(tracker.check('partial line'))
+
+    def test_unterminated_line(self):
+        tracker = utils.LogTracker(self.node)
+        # E.g. a panic message of a node which died before ending the line.
+        self.write(b'thread panicked at \x1b[1mboom')
+        self.assertTrue(tracker.check('panicked at boom'))
+        self.assertFalse(tracker.check('panicked'))
+        self.write(b', panicked again\n')
+        # Only the part written since is scanned again.
+        self.assertEqual(1, tracker.count('panicked'))
+        tracker.reset()
+        self.assertEqual(2, tracker.count('panicked'))
+
+        self.write(b'a: first')
+        self.assertEqual('first', tracker.wait_for('first', timeout=1))
+        self.assertIsNone(tracker.find(['first']))
+        self.write(b', first\n')
+        self.assertEqual('first', tracker.find(['first']))
+        self.assertIsNone(tracker.find(['first']))
+
+    def test_find(self):
+        tracker = utils.LogTracker(self.node)
+        self.write(b'a: first\nb: second\nc: first\nd: third\n')
+        self.assertEqual('first', tracker.find(['second', 'first']))
+        self.assertEqual('second', tracker.find(['second', 'first']))
+        self.assertEqual('first', tracker.find(['second', 'first']))
+        self.assertTrue(tracker.check('third'))
+        self.assertIsNone(tracker.find(['second', 'first']))
+
+    def test_wait_for(self):
+        tracker = utils.LogTracker(self.node)
+
+        def write_later():
+            for i in range(5):
+                time.sleep(0.05)
+                self.write(f'block #{i}\n'.encode())
+            self.write(b'Banned(BadBlockHeader)\n')
+
+        writer = threading.Thread(target=write_later)
+        started = time.monotonic()
+        writer.start()
+        self.assertEqual(
+            'Banned',
+            tracker.wait_for(['Banned', 'ban a fraudulent peer'], timeout=10))
+        writer.join()
+        self.assertLess(time.monotonic() - started, 5)
+        with self.assertRaises(AssertionError):
+            tracker.wait_for('never', timeout=0.2)
+
+    def test_truncated(self):
+        tracker = utils.LogTracker(self.node)
+        self.path.write_bytes(b'new\n')
+        self.assertTrue(tracker.check('new'))
+
+
+if __name__ == '__main__':
+    unittest.main()
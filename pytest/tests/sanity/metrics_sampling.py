@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Tests MetricsSampler scraping fake /metrics pages.
+
+The test does not start any real nodes.
+"""
+
+import json
+import math
+import pathlib
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import cluster
+import fake_rpc
+import metrics_sampler
+
+BOUNDS = ['0.1', '0.5', '1', '+Inf']
+
+
+class FakeMetricsHandler(fake_rpc.Handler):
+    """Serves /metrics with counters growing with every scrape.
+
+    Each scrape processes `server.step` blocks and 10 times as many
+    transactions, and records a block processing time of 0.3 s per block.
+    """
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.scrapes += 1
+            blocks = self.server.scrapes * self.server.step
+        buckets = ''.join(f'near_block_processing_time_bucket{{le="{bound}"}} '
+                          f'{0 if bound == "0.1" else blocks}\n'
+                          for bound in BOUNDS)
+        body = (f'# HELP near_block_processed_total Blocks processed\n'
+                f'# TYPE near_block_processed_total counter\n'
+                f'near_block_processed_total {blocks}\n'
+                f'# TYPE near_transaction_processed_total counter\n'
+                f'near_transaction_processed_total {10 * blocks}\n'
+                f'# TYPE near_peer_connections gauge\n'
+                f'near_peer_connections 4\n'
+                f'# TYPE near_block_processing_time histogram\n'
+                f'{buckets}'
+                f'near_block_processing_time_sum {0.3 * blocks}\n'
+                f'near_block_processing_time_count {blocks}\n').encode()
+        self.send(body, content_type='text/plain; version=0.0.4')
+
+
+class MetricsSamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = []
+        self.nodes = []
+        for step in (1, 5):
+            server = fake_rpc.start(FakeMetricsHandler, scrapes=0, step=step)
+            self.servers.append(server)
+            self.nodes.append(cluster.RpcNode(*server.server_address))
+
+    def tearDown(self):
+        for server in self.servers:
+            fake_rpc.stop(server)
+
+    def test_sample(self):
+        sampler = metrics_sampler.MetricsSampler(self.nodes, capacity=4)
+        for _ in range(6):
+            sampler.sample()
+        self.assertEqual([6, 6], [server.scrapes for server in self.servers])
+        # Only the last four samples are kept.
+        _, blocks = sampler.timeline(1, 'near_block_processed')
+        self.assertEqual([15, 20, 25, 30], blocks.tolist())
+        _, peers = sampler.timeline(0, 'near_peer_connections')
+        self.assertTrue(all(math.isnan(v) for v in peers))
+        _, bucket = sampler.timeline(0,
+                                     'near_block_processing_time_bucket',
+                                     le='0.5')
+        self.assertEqual([3, 4, 5, 6], bucket.tolist())
+
+        times, _ = sampler.timeline(1, 'near_block_processed')
+        elapsed = times[-1] - times[0]
+        self.assertAlmostEqual(15 / elapsed,
+                               sampler.rate(1, 'near_block_processed'))
+        self.assertAlmostEqual(150 / elapsed,
+                               sampler.rate(1, 'near_transaction_processed'))
+        # All observations fall into the (0.1, 0.5] bucket.
+        self.assertAlmostEqual(
+            0.3, sampler.quantile(0, 'near_block_processing_time', 0.5))
+        self.assertAlmostEqual(
+            0.48, sampler.quantile(1, 'near_block_processing_time', 0.95))
+        self.assertTrue(math.isnan(sampler.quantile(0, 'missing', 0.5)))
+        sampler.log()
+        sampler.stop()
+
+    def test_counter_reset(self):
+        sampler = metrics_sampler.MetricsSampler(self.nodes[:1])
+        for _ in range(3):
+            sampler.sample()
+        # The node restarts.
+        self.servers[0].scrapes = 0
+        for _ in range(2):
+            sampler.sample()
+        _, blocks = sampler.timeline(0, 'near_block_processed')
+        self.assertEqual([1, 2, 3, 1, 2], blocks.tolist())
+        self.assertEqual(4, metrics_sampler.increase(blocks))
+        sampler.stop()
+
+    def test_background(self):
+        with metrics_sampler.MetricsSampler(self.nodes,
+                                            interval=0.05) as sampler:
+            time.sleep(0.5)
+        scrapes = [server.scrapes for server in self.servers]
+        self.assertGreaterEqual(min(scrapes), 5)
+        time.sleep(0.2)
+        self.assertEqual(scrapes, [server.scrapes for server in self.servers])
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = pathlib.Path(tempdir) / 'metrics.json'
+            sampler.dump(str(path))
+            dumped = json.loads(path.read_text())
+        self.assertEqual(2, len(dumped['nodes']))
+        node = dumped['nodes'][1]
+        self.assertEqual(scrapes[1], len(node['timestamps']))
+        self.assertEqual(
+            list(range(5, 5 * scrapes[1] + 1, 5)),
+            node['series']['near_block_processing_time_bucket{le="+Inf"}'])
+
+    def test_unreachable(self):
+        fake_rpc.stop(self.servers.pop())
+        sampler = metrics_sampler.MetricsSampler(self.nodes, timeout=1)
+        sampler.sample()
+        sampler.stop()
+        self.assertEqual([0, 1], sampler.errors)
+        self.assertTrue(math.isnan(sampler.rate(1, 'near_block_processed')))
+
+    def test_bucket_quantile(self):
+        inf = float('inf')
+        self.assertAlmostEqual(
+            0.75,
+            metrics_sampler.bucket_quantile(0.5, [0.5, 1, inf], [0, 10, 10]))
+        self.assertEqual(
+            1, metrics_sampler.bucket_quantile(0.99, [0.5, 1, inf], [0, 5, 10]))
+        self.assertTrue(
+            math.isnan(metrics_sampler.bucket_quantile(0.5, [0.5, inf],
+                                                       [0, 0])))
+
+
+if __name__ == '__main__':
+    unittest.main()
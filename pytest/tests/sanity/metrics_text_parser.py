@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Tests MetricsParser against prometheus_client's parser.
+
+The test does not start any real nodes.
+"""
+
+import pathlib
+import sys
+import unittest
+
+from prometheus_client import parser
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import metrics_parser
+
+PAGE = r'''# HELP near_block_processed_total Total number of blocks processed
+# TYPE near_block_processed_total counter
+near_block_processed_total 1234
+# HELP near_block_processed_successfully_total Blocks processed successfully
+# TYPE near_block_processed_successfully_total counter
+near_block_processed_successfully_total 1200
+# HELP near_block_processing_time Time taken to process blocks
+# TYPE near_block_processing_time histogram
+near_block_processing_time_bucket{le="0.005"} 0
+near_block_processing_time_bucket{le="0.5"} 1000
+near_block_processing_time_bucket{le="+Inf"} 1234
+near_block_processing_time_sum 300.5
+near_block_processing_time_count 1234
+# HELP near_peer_message_received_by_type_total Messages received by type
+# TYPE near_peer_message_received_by_type_total counter
+near_peer_message_received_by_type_total{type="Block"} 17
+near_peer_message_received_by_type_total{type="Trans}action"} 3
+near_peer_message_received_by_type_total{type="Esc\"aped\\"} 1
+# TYPE near_shard_gas gauge
+near_shard_gas{shard_id="0",kind="used"} 1.5e+15
+near_shard_gas{shard_id="1",kind="used"} NaN
+near_shard_gas{shard_id="1",kind="limit"} +Inf
+'''
+
+
+def reference(page, metrics):
+    """Returns (name, labels, value) of samples of the metrics on the page."""
+    samples = []
+    for family in parser.text_string_to_metric_families(page):
+        for sample in family.samples:
+            # Counter families are named without `_total`.
+            name = sample.name
+            if (family.type == 'counter' and name == family.name + '_total' and
+                    family.name in metrics):
+                name = family.name
+            if family.name in metrics or name in metrics:
+                samples.append((name, sample.labels, sample.value))
+    return samples
+
+
+def as_tuples(samples):
+    return [(s.name, s.labels, s.value) for s in samples]
+
+
+class MetricsParserTest(unittest.TestCase):
+
+    def assertSamplesEqual(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for (name, labels, value), sample in zip(expected, actual):
+            self.assertEqual((name, labels), (sample[0], sample[1]))
+            if value != value:
+                self.assertNotEqual(sample[2], sample[2])
+            else:
+                self.assertEqual(value, sample[2])
+
+    def test_matches_reference(self):
+        metrics = {
+            'near_block_processed', 'near_block_processing_time',
+            'near_peer_message_received_by_type_total', 'near_shard_gas'
+        }
+        samples = metrics_parser.MetricsParser(metrics).parse(PAGE)
+        self.assertSamplesEqual(reference(PAGE, metrics), as_tuples(samples))
+        # near_block_processed_successfully isn't selected.
+        self.assertEqual(1,
+                         sum(s.name == 'near_block_processed' for s in samples))
+        self.assertEqual({'type': 'Esc"aped\\'}, samples[-4].labels)
+        self.assertEqual({'type': 'Trans}action'}, samples[-5].labels)
+
+    def test_label_filters(self):
+        parser_ = metrics_parser.MetricsParser(
+            ['near_shard_gas', 'near_block_processed'],
+            {'near_shard_gas': {
+                'kind': 'used'
+            }})
+        self.assertEqual([('near_block_processed', {}, 1234),
+                          ('near_shard_gas', {
+                              'shard_id': '0',
+                              'kind': 'used'
+                          }, 1.5e15)],
+                         as_tuples(parser_.parse(PAGE.encode()))[:2])
+        self.assertEqual(3, len(parser_.parse(PAGE)))
+
+    def test_feed(self):
+        metrics = ['near_block_processing_time', 'near_shard_gas']
+        parser_ = metrics_parser.MetricsParser(metrics)
+        expected = as_tuples(parser_.parse(PAGE))
+        page = PAGE.encode().rstrip(b'\n')
+        for chunk_size in (1, 7, 64, len(page)):
+            samples = []
+            for i in range(0, len(page), chunk_size):
+                samples.extend(parser_.feed(page[i:i + chunk_size]))
+            samples.extend(parser_.close())
+            self.assertSamplesEqual(expected, as_tuples(samples))
+
+
+if __name__ == '__main__':
+    unittest.main()
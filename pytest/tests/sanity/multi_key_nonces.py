@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""Tests NonceManager against a fake RPC server keeping access key nonces.
+
+The test does not start any real nodes.
+"""
+
+import base64
+import pathlib
+import sys
+import threading
+import unittest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import cluster
+import fake_rpc
+import transaction
+from key import Key
+from nonce_manager import NonceManager
+from serializer import BinarySerializer
+
+ACCOUNT_ID = 'test0'
+# Height of the block new access keys are added in.
+HEIGHT = 7
+
+
+class FakeNodeHandler(fake_rpc.Handler):
+    """Executes AddKey and checks nonces of transactions.
+
+    `server.nonces` maps public keys to access key nonces.  Rejected
+    transactions get an InvalidNonce error with `ak_nonce` unless
+    `server.hide_ak_nonce` is set.
+    """
+
+    def do_GET(self):
+        self.respond({
+            'sync_info': {
+                'latest_block_height': HEIGHT,
+                'latest_block_hash': '1' * 32,
+                'syncing': False
+            }
+        })
+
+    def execute(self, signed_tx):
+        tx = BinarySerializer(transaction.schema).deserialize(
+            signed_tx, transaction.SignedTransaction).transaction
+        pk = 'ed25519:' + transaction.base58.b58encode(
+            tx.publicKey.data).decode('ascii')
+        with self.server.lock:
+            self.server.txs += 1
+            ak_nonce = self.server.nonces[pk]
+            if tx.nonce <= ak_nonce:
+                details = {'tx_nonce': tx.nonce}
+                if not self.server.hide_ak_nonce:
+                    details['ak_nonce'] = ak_nonce
+                return {
+                    'error': {
+                        'name': 'HANDLER_ERROR',
+                        'cause': {
+                            'name': 'INVALID_TRANSACTION'
+                        },
+                        'data': {
+                            'TxExecutionError': {
+                                'InvalidTxError': {
+                                    'InvalidNonce': details
+                                }
+                            }
+                        }
+                    }
+                }
+            self.server.nonces[pk] = tx.nonce
+            for action in tx.actions:
+                if action.enum == 'addKey':
+                    new_pk = 'ed25519:' + transaction.base58.b58encode(
+                        action.addKey.publicKey.data).decode('ascii')
+                    self.server.nonces[new_pk] = HEIGHT * 10**6
+        return {'result': {'status': {'SuccessValue': ''}}}
+
+    def call(self, method, params):
+        if method == 'broadcast_tx_commit':
+            return self.execute(base64.b64decode(params[0]))
+        assert params['request_type'] == 'view_access_key_list'
+        with self.server.lock:
+            self.server.queries += 1
+            keys = [{
+                'public_key': pk,
+                'access_key': {
+                    'nonce': nonce
+                }
+            } for pk, nonce in self.server.nonces.items()]
+        return {'result': {'keys': keys}}
+
+
+class NonceManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        key = Key.implicit_account()
+        self.account_key = Key(ACCOUNT_ID, key.pk, key.sk)
+        self.server = fake_rpc.start(FakeNodeHandler,
+                                     txs=0,
+                                     queries=0,
+                                     hide_ak_nonce=False,
+                                     nonces={self.account_key.pk: 5})
+        self.node = cluster.RpcNode(*self.server.server_address)
+
+    def tearDown(self):
+        fake_rpc.stop(self.server)
+
+    def provision(self, num_keys):
+        return NonceManager.provision(self.account_key, self.node, num_keys)
+
+    def send_payment(self, manager):
+        return manager.send_tx_and_wait(
+            lambda key, nonce: transaction.sign_payment_tx(
+                key, 'test1', 1, nonce, bytes(32)))
+
+    def test_provision(self):
+        manager = self.provision(150)
+        # Two transactions adding 100 and 50 keys.
+        self.assertEqual(2, self.server.txs)
+        self.assertEqual(7, self.server.nonces[self.account_key.pk])
+        self.assertEqual(150, len({key.pk for key in manager.keys}))
+        self.assertEqual(151, len(self.server.nonces))
+        for _ in range(150):
+            key, nonce = manager.next()
+            self.assertEqual(ACCOUNT_ID, key.account_id)
+            self.assertEqual(HEIGHT * 10**6 + 1, nonce)
+        self.assertEqual(HEIGHT * 10**6 + 2, manager.next()[1])
+
+    def test_threads(self):
+        manager = self.provision(4)
+        allocated = []
+
+        def allocate():
+            allocated.extend(manager.next() for _ in range(1000))
+
+        threads = [threading.Thread(target=allocate) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(8000,
+                         len({(key.pk, nonce) for key, nonce in allocated}))
+
+        for _ in range(20):
+            self.assertIn('result', self.send_payment(manager))
+        # The transaction adding the keys and the payments.
+        self.assertEqual(21, self.server.txs)
+
+    def test_resync(self):
+        manager = self.provision(2)
+        for hide_ak_nonce in (False, True):
+            self.server.hide_ak_nonce = hide_ak_nonce
+            # Another sender used both keys.
+            for key in manager.keys:
+                self.server.nonces[key.pk] += 100
+            queries = self.server.queries
+            for _ in range(4):
+                self.assertIn('result', self.send_payment(manager))
+            # Each key is rejected once and resynchronised.
+            self.assertEqual(2 if hide_ak_nonce else 0,
+                             self.server.queries - queries)
+        self.assertFalse(manager.check(manager.keys[0], {'result': {}}))
+
+    def test_split(self):
+        manager = self.provision(5)
+        manager.next()
+        parts = manager.split(2)
+        self.assertEqual([3, 2], [len(part.keys) for part in parts])
+        self.assertEqual(set(key.pk for key in manager.keys),
+                         set(key.pk for part in parts for key in part.keys))
+        first_key = manager.keys[0]
+        self.assertEqual((first_key, HEIGHT * 10**6 + 2), parts[0].next())
+        self.assertEqual(HEIGHT * 10**6 + 1, parts[1].next()[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""Tests the open-loop load generator against a fake RPC server.
+
+The test does not start any real nodes.
+"""
+
+import base64
+import pathlib
+import random
+import statistics
+import sys
+import time
+import unittest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import fake_rpc
+import load_generator
+import transaction
+from account import Account
+from key import Key
+from serializer import BinarySerializer
+
+
+class FakeRpcHandler(fake_rpc.Handler):
+    """Accepts `broadcast_tx_async` transactions and records them.
+
+    Responds after `server.delay` seconds.  Transactions with nonces in
+    `server.reject` are answered with an InvalidNonce error.
+    """
+
+    def call(self, method, params):
+        tx = BinarySerializer(transaction.schema).deserialize(
+            base64.b64decode(params[0]),
+            transaction.SignedTransaction).transaction
+        with self.server.lock:
+            self.server.txs.append(tx)
+        time.sleep(self.server.delay)
+        if tx.nonce in self.server.reject:
+            return {
+                'error': {
+                    'name': 'HANDLER_ERROR',
+                    'cause': {
+                        'name': 'INVALID_TRANSACTION'
+                    },
+                    'data': {
+                        'InvalidNonce': {}
+                    }
+                }
+            }
+        return {'result': 'hash'}
+
+
+def start_server(delay=0, reject=()):
+    return fake_rpc.start(FakeRpcHandler,
+                          txs=[],
+                          delay=delay,
+                          reject=set(reject))
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def test_percentiles(self):
+        rng = random.Random(0)
+        values = sorted(rng.lognormvariate(-4, 1.5) for _ in range(20000))
+        histogram = load_generator.LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+        for p in (1, 50, 90, 99, 99.9, 100):
+            expected = values[max(0, round(p / 100 * len(values)) - 1)]
+            self.assertAlmostEqual(expected,
+                                   histogram.percentile(p),
+                                   delta=expected * 0.01 + 1e-6)
+        self.assertEqual(values[-1], histogram.percentile(100))
+
+        other = load_generator.LatencyHistogram()
+        other.record(100)
+        histogram.merge(other)
+        self.assertEqual(20001, histogram.count)
+        self.assertEqual(100, histogram.max)
+        self.assertEqual(values[0], histogram.min)
+        self.assertAlmostEqual(100, histogram.percentile(100))
+
+    def test_empty(self):
+        summary = load_generator.LatencyHistogram().summary()
+        self.assertEqual(0, summary['count'])
+        self.assertIsNone(summary['p99'])
+
+
+class ArrivalTimesTest(unittest.TestCase):
+
+    def take(self, n, **kw):
+        times = load_generator.arrival_times(200, **kw)
+        return [next(times) for _ in range(n)]
+
+    def test_constant(self):
+        times = self.take(1000, poisson=False)
+        self.assertEqual(5.0, times[-1])
+        self.assertAlmostEqual(0.005, times[1] - times[0])
+
+    def test_poisson(self):
+        times = self.take(20000, rng=random.Random(1))
+        gaps = [b - a for a, b in zip([0] + times, times)]
+        self.assertAlmostEqual(0.005, statistics.mean(gaps), delta=0.0002)
+        # Exponential distribution's standard deviation equals its mean.
+        self.assertAlmostEqual(0.005, statistics.stdev(gaps), delta=0.0003)
+
+
+class LoadGeneratorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = None
+
+    def tearDown(self):
+        if self.server:
+            fake_rpc.stop(self.server)
+
+    def make_generator(self, rate, **kw):
+        addr = self.server.server_address
+        keys = [Key.implicit_account() for _ in range(3)]
+        accounts = [Account(key, 10, bytes(32), rpc_info=addr) for key in keys]
+        receivers = ['alice.near', 'bob.near']
+        return load_generator.LoadGenerator(accounts, [
+            load_generator.transfer(receivers, weight=2),
+            load_generator.set_delete_state(receivers),
+            load_generator.ft_transfer_call(receivers),
+        ], [addr],
+                                            rate=rate,
+                                            seed=0,
+                                            **kw), accounts
+
+    def test_mix(self):
+        self.server = start_server(reject={11})
+        generator, accounts = self.make_generator(200, poisson=False)
+        report = generator.run_sync(1)
+        summary = report.summary()
+        self.assertEqual(199, summary['total']['scheduled'])
+        self.assertEqual(199, len(self.server.txs))
+        self.assertEqual(sum(account.nonce - 10 for account in accounts), 199)
+        # Nonce 11 of each account used is rejected.
+        rejected = sum(1 for account in accounts if account.nonce > 10)
+        self.assertEqual({'INVALID_TRANSACTION': rejected},
+                         summary['total']['errors'])
+        self.assertEqual(199 - rejected, summary['total']['accepted'])
+        self.assertEqual({'transfer', 'set_delete_state', 'ft_transfer_call'},
+                         set(report.workloads))
+        transfers = report.workloads['transfer'].scheduled
+        self.assertGreater(transfers,
+                           report.workloads['ft_transfer_call'].scheduled)
+
+        # Every account's nonces are used exactly once.
+        for account in accounts:
+            nonces = sorted(tx.nonce
+                            for tx in self.server.txs
+                            if tx.signerId == account.key.account_id)
+            self.assertEqual(list(range(11, account.nonce + 1)), nonces)
+        methods = {
+            tx.actions[0].functionCall.methodName
+            for tx in self.server.txs
+            if tx.actions[0].enum == 'functionCall'
+        }
+        self.assertLessEqual({'set_state', 'ft_transfer_call'}, methods)
+        self.assertEqual(
+            transfers,
+            sum(1 for tx in self.server.txs
+                if tx.actions[0].enum == 'transfer'))
+        report.log()
+
+    def test_open_loop(self):
+        # Server takes longer to respond than the whole run; a closed-loop
+        # sender would manage a single transaction per connection.
+        self.server = start_server(delay=0.5)
+        generator, _ = self.make_generator(100, poisson=False, connections=8)
+        started = time.monotonic()
+        report = generator.run_sync(0.5)
+        total = report.total()
+        self.assertEqual(49, total.accepted)
+        # Eight requests in flight at a time, each taking half a second.
+        self.assertGreater(time.monotonic() - started, 3)
+        # Time queued behind earlier requests is counted in latency but not
+        # in service latency.
+        self.assertGreater(total.latency.percentile(99), 2.5)
+        self.assertLess(total.service_latency.percentile(99), 1)
+
+    def test_max_in_flight(self):
+        self.server = start_server(delay=1)
+        generator, _ = self.make_generator(100, poisson=False, max_in_flight=10)
+        total = generator.run_sync(0.5).total()
+        self.assertEqual(49, total.scheduled)
+        self.assertEqual(10, total.accepted)
+        self.assertEqual(39, total.dropped)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Tests capturing proxied traffic and replaying it.
+
+The test does not start any real nodes; it uses fake nodes from
+proxy_shared_loop test.
+"""
+
+import asyncio
+import os
+import pathlib
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import peer
+import proxy
+import proxy_capture
+from proxy_shared_loop import (FakeNode, Handler, block_request, exchange,
+                               start_echo_nodes)
+
+
+class CaptureTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.cap')
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_read_write(self):
+        proxy_capture.create(self.path)
+        writer = proxy_capture.CaptureWriter(self.path, 3)
+        writer.write(block_request(1), proxy_capture.INBOUND, None, 3)
+        # PeerMessage::Routed with RoutedMessageBody::ForwardTx.  The frame
+        # itself is not decoded by the capture.
+        writer.write(bytes([13]) + bytes(10), proxy_capture.OUTBOUND, 3, 4, 1)
+        writer.write(block_request(2), proxy_capture.OUTBOUND, 3, None)
+        writer.close()
+        # Record cut short by a killed process is ignored.
+        with open(self.path, 'ab') as wr:
+            wr.write(proxy_capture.RECORD_HEADER.pack(100, 0, 0, 0, 0, 0, 0, 0))
+
+        with proxy_capture.CaptureReader(self.path) as reader:
+            records = list(reader.records())
+            self.assertEqual(3, len(records))
+            self.assertEqual(block_request(1), records[0].frame)
+            self.assertEqual((proxy_capture.INBOUND, 3, None, 3),
+                             (records[0].direction, records[0].node,
+                              records[0].sender, records[0].receiver))
+            self.assertEqual(('Routed', 'ForwardTx'),
+                             (records[1].type, records[1].body))
+            self.assertLessEqual(records[0].timestamp, records[2].timestamp)
+            self.assertEqual(
+                {
+                    ('BlockRequest', None):
+                        [records[0].offset, records[2].offset],
+                    ('Routed', 'ForwardTx'): [records[1].offset],
+                }, reader.index())
+            self.assertEqual(
+                [records[1].offset],
+                [r.offset for r in reader.records(types={'Routed'})])
+            self.assertEqual([records[2].offset], [
+                r.offset
+                for r in reader.records(types={'BlockRequest'},
+                                        direction=proxy_capture.OUTBOUND)
+            ])
+
+    def test_capture_and_replay(self):
+        node = FakeNode(10)
+        start_echo_nodes([node])
+        nodes_proxy = proxy.NodesProxy(Handler, workers=1, capture=self.path)
+        try:
+            nodes_proxy.proxify_node(node)
+            node._start_proxy()
+            requests = [block_request(i) for i in range(5)]
+            for raw in requests:
+                self.assertEqual(raw, exchange(node.port, [raw]))
+                time.sleep(0.05)
+        finally:
+            nodes_proxy.global_stopped.value = 1
+            for p in nodes_proxy.ps:
+                p.join(5)
+
+        with proxy_capture.CaptureReader(self.path) as reader:
+            inbound = list(
+                reader.records(node=10, direction=proxy_capture.INBOUND))
+            self.assertEqual(requests, [r.frame for r in inbound])
+            outbound = list(
+                reader.records(node=10, direction=proxy_capture.OUTBOUND))
+            self.assertEqual(requests, [r.frame for r in outbound])
+            self.assertEqual(10, outbound[0].sender)
+
+            async def replay(speed):
+                received = asyncio.Queue()
+                server = await asyncio.start_server(
+                    lambda r, w: received.put_nowait(peer.Connection(r, w)),
+                    '127.0.0.1', 0)
+                conn = await peer.connect(server.sockets[0].getsockname())
+                start = time.monotonic()
+                count = await proxy_capture.replay(conn, inbound, speed=speed)
+                elapsed = time.monotonic() - start
+                other = await received.get()
+                frames = [await other.recv_raw() for _ in range(count)]
+                await conn.close()
+                await other.close()
+                server.close()
+                return frames, elapsed
+
+            duration = inbound[-1].timestamp - inbound[0].timestamp
+            self.assertGreater(duration, 0.2)
+            frames, elapsed = asyncio.run(replay(1))
+            self.assertEqual(requests, frames)
+            self.assertGreater(elapsed, duration * 0.9)
+            frames, elapsed = asyncio.run(replay(10))
+            self.assertEqual(requests, frames)
+            self.assertLess(elapsed, duration / 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
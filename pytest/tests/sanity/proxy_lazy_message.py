@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Tests lazy decoding of messages passing through the proxy.
+
+Checks that LazyMessage views decode only what is accessed, forward raw bytes
+of messages which weren't modified and re-encode the ones which were.  The
+test does not start any nodes.
+"""
+
+import asyncio
+import pathlib
+import sys
+import unittest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+from nacl.signing import SigningKey
+
+import peer
+import proxy
+import transaction
+from key import Key
+from messages.network import PeerMessage, RoutedMessageBody
+from serializer import BinarySerializer
+from messages import schema
+
+# Ports as assigned by cluster.spin_up_node to nodes #0 and #1 after
+# proxify_node moved them by 100.
+NODE0_PORT = 24577 + 100
+NODE1_PORT = 24578 + 100
+
+
+def serialize(msg):
+    return BinarySerializer(schema).serialize(msg)
+
+
+def make_routed_tx():
+    key = Key.implicit_account()
+    signed_tx = transaction.sign_payment_tx(key, 'bob.near', 10, 1, bytes(32))
+    body = RoutedMessageBody()
+    body.enum = 'ForwardTx'
+    body.ForwardTx = BinarySerializer(transaction.schema).deserialize(
+        signed_tx, transaction.SignedTransaction)
+
+    class Target:
+        node_key = key
+
+    return peer.create_and_sign_routed_peer_message(body, Target,
+                                                    SigningKey.generate())
+
+
+def make_handshake():
+    return peer.create_handshake(SigningKey.generate(), 'ed25519:' + '1' * 32,
+                                 24578)
+
+
+class RecordingHandler(proxy.ProxyHandler):
+
+    def __init__(self, ordinal, decision=True):
+        super().__init__(ordinal)
+        self.decision = decision
+        self.seen = []
+
+    async def handle(self, msg, fr, to):
+        self.seen.append((msg.enum, fr, to))
+        if callable(self.decision):
+            return self.decision(msg)
+        return self.decision
+
+
+async def run_handle(handler, raw):
+    return await handler._handle(raw,
+                                 writer=None,
+                                 sender_port_holder=[NODE1_PORT],
+                                 receiver_port_holder=[NODE0_PORT],
+                                 ordinal_to_writer={})
+
+
+class LazyMessageTest(unittest.TestCase):
+
+    def test_untouched_message_is_not_reencoded(self):
+        raw = serialize(make_routed_tx())
+        msg = proxy.LazyMessage.decode(raw)
+        self.assertEqual('Routed', msg.enum)
+        self.assertEqual('ForwardTx', msg.Routed.body.enum)
+        self.assertEqual(100, msg.Routed.ttl)
+        self.assertFalse(msg.is_dirty())
+        self.assertIs(raw, msg.serialize())
+
+    def test_modified_message_is_reencoded(self):
+        original = make_routed_tx()
+        raw = serialize(original)
+        msg = proxy.LazyMessage.decode(raw)
+        msg.Routed.body.ForwardTx.transaction.nonce = 42
+        self.assertTrue(msg.is_dirty())
+        original.Routed.body.ForwardTx.transaction.nonce = 42
+        self.assertEqual(serialize(original), msg.serialize())
+
+        original.Routed.body.ForwardTx.transaction.nonce = 1
+        msg = proxy.LazyMessage.decode(raw)
+        msg.Routed.ttl = 7
+        original.Routed.ttl = 7
+        self.assertEqual(serialize(original), msg.serialize())
+
+        materialized = proxy.LazyMessage.decode(raw).materialize()
+        self.assertIsInstance(materialized, PeerMessage)
+        self.assertEqual(raw, serialize(materialized))
+        # Only views of structs and enums can be created.
+        with self.assertRaises(TypeError):
+            proxy.LazyMessage(PeerMessage, raw)
+
+    def test_unparsable(self):
+        msg = proxy.LazyMessage.decode(b'\xff')
+        with self.assertRaises(proxy.UnparsableMessage):
+            msg.enum
+
+    def test_handle(self):
+
+        async def test():
+            raw = serialize(make_routed_tx())
+            handler = RecordingHandler(0)
+            self.assertIs(True, await run_handle(handler, raw))
+            self.assertEqual([('Routed', 1, 0)], handler.seen)
+
+            # Handshake listen port gets rewritten to point at the proxy.
+            handshake = make_handshake()
+            got = await run_handle(handler, serialize(handshake))
+            handshake.Handshake.listen_port += 100
+            self.assertEqual(serialize(handshake), got)
+
+            handler = RecordingHandler(0, decision=False)
+            self.assertIs(False, await run_handle(handler, raw))
+
+            def modify(msg):
+                msg.Routed.body.ForwardTx.transaction.nonce += 1
+                return msg
+
+            handler = RecordingHandler(0, decision=modify)
+            got = BinarySerializer(schema).deserialize(
+                await run_handle(handler, raw), PeerMessage)
+            self.assertEqual(2, got.Routed.body.ForwardTx.transaction.nonce)
+
+            # Unknown message kinds are dropped.
+            self.assertIsNone(await run_handle(handler, b'\xff'))
+
+        asyncio.run(test())
+
+    def test_eager_handler(self):
+
+        class EagerHandler(RecordingHandler):
+            lazy_decoding = False
+
+        async def test():
+            raw = serialize(make_routed_tx())
+            handler = EagerHandler(0, decision=lambda msg: msg)
+            self.assertEqual(raw, await run_handle(handler, raw))
+
+        asyncio.run(test())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Tests per message kind statistics collected by NodesProxy.
+
+The test does not start any real nodes; it uses fake nodes from
+proxy_shared_loop test.
+"""
+
+import pathlib
+import sys
+import time
+import unittest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+from prometheus_client import parser
+
+import proxy
+import proxy_stats
+from proxy_shared_loop import (FakeNode, Handler, block_request, exchange,
+                               start_echo_nodes)
+
+
+class MessageStatsTest(unittest.TestCase):
+
+    def make_stats(self):
+        stats = proxy_stats.MessageStats()
+        stats.record((0, 1, 'Block', None), 1000, False, 1e-4, 2e-4)
+        stats.record((0, 1, 'Block', None), 3000, True, 1e-3, 2e-3)
+        stats.record((1, 0, 'Routed', 'ForwardTx'), 300, False, None, 5e-5)
+        return stats
+
+    def test_merge_and_serialization(self):
+        stats = self.make_stats()
+        copy = proxy_stats.MessageStats.from_dict(stats.to_dict())
+        self.assertEqual(stats.to_dict(), copy.to_dict())
+        copy.merge(stats)
+        entry = copy.entries[(0, 1, 'Block', None)]
+        self.assertEqual((4, 8000, 2),
+                         (entry.count, entry.bytes, entry.dropped))
+        self.assertEqual(4, entry.handler_latency.count)
+        self.assertEqual(1e-4, entry.handler_latency.quantile(0.5))
+        self.assertEqual(
+            0,
+            copy.entries[(1, 0, 'Routed', 'ForwardTx')].handler_latency.count)
+
+        summary = stats.summary()
+        self.assertEqual(['Block', 'Routed'], [s['type'] for s in summary])
+        self.assertEqual(1e-3, summary[0]['handler_latency_p99'])
+        self.assertIsNone(summary[1]['handler_latency_p50'])
+
+    def test_prometheus(self):
+        families = {
+            family.name: family
+            for family in parser.text_string_to_metric_families(
+                self.make_stats().to_prometheus())
+        }
+        samples = families['near_proxy_message_bytes'].samples
+        self.assertEqual(
+            {
+                ('0', '1', 'Block', ''): 4000,
+                ('1', '0', 'Routed', 'ForwardTx'): 300
+            }, {(s.labels['sender'], s.labels['receiver'], s.labels['type'],
+                 s.labels['body']): s.value for s in samples})
+        buckets = [
+            s for s in families['near_proxy_processing_latency_seconds'].samples
+            if s.name.endswith('_bucket') and s.labels['type'] == 'Block'
+        ]
+        self.assertEqual('+Inf', buckets[-1].labels['le'])
+        self.assertEqual(2, buckets[-1].value)
+
+    def test_nodes_proxy(self):
+        nodes = [FakeNode(ordinal) for ordinal in (6, 7)]
+        start_echo_nodes(nodes)
+        nodes_proxy = proxy.NodesProxy(Handler, workers=1, collect_stats=True)
+        try:
+            for node in nodes:
+                nodes_proxy.proxify_node(node)
+                node._start_proxy()
+                raw = block_request(1)
+                self.assertEqual(
+                    raw, exchange(node.port, [block_request(0xff), raw, raw]))
+
+            deadline = time.monotonic() + 5
+            while True:
+                summary = nodes_proxy.message_stats().summary()
+                if summary and summary[0]['count'] == 2 * 5:
+                    break
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.2)
+            self.assertEqual(1, len(summary))
+            self.assertEqual('BlockRequest', summary[0]['type'])
+            self.assertEqual(2, summary[0]['dropped'])
+            self.assertEqual(10 * 33, summary[0]['bytes'])
+            stats = nodes_proxy.message_stats()
+            # Messages from the client to the node have unknown sender.
+            self.assertEqual({(None, 6), (6, None), (None, 7), (7, None)},
+                             {key[:2] for key in stats.entries})
+        finally:
+            nodes_proxy.global_stopped.value = 1
+            for p in nodes_proxy.ps:
+                p.join(5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Tests network emulation of proxy_instances.NetworkEmulationHandler.
+
+The test does not start any real nodes; it uses fake nodes from
+proxy_shared_loop test.
+"""
+
+import functools
+import pathlib
+import random
+import socket
+import struct
+import sys
+import time
+import unittest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+from nacl.signing import SigningKey
+
+import peer
+import proxy
+from messages import schema
+from proxy_instances import EmulatedLink, LinkProfile, NetworkEmulationHandler
+from proxy_shared_loop import FakeNode, block_request, start_echo_nodes
+from serializer import BinarySerializer
+
+
+class EmulatedLinkTest(unittest.TestCase):
+
+    def test_delay(self):
+        link = EmulatedLink(LinkProfile(0.1))
+        self.assertAlmostEqual(10.1, link.schedule(100, 10))
+        link = EmulatedLink(LinkProfile(lambda: 0.25))
+        self.assertAlmostEqual(10.25, link.schedule(100, 10))
+
+    def test_bandwidth(self):
+        link = EmulatedLink(LinkProfile(0.1, bandwidth=1000, queue_limit=2500))
+        self.assertAlmostEqual(10.2, link.schedule(100, 10))
+        self.assertAlmostEqual(11.2, link.schedule(1000, 10))
+        self.assertAlmostEqual(12.2, link.schedule(1000, 10.5))
+        # 1.6 seconds worth of data still queued, 1000 more doesn’t fit.
+        self.assertIsNone(link.schedule(1000, 10.5))
+        # Idle link starts transmitting immediately.
+        self.assertAlmostEqual(20.2, link.schedule(100, 20))
+
+    def test_reorder(self):
+        random.seed(0)
+        for reorder in (False, True):
+            link = EmulatedLink(LinkProfile(1, jitter=0.5, reorder=reorder))
+            arrivals = [link.schedule(10, i * 0.01) for i in range(100)]
+            self.assertEqual(not reorder, arrivals == sorted(arrivals))
+
+    def test_loss(self):
+        random.seed(0)
+        link = EmulatedLink(LinkProfile(loss=0.5))
+        dropped = sum(link.schedule(10, 0) is None for _ in range(1000))
+        self.assertLess(400, dropped)
+        self.assertLess(dropped, 600)
+
+
+class NetworkEmulationTest(unittest.TestCase):
+
+    def test_proxy(self):
+        node = FakeNode(8)
+        start_echo_nodes([node])
+        # Client pretends to be node #9; requests from it are delayed by 0.3 s
+        # and the link back from the node is limited to 330 B/s.
+        handler = functools.partial(NetworkEmulationHandler,
+                                    links={
+                                        (9, 8): LinkProfile(0.3),
+                                        (8, 9): LinkProfile(bandwidth=330),
+                                    })
+        nodes_proxy = proxy.NodesProxy(handler, workers=0, collect_stats=True)
+        try:
+            nodes_proxy.proxify_node(node)
+            node._start_proxy()
+            with socket.create_connection(('127.0.0.1', node.port)) as sock:
+
+                def send(raw):
+                    sock.sendall(struct.pack('I', len(raw)) + raw)
+
+                def recv():
+                    length = struct.unpack('I',
+                                           sock.recv(4, socket.MSG_WAITALL))[0]
+                    return sock.recv(length, socket.MSG_WAITALL)
+
+                handshake = peer.create_handshake(SigningKey.generate(),
+                                                  'ed25519:' + '1' * 32,
+                                                  FakeNode(9).port)
+                send(BinarySerializer(schema).serialize(handshake))
+                recv()
+
+                start = time.monotonic()
+                requests = [block_request(i) for i in range(5)]
+                for raw in requests:
+                    send(raw)
+                self.assertEqual(requests, [recv() for _ in requests])
+                # 0.3 s delay plus 5 * 33 bytes at 330 B/s.
+                self.assertGreater(time.monotonic() - start, 0.3 + 0.5)
+                self.assertLess(time.monotonic() - start, 2)
+
+            deadline = time.monotonic() + 5
+            while True:
+                stats = {
+                    item['type']: item
+                    for item in nodes_proxy.message_stats().summary()
+                }
+                if stats.get('BlockRequest', {}).get('count') == 10:
+                    break
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.2)
+            # Delayed messages aren’t counted as dropped.
+            self.assertEqual(0, stats['BlockRequest']['dropped'])
+        finally:
+            nodes_proxy.global_stopped.value = 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Tests NodesProxy hosting many nodes in shared event loops.
+
+Proxifies fake nodes which echo every message back and checks that messages
+pass through the proxy in the single thread and worker processes modes, that
+handlers share `state` and that a node’s proxy can be restarted.  The test
+does not start any real nodes.
+"""
+
+import pathlib
+import socket
+import struct
+import sys
+import time
+import unittest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import echo_nodes
+import proxy
+from messages import schema
+from messages.network import PeerMessage
+from serializer import BinarySerializer
+
+
+def block_request(marker):
+    msg = PeerMessage()
+    msg.enum = 'BlockRequest'
+    msg.BlockRequest = bytes([marker]) * 32
+    return BinarySerializer(schema).serialize(msg)
+
+
+class Handler(proxy.ProxyHandler):
+
+    async def handle(self, msg, fr, to):
+        self.state[self.ordinal] = self.state.get(self.ordinal, 0) + 1
+        return msg.BlockRequest[0] != 0xff
+
+
+def exchange(port, raw_messages):
+    """Sends messages to the port and returns first echoed message."""
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        for raw in raw_messages:
+            sock.sendall(struct.pack('I', len(raw)) + raw)
+        length = struct.unpack('I', sock.recv(4, socket.MSG_WAITALL))[0]
+        return sock.recv(length, socket.MSG_WAITALL)
+
+
+class SharedLoopTest(unittest.TestCase):
+
+    def check_proxy(self, workers):
+        nodes = echo_nodes.start(3)
+        nodes_proxy = proxy.NodesProxy(Handler, workers=workers)
+        try:
+            for node in nodes:
+                nodes_proxy.proxify_node(node)
+                local_stopped = node._start_proxy()
+                self.assertEqual(0, local_stopped.value)
+            self.assertEqual(workers, len(nodes_proxy.ps))
+
+            for node in nodes:
+                for marker in range(3):
+                    raw = block_request(marker)
+                    self.assertEqual(raw, exchange(node.port, [raw]))
+                # Dropped message doesn’t get to the node.
+                raw = block_request(7)
+                self.assertEqual(
+                    raw, exchange(node.port, [block_request(0xff), raw]))
+            # Each delivered message was handled on the way in and back.
+            self.assertEqual({node.ordinal: 4 * 2 + 1 for node in nodes},
+                             dict(nodes_proxy.state))
+
+            # Restart proxy of one of the nodes.
+            local_stopped.value = 1
+            deadline = time.monotonic() + 5
+            while local_stopped.value != 2:
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.1)
+            node._start_proxy()
+            raw = block_request(1)
+            self.assertEqual(raw, exchange(node.port, [raw]))
+            self.assertEqual(0, nodes_proxy.error.value)
+        finally:
+            nodes_proxy.global_stopped.value = 1
+            for p in nodes_proxy.ps:
+                p.join(5)
+
+    def test_single_thread(self):
+        self.check_proxy(0)
+
+    def test_worker_processes(self):
+        self.check_proxy(2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""Tests the pooled JSON-RPC client and batch requests against a fake server.
+
+The test does not start any real nodes.
+"""
+
+import multiprocessing
+import pathlib
+import socket
+import sys
+import threading
+import time
+import unittest
+
+import requests
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import block_cache
+import cluster
+import fake_rpc
+import rpc_client
+
+
+class FakeRpcHandler(fake_rpc.ChainHandler):
+    """Answers /status and echoes JSON-RPC requests.
+
+    `sleep` method waits for given number of seconds, `fail` responds with
+    HTTP 500 and `drop` closes the connection after responding without
+    telling the client.  `block` returns blocks of `server.chain`.  Batch
+    requests are answered, in reverse order, only if `server.batches` is set
+    and otherwise rejected with HTTP status `server.reject_status`.  The
+    next `server.failing_batches` batches get HTTP 503.
+    """
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        self.respond({'sync_info': {'latest_block_height': 42}})
+
+    def call(self, method, params):
+        if method == 'block':
+            return super().call(method, params)
+        return {'result': params}
+
+    def do_POST(self):
+        request = self.read_request()
+        with self.server.lock:
+            self.server.requests += 1
+            fail = isinstance(request, list) and self.server.failing_batches
+            self.server.failing_batches -= bool(fail)
+        if fail:
+            self.respond({'error': 'unavailable'}, status=503)
+            return
+        if isinstance(request, list):
+            if self.server.batches:
+                self.respond([self.answer(r) for r in reversed(request)])
+            else:
+                parse_error = {'id': None, 'error': {'code': -32700}}
+                self.respond(parse_error, status=self.server.reject_status)
+            return
+        method = request['method']
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight,
+                                            self.server.in_flight)
+        try:
+            if method == 'sleep':
+                time.sleep(request['params'][0])
+            if method == 'fail':
+                self.respond({'error': 'failed'}, status=500)
+                return
+            self.respond(self.answer(request))
+            if method == 'drop':
+                self.close_connection = True
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+
+def start_server():
+    return fake_rpc.start(
+        FakeRpcHandler,
+        # Writing responses to clients which gave up waiting fails.
+        handle_error=lambda request, client_address: None,
+        connections=0,
+        batches=True,
+        reject_status=200,
+        failing_batches=0,
+        chain={},
+        in_flight=0,
+        max_in_flight=0)
+
+
+def child_status(addr, result):
+    result.value = rpc_client.shared().get_status(
+        addr)['sync_info']['latest_block_height']
+
+
+class RpcClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = start_server()
+        self.addr = self.server.server_address
+        self.client = rpc_client.RpcClient(concurrency=4)
+
+    def tearDown(self):
+        self.client.close()
+        fake_rpc.stop(self.server)
+
+    def test_keep_alive(self):
+        for i in range(20):
+            self.assertEqual([i],
+                             self.client.json_rpc(self.addr, 'echo',
+                                                  [i])['result'])
+        status = self.client.get_status(self.addr)
+        self.assertEqual(42, status['sync_info']['latest_block_height'])
+        self.assertEqual(1, self.server.connections)
+
+    def test_many(self):
+        calls = [('sleep', [0.05, i]) for i in range(12)]
+        started = time.monotonic()
+        responses = self.client.json_rpc_many(self.addr, calls)
+        elapsed = time.monotonic() - started
+        self.assertEqual([[0.05, i] for i in range(12)],
+                         [response['result'] for response in responses])
+        self.assertEqual(4, self.server.max_in_flight)
+        # Three rounds of four concurrent requests.
+        self.assertLess(elapsed, 0.5)
+
+    def test_threads(self):
+        results = []
+
+        def call(i):
+            results.append(
+                self.client.json_rpc(self.addr, 'echo', [i])['result'][0])
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(list(range(8)), sorted(results))
+
+    def test_errors(self):
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.client.json_rpc(self.addr, 'fail', [])
+        self.assertEqual({'error': 'failed'},
+                         self.client.json_rpc(self.addr,
+                                              'fail', [],
+                                              check_status=False))
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.client.json_rpc(self.addr, 'sleep', [1], timeout=0.1)
+
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        closed_addr = sock.getsockname()
+        sock.close()
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.get_status(closed_addr)
+
+    def test_server_closes_connection(self):
+        for i in range(5):
+            self.assertEqual([i],
+                             self.client.json_rpc(self.addr, 'drop',
+                                                  [i])['result'])
+        self.assertEqual(5, self.server.connections)
+
+    def test_fork(self):
+        self.assertEqual(
+            42,
+            rpc_client.shared().get_status(
+                self.addr)['sync_info']['latest_block_height'])
+        ctx = multiprocessing.get_context('fork')
+        result = ctx.Value('i', 0)
+        process = ctx.Process(target=child_status, args=(self.addr, result))
+        process.start()
+        process.join(10)
+        self.assertEqual(0, process.exitcode)
+        self.assertEqual(42, result.value)
+
+
+def make_chain(server, height, skipped):
+    """Fills server.chain with blocks at heights 0 to height."""
+    prev_hash = None
+    for h in range(height + 1):
+        if h in skipped:
+            continue
+        block = {
+            'header': {
+                'height': h,
+                'hash': f'hash{h}',
+                'prev_hash': prev_hash
+            }
+        }
+        server.chain[h] = server.chain[f'hash{h}'] = block
+        prev_hash = f'hash{h}'
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = start_server()
+        self.addr = self.server.server_address
+        self.client = rpc_client.RpcClient()
+
+    def tearDown(self):
+        self.client.close()
+        fake_rpc.stop(self.server)
+
+    def check_batch(self, expected_requests):
+        calls = [('echo', [i]) for i in range(250)]
+        responses = self.client.json_rpc_batch(self.addr, calls)
+        self.assertEqual([[i] for i in range(250)],
+                         [response['result'] for response in responses])
+        self.assertEqual(expected_requests, self.server.requests)
+
+    def test_batch(self):
+        self.check_batch(3)
+
+    def test_fallback(self):
+        self.server.batches = False
+        # Three rejected batches and 250 individual requests.
+        self.check_batch(253)
+        # Server is not sent batches again.
+        self.check_batch(503)
+
+    def test_rejected_status(self):
+        self.server.batches = False
+        self.server.reject_status = 400
+        self.check_batch(253)
+
+    def test_transient_failure(self):
+        self.server.failing_batches = 2
+        # Only failed batches are retried.
+        self.check_batch(5)
+        # Server is still sent batches.
+        self.check_batch(8)
+
+    def test_walk_blocks(self):
+        make_chain(self.server, 120, skipped={7, 50, 51, 99})
+        node = cluster.RpcNode(*self.addr)
+        node.block_cache = block_cache.BlockCache()
+        heights = [
+            block['header']['height']
+            for block in node.walk_blocks('hash120', batch_size=50)
+        ]
+        self.assertEqual(
+            [h for h in range(120, -1, -1) if h not in {7, 50, 51, 99}],
+            heights)
+        # The first block and three batches of fifty.
+        self.assertEqual(4, self.server.requests)
+
+        # Blocks below 30 have been garbage collected and aren't cached.
+        for h in range(30):
+            self.server.chain.pop(h, None)
+            self.server.chain.pop(f'hash{h}', None)
+        node.block_cache = block_cache.BlockCache()
+        heights = [
+            block['header']['height']
+            for block in node.walk_blocks('hash120', batch_size=50)
+        ]
+        self.assertEqual(30, heights[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Tests message classes generated from the schema.
+
+The test does not start any nodes.
+"""
+
+import pathlib
+import pickle
+import sys
+import unittest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import messages
+import serializer
+import transaction
+from key import Key
+from messages.block import BlockHeader, PartialEncodedChunk
+from messages.crypto import PublicKey, Signature
+from messages.network import PeerMessage
+
+
+class SchemaClassesTest(unittest.TestCase):
+
+    def test_all_slotted(self):
+        for type_ in messages.schema:
+            with self.subTest(type=type_.__name__):
+                self.assertIn('__slots__', vars(type_))
+                self.assertTrue(issubclass(type_, serializer.SchemaStruct))
+                self.assertFalse(hasattr(type_(), '__dict__'))
+
+    def test_constructors(self):
+        key = PublicKey(0, bytes(32))
+        self.assertEqual((0, bytes(32)), (key.keyType, key.data))
+        self.assertEqual(key, PublicKey(data=bytes(32), keyType=0))
+        with self.assertRaises(TypeError):
+            PublicKey(0, bytes(32), 1)
+        with self.assertRaises(TypeError):
+            PublicKey(foo=1)
+        with self.assertRaises(AttributeError):
+            key.foo = 1
+
+        msg = PeerMessage('Disconnect')
+        self.assertEqual('Disconnect', msg.enum)
+        self.assertIsNone(msg.Disconnect)
+
+        # Hand-written constructors and methods are kept.
+        signature = Signature('ed25519:' + '1' * 64)
+        self.assertEqual(0, signature.keyType)
+        self.assertTrue(hasattr(BlockHeader, 'inner_lite'))
+        self.assertTrue(hasattr(PartialEncodedChunk, 'inner_header'))
+
+    def test_equality(self):
+        self.assertEqual(PublicKey(0, bytes(32)), PublicKey(0, bytes(32)))
+        self.assertNotEqual(PublicKey(0, bytes(32)), PublicKey(1, bytes(32)))
+        self.assertNotEqual(PublicKey(), PublicKey(0))
+        self.assertEqual(
+            1, len({PublicKey(0, bytes(32)),
+                    PublicKey(0, bytes(32))}))
+        self.assertEqual(PeerMessage('Disconnect'), PeerMessage('Disconnect'))
+
+        tx = transaction.sign_payment_tx(Key.implicit_account(), 'bob.near', 10,
+                                         1, bytes(32))
+        codec = serializer.BinarySerializer(transaction.schema)
+        a = codec.deserialize(tx, transaction.SignedTransaction)
+        b = serializer.BinarySerializer(transaction.schema,
+                                        compiled=True).deserialize(
+                                            tx, transaction.SignedTransaction)
+        self.assertEqual(a, b)
+        # Hashing objects with list fields works.
+        self.assertEqual(hash(a), hash(b))
+        b.transaction.nonce += 1
+        self.assertNotEqual(a, b)
+
+    def test_pickle(self):
+        msg = PeerMessage('Disconnect')
+        self.assertEqual(msg, pickle.loads(pickle.dumps(msg)))
+        key = PublicKey(0, bytes(32))
+        self.assertEqual(key, pickle.loads(pickle.dumps(key)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -93,19 +93,17 @@ start = time.time()
 tracker0 = utils.LogTracker(nodes[0])
 tracker1 = utils.LogTracker(nodes[1])
 
-while True:
-    assert time.time() - start < TIMEOUT
-
-    if should_ban:
-        if tracker1.check(BAN_STRING):
-            break
-    else:
+if should_ban:
+    tracker1.wait_for(BAN_STRING, timeout=TIMEOUT)
+else:
+    while True:
+        assert time.time() - start < TIMEOUT
         cur_height = nodes[0].get_latest_block().height
         node1_height = nodes[1].get_latest_block().height
         if (abs(node1_height - cur_height) < 5 and
                 status1['sync_info']['syncing'] is False):
             break
-    time.sleep(2)
+        time.sleep(2)
 
 if not should_ban and (tracker0.check(BAN_STRING) or
                        tracker1.check(BAN_STRING)):
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Tests TxTracker following blocks of a fake RPC server.
+
+The test does not start any real nodes.
+"""
+
+import pathlib
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import cluster
+import fake_rpc
+import tx_tracker
+
+# Timestamp, in seconds, of block at height 0.
+GENESIS_TIME = 1600000000
+
+
+class FakeChainHandler(fake_rpc.ChainHandler):
+    """Serves blocks and chunks up to `server.latest`.
+
+    Heights in `server.skipped` have no block.  Each block has a single chunk
+    with transactions `server.txs[height]`.  `broadcast_tx_async` responds
+    with the transaction bytes as the hash.
+    """
+
+    def block(self, block_id):
+        if block_id > self.server.latest or block_id in self.server.skipped:
+            return None
+        return make_block(block_id)
+
+    def chunk(self, chunk_hash):
+        height = int(chunk_hash[len('chunk'):])
+        return {
+            'transactions': [{
+                'hash': tx_hash
+            } for tx_hash in self.server.txs.get(height, ())]
+        }
+
+    def call(self, method, params):
+        if method == 'broadcast_tx_async':
+            return {'result': params[0]}
+        return super().call(method, params)
+
+
+def make_block(height):
+    return {
+        'header': {
+            'height': height,
+            'hash': f'block{height}',
+            'timestamp': (GENESIS_TIME + height) * 10**9,
+            'last_final_block': f'block{height - 2}',
+        },
+        'chunks': [{
+            'chunk_hash': f'chunk{height}',
+            'height_included': height,
+        }],
+    }
+
+
+class TxTrackerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = fake_rpc.start(FakeChainHandler,
+                                     latest=10,
+                                     skipped=set(),
+                                     txs={})
+        self.node = cluster.RpcNode(*self.server.server_address)
+
+    def tearDown(self):
+        fake_rpc.stop(self.server)
+
+    def test_lifecycle(self):
+        tracker = tx_tracker.TxTracker(self.node, drop_after=5)
+        tracker.start()
+        submitted_at = GENESIS_TIME + 10
+        for tx_hash in ('tx1', 'tx2', 'lost'):
+            tracker.track(tx_hash, submitted_at)
+        self.server.txs = {11: ['tx1'], 13: ['tx2', 'other']}
+        # Block 12 is skipped; block 13 finalises block 11.
+        self.server.skipped = {12}
+        self.server.latest = 20
+        self.server.requests = 0
+        self.assertEqual(9, tracker.poll())
+        # A single batch request for the blocks and one for the chunks.
+        self.assertEqual(2, self.server.requests)
+
+        summary = tracker.summary()
+        self.assertEqual(3, summary['submitted'])
+        self.assertEqual(2, summary['included'])
+        self.assertEqual(2, summary['final'])
+        self.assertEqual(1, summary['dropped'])
+        self.assertAlmostEqual(1 / 3, summary['drop_rate'])
+        self.assertEqual(1, tracker.inclusion_latency.min)
+        self.assertEqual(3, tracker.inclusion_latency.max)
+        # Block 13 finalises tx1, block 15 finalises tx2.
+        self.assertEqual(3, tracker.finality_latency.min)
+        self.assertEqual(5, tracker.finality_latency.max)
+        self.assertEqual(0, tracker.outstanding())
+        self.assertEqual(0, tracker.poll())
+        tracker.log()
+
+    def test_submit(self):
+        tracker = tx_tracker.TxTracker(self.node)
+        self.assertEqual('c2lnbmVk', tracker.submit(b'signed'))
+        self.server.txs = {11: ['c2lnbmVk']}
+        self.server.latest = 13
+        self.assertTrue(tracker.wait(timeout=5))
+        self.assertEqual(1, tracker.final)
+
+    def test_wait(self):
+        tracker = tx_tracker.TxTracker(self.node)
+        tracker.start()
+        tracker.track('tx', GENESIS_TIME + 10)
+        self.server.txs = {12: ['tx']}
+
+        def produce_blocks():
+            for _ in range(4):
+                time.sleep(0.05)
+                self.server.latest += 1
+
+        producer = threading.Thread(target=produce_blocks)
+        producer.start()
+        self.assertTrue(tracker.wait(timeout=5, poll_interval=0.01))
+        producer.join()
+        self.assertEqual(1, tracker.final)
+        self.assertEqual(4, tracker.finality_latency.max)
+
+    def test_many_txs(self):
+        # Blocks come a second apart; don't drop transactions waiting for the
+        # last of them.
+        tracker = tx_tracker.TxTracker(self.node, drop_after=1000)
+        tracker.start()
+        count = 100000
+        for i in range(count):
+            tracker.track(f'tx{i}', GENESIS_TIME + 10)
+        per_block = 1000
+        self.server.txs = {
+            11 + i // per_block: [f'tx{j}' for j in range(i, i + per_block)
+                                 ] for i in range(0, count, per_block)
+        }
+        self.server.latest = 11 + count // per_block + 2
+        self.server.requests = 0
+        started = time.monotonic()
+        tracker.poll()
+        elapsed = time.monotonic() - started
+        self.assertEqual(count, tracker.final)
+        self.assertEqual(0, tracker.outstanding())
+        self.assertEqual(1, tracker.inclusion_latency.min)
+        self.assertEqual(count // per_block,
+                         tracker.inclusion_latency.percentile(100))
+        # Three batches of fifty blocks and two of up to a hundred chunks.
+        self.assertEqual(5, self.server.requests)
+        self.assertLess(elapsed, 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Tests TxSigner against straightforward transaction signing.
+
+The test does not start any nodes.
+"""
+
+import concurrent.futures
+import hashlib
+import pathlib
+import sys
+import unittest
+
+import base58
+import ed25519
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
+
+import transaction
+from key import Key
+from serializer import BinarySerializer
+
+
+def reference_sign(key, receiver_id, nonce, actions, block_hash):
+    """Signs transaction building the whole SignedTransaction message."""
+    tx, hash_ = transaction.compute_tx_hash(receiver_id, nonce, actions,
+                                            block_hash, key.account_id,
+                                            key.decoded_pk())
+    signature = transaction.Signature()
+    signature.keyType = 0
+    signature.data = ed25519.SigningKey(key.decoded_sk()).sign(hash_)
+    signed = transaction.SignedTransaction()
+    signed.transaction = tx
+    signed.signature = signature
+    return BinarySerializer(transaction.schema).serialize(signed)
+
+
+class TxSignerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.key = Key.implicit_account()
+        self.block_hash = hashlib.sha256(b'block').digest()
+
+    def make_txs(self, count):
+        return [('bob.near', nonce, [transaction.create_payment_action(nonce)],
+                 self.block_hash) for nonce in range(1, count + 1)]
+
+    def test_sign(self):
+        signer = transaction.get_signer(self.key)
+        self.assertIs(signer, transaction.get_signer(self.key))
+        for tx in self.make_txs(3):
+            self.assertEqual(reference_sign(self.key, *tx), signer.sign(*tx))
+
+        signed, hash_ = signer.sign_and_get_hash(*self.make_txs(1)[0])
+        decoded = BinarySerializer(transaction.schema).deserialize(
+            signed, transaction.SignedTransaction)
+        body = BinarySerializer(transaction.schema).serialize(
+            decoded.transaction)
+        self.assertEqual(
+            base58.b58encode(hashlib.sha256(body).digest()).decode('utf8'),
+            hash_)
+
+    def test_helpers(self):
+        self.assertEqual(
+            reference_sign(self.key, 'bob.near', 7,
+                           [transaction.create_payment_action(100)],
+                           self.block_hash),
+            transaction.sign_payment_tx(self.key, 'bob.near', 100, 7,
+                                        self.block_hash))
+        self.assertEqual(
+            reference_sign(self.key, 'contract.near', 8, [
+                transaction.create_function_call_action('foo', b'{}',
+                                                        3 * 10**14, 1)
+            ], self.block_hash),
+            transaction.sign_function_call_tx(self.key, 'contract.near', 'foo',
+                                              b'{}', 3 * 10**14, 1, 8,
+                                              self.block_hash))
+
+    def test_sign_many(self):
+        signer = transaction.get_signer(self.key)
+        txs = self.make_txs(50)
+        expected = [reference_sign(self.key, *tx) for tx in txs]
+        self.assertEqual(expected, signer.sign_many(txs))
+        with concurrent.futures.ProcessPoolExecutor(2) as executor:
+            self.assertEqual(
+                expected, signer.sign_many(txs, executor=executor,
+                                           chunk_size=7))
+
+    def test_template(self):
+        signer = transaction.get_signer(self.key)
+        actions = [transaction.create_payment_action(10**24)]
+        template = signer.template(actions, 'bob.near')
+        for nonce, receiver_id in ((1, None), (2, 'bob.near'), (3, 'b.near'),
+                                   (2**64 - 1, 'a' * 64), (5, 'ß.near')):
+            block_hash = hashlib.sha256(b'%d' % nonce).digest()
+            expected = reference_sign(self.key, receiver_id or 'bob.near',
+                                      nonce, actions, block_hash)
+            self.assertEqual(expected,
+                             template.sign(nonce, block_hash, receiver_id))
+            self.assertEqual(
+                signer.sign_and_get_hash(receiver_id or 'bob.near', nonce,
+                                         actions, block_hash),
+                template.sign_and_get_hash(nonce, block_hash, receiver_id))
+
+        txs = [(nonce, self.block_hash, f'user{nonce}.near')
+               for nonce in range(1, 20)]
+        self.assertEqual(
+            [signer.sign(tx[2], tx[0], actions, tx[1]) for tx in txs],
+            template.sign_many(txs))
+
+        # Template of a transaction with function call and empty receiver.
+        actions = [
+            transaction.create_function_call_action('ft_transfer', b'{}',
+                                                    3 * 10**14, 1)
+        ]
+        template = signer.template(actions)
+        self.assertEqual(
+            reference_sign(self.key, 'token.near', 9, actions, self.block_hash),
+            template.sign(9, self.block_hash, 'token.near'))
+
+
+if __name__ == '__main__':
+    unittest.main()
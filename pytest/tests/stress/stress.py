@@ -33,6 +33,7 @@ from multiprocessing import Process, Value, Lock
 sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / 'lib'))
 
 from cluster import init_cluster, spin_up_node, load_config
+from fork_tree import ForkTree
 from configured_logger import logger
 from transaction import sign_payment_tx, sign_staking_tx
 from proxy_instances import RejectListProxy
@@ -444,11 +445,9 @@ def monkey_staking(stopped, error, nodes, nonces):
 def blocks_tracker(stopped, error, nodes, nonces):
     # note that we do not do `white stopped.value == 0`. When the test finishes, we want
     # to wait for at least one more block to be produced
-    mapping = {}
-    height_to_hash = {}
+    tree = ForkTree(window=8)
     largest_height = 0
     largest_per_node = [0 for _ in nodes]
-    largest_divergence = 0
     last_updated = time.time()
     done = False
     every_ten = False
@@ -470,8 +469,10 @@ def blocks_tracker(stopped, error, nodes, nonces):
                     if stopped.value != 0:
                         done = True
                     if not every_ten or largest_height % 10 == 0:
-                        logging.info("BLOCK TRACKER: new height %s" %
-                                     largest_height)
+                        logging.info(
+                            "BLOCK TRACKER: new height %s, divergence %s, forks %s, orphans %s"
+                            % (largest_height, tree.max_divergence,
+                               tree.fork_count, tree.orphan_count))
                     if largest_height >= 20:
                         if not every_ten:
                             every_ten = True
@@ -484,17 +485,16 @@ def blocks_tracker(stopped, error, nodes, nonces):
                 elif time.time() - last_updated > block_timeout:
                     assert False, "Block production took more than %s seconds" % block_timeout
 
-                if hash_ not in mapping:
-                    block_info = nodes[val_id].json_rpc('block', [hash_])
+                if hash_ not in tree:
+                    block_info = nodes[val_id].get_block_by_hash(hash_)
                     confirm_height = block_info['result']['header']['height']
                     assert height == confirm_height
                     prev_hash = block_info['result']['header']['prev_hash']
-                    if height in height_to_hash:
+                    if tree.hashes_at(height):
                         assert False, "Two blocks for the same height: %s and %s" % (
-                            height_to_hash[height], hash_)
+                            tree.hashes_at(height)[0], hash_)
 
-                    height_to_hash[height] = hash_
-                    mapping[hash_] = (prev_hash, height)
+                    tree.add(hash_, prev_hash, height)
 
             except:
                 # other monkeys can tamper with all the nodes but the last one, so exceptions are possible
@@ -503,40 +503,17 @@ def blocks_tracker(stopped, error, nodes, nonces):
                     raise
         time.sleep(0.2)
 
-    for B1, (P1, H1) in [x for x in mapping.items()]:
-        for b2, (p2, h2) in [x for x in mapping.items()]:
-            b1, p1, h1 = B1, P1, H1
-            if abs(h1 - h2) < 8:
-                initial_smaller_height = min(h1, h2)
-                try:
-                    while b1 != b2:
-                        while h1 > h2:
-                            (b1, (p1, h1)) = (p1, mapping[p1])
-                        while h2 > h1:
-                            (b2, (p2, h2)) = (p2, mapping[p2])
-                        while h1 == h2 and b1 != b2:
-                            (b1, (p1, h1)) = (p1, mapping[p1])
-                            (b2, (p2, h2)) = (p2, mapping[p2])
-                    assert h1 == h2
-                    assert b1 == b2
-                    assert p1 == p2
-                    divergence = initial_smaller_height - h1
-                except KeyError as e:
-                    # some blocks were missing in the mapping, so do our best estimate
-                    divergence = initial_smaller_height - min(h1, h2)
-
-                if divergence > largest_divergence:
-                    largest_divergence = divergence
-
     logging.info("=== BLOCK TRACKER SUMMARY ===")
     logging.info("Largest height:     %s" % largest_height)
-    logging.info("Largest divergence: %s" % largest_divergence)
+    logging.info("Largest divergence: %s" % tree.max_divergence)
+    logging.info("Forks:              %s" % tree.fork_count)
+    logging.info("Orphans:            %s" % tree.orphan_count)
     logging.info("Per node: %s" % largest_per_node)
 
     if not network_issues_expected:
-        assert largest_divergence < len(nodes)
+        assert tree.max_divergence < len(nodes)
     else:
-        assert largest_divergence < 2 * len(nodes)
+        assert tree.max_divergence < 2 * len(nodes)
 
 
 def doit(s, n, N, k, monkeys, timeout):
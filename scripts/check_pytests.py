@@ -22,6 +22,7 @@ import nayduck
 # test but rather helper scripts and libraries.  The entire mocknet/ directory
 # is covered here as well since those tests are not run on NayDuck any more.
 HELPER_SCRIPTS = [
+    'benchmarks/*',
     'delete_remote_nodes.py',
     'loadtest/*',
     'mocknet/*',